@@ -7,10 +7,11 @@ from typing import Optional
 import os
 import bcrypt
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import APIKeyHeader, HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.orm import Session, make_transient_to_detached
+from database import get_db, replica_router
+from cache import LocalCache
 import models
 
 # Configuration
@@ -18,7 +19,11 @@ SECRET_KEY = os.getenv("SECRET_KEY", "biometrics-secret-key-changez-en-prod")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
 
-security = HTTPBearer()
+security = HTTPBearer(auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+# Colonnes des utilisateurs authentifiés, évincées sur événement "user" (cache.py)
+user_cache = LocalCache("users", invalidated_by=("user",))
 
 
 def hash_password(password: str) -> str:
@@ -54,15 +59,78 @@ def decode_token(token: str) -> dict:
 
 
 def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+) -> models.User:
+    """Utilisateur du Bearer token : seule authentification des routes de compte, partages et clés"""
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    return _user_from_token(credentials.credentials, db)
+
+
+def get_current_user_or_key(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    api_key: Optional[str] = Depends(api_key_header),
     db: Session = Depends(get_db)
 ) -> models.User:
-    payload = decode_token(credentials.credentials)
+    """
+    Utilisateur du Bearer token, sinon de la clé API X-API-Key (appels comptés : usage.py).
+    Réservé aux routes de données et d'ingestion : une clé ne gère ni le compte ni les clés.
+    """
+    if credentials is not None:
+        return _user_from_token(credentials.credentials, db)
+    if not api_key:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
+    from routers.apikeys import get_user_from_api_key
+    user = get_user_from_api_key(api_key, db, request)
+    db.info["user_id"] = user.id
+    return user
+
+
+def _user_from_token(token: str, db: Session) -> models.User:
+    payload = decode_token(token)
     user_id: int = payload.get("user_id")
     if user_id is None:
         raise HTTPException(status_code=401, detail="Token invalide")
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = load_user(db, user_id)
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="Utilisateur introuvable ou inactif")
+    db.info["user_id"] = user.id  # read-your-writes : voir database.ReplicaRouter
     return user
+
+
+def load_user(db: Session, user_id: int) -> Optional[models.User]:
+    """Utilisateur par id, depuis le cache si possible (rattaché à `db` sans requête)"""
+    def load():
+        user = db.query(models.User).filter(models.User.id == user_id).first()
+        return {c.key: getattr(user, c.key) for c in models.User.__table__.columns} if user else None
+
+    columns = user_cache.get_or_load(user_id, load)
+    if columns is None:
+        return None
+    user = models.User(**columns)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def get_read_db(current_user: models.User = Depends(get_current_user)):
+    """
+    Session pour les routes en lecture seule : réplique si configurée, sauf juste
+    après une écriture de l'utilisateur ou si la réplique est en retard/injoignable.
+    """
+    yield from _read_session(current_user.id)
+
+
+def get_read_db_or_key(current_user: models.User = Depends(get_current_user_or_key)):
+    """get_read_db des routes de données, accessibles aussi par clé API"""
+    yield from _read_session(current_user.id)
+
+
+def _read_session(user_id: int):
+    db = replica_router.session_for(user_id)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,224 @@
+"""
+Baselines personnelles - détection d'anomalies « pour cet utilisateur »
+
+Chaque couple (utilisateur, type) garde des statistiques glissantes :
+- moyenne / variance par l'algorithme de Welford (exact, une passe, O(1))
+- moyenne mobile exponentielle (EWMA) pour suivre la tendance récente
+
+À chaque mesure, le z-score est calculé contre la baseline *avant* mise à jour
+(une lecture par clé primaire, aucun parcours de l'historique) ; la mise à jour
+elle-même est confiée au job "measurements.recorded" (routers/measurements.py), hors
+du chemin de la requête, avec celle des agrégats journaliers.
+
+Reconstruction depuis les mesures existantes :
+    python -m baselines --rebuild [--user-id 42]
+"""
+import argparse
+import math
+import os
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+import models
+from jobs import job, skip_pending
+from sketches import merge_moments
+
+EWMA_ALPHA = float(os.getenv("BASELINE_EWMA_ALPHA", "0.1"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.0"))
+MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", "10"))  # pas de score avant
+
+# Job post-écriture des mesures (handler dans routers/measurements.py) et ses parties
+RECORDED_JOB = "measurements.recorded"
+RECORDED_PARTS = ("baselines", "daily")
+
+
+# ──────────────────────────────────────────────────────────────
+# STATISTIQUES INCRÉMENTALES
+# ──────────────────────────────────────────────────────────────
+
+def welford_update(count: int, mean: float, m2: float, value: float) -> tuple[int, float, float]:
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return count, mean, m2
+
+
+def ewma_update(ewma, value: float, alpha: float = EWMA_ALPHA, weight: int = 1) -> float:
+    """`weight` lectures égales à `value` (agrégat de compaction) en une fois"""
+    return value if ewma is None else value + (1 - alpha) ** weight * (ewma - value)
+
+
+def stddev(count: int, m2: float) -> float:
+    """Écart-type d'échantillon (n - 1)"""
+    return math.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+
+
+def anomaly_score(count: int, mean: float, m2: float, value: float) -> tuple:
+    """(z_score, is_anomaly), ou (None, None) tant que la baseline est trop courte"""
+    sd = stddev(count, m2)
+    if count < MIN_SAMPLES or sd == 0:
+        return None, None
+    z = (value - mean) / sd
+    return round(z, 2), abs(z) >= ANOMALY_Z_THRESHOLD
+
+
+# ──────────────────────────────────────────────────────────────
+# MISE À JOUR EN BASE
+# ──────────────────────────────────────────────────────────────
+
+def _locked_baseline(db: Session, user_id: int, measurement_type: str) -> models.UserBaseline:
+    """Ligne de baseline verrouillée (FOR UPDATE sur PostgreSQL), créée si absente"""
+    query = db.query(models.UserBaseline).filter(
+        models.UserBaseline.user_id == user_id,
+        models.UserBaseline.type == measurement_type
+    ).with_for_update()
+    baseline = query.first()
+    if baseline is not None:
+        return baseline
+
+    # Première mesure de ce type : insertion tolérante à une création concurrente
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(
+        insert(models.UserBaseline)
+        .values(user_id=user_id, type=measurement_type, count=0, mean=0.0, m2=0.0)
+        .on_conflict_do_nothing(index_elements=["user_id", "type"])
+    )
+    return query.first()
+
+
+def update_baselines(db: Session, user_id: int, readings: list) -> list:
+    """
+    Score puis intègre des lectures [(type, valeur), ...] d'un utilisateur.
+    Retourne [(z_score, is_anomaly), ...] dans le même ordre. Ne commit pas.
+    Une lecture de baseline par type présent, quel que soit le nombre de lectures.
+    """
+    baselines = {}
+    scores = []
+    now = datetime.utcnow()
+    for measurement_type, value in readings:
+        b = baselines.get(measurement_type)
+        if b is None:
+            b = baselines[measurement_type] = _locked_baseline(db, user_id, measurement_type)
+        scores.append(anomaly_score(b.count, b.mean, b.m2, value))
+        b.count, b.mean, b.m2 = welford_update(b.count, b.mean, b.m2, value)
+        b.ewma = ewma_update(b.ewma, value)
+        b.updated_at = now
+    return scores
+
+
+# Jobs mis en file avant "measurements.recorded" (routers/measurements.py), qui fait les deux mises à jour
+@job("baselines.update")
+def _apply_baseline_update(db: Session, payload: dict) -> None:
+    update_baselines(db, payload["user_id"], [tuple(r) for r in payload["readings"]])
+
+
+def score_readings(db: Session, user_id: int, readings: list) -> list:
+    """
+    Scores [(z_score, is_anomaly), ...] de lectures [(type, valeur), ...] contre les
+    baselines actuelles, sans verrou ni écriture. Au sein d'un lot, chaque lecture
+    est scorée comme si les précédentes avaient déjà été intégrées.
+    """
+    types = {measurement_type for measurement_type, _ in readings}
+    if not types:
+        return []
+    state = {
+        b.type: (b.count, b.mean, b.m2)
+        for b in db.query(models.UserBaseline).filter(
+            models.UserBaseline.user_id == user_id,
+            models.UserBaseline.type.in_(types)
+        )
+    }
+    scores = []
+    for measurement_type, value in readings:
+        count, mean, m2 = state.get(measurement_type, (0, 0.0, 0.0))
+        scores.append(anomaly_score(count, mean, m2, value))
+        state[measurement_type] = welford_update(count, mean, m2, value)
+    return scores
+
+
+def rebuild_baselines(db: Session, user_id: int = None, batch_size: int = 5000,
+                      commit: bool = True) -> int:
+    """
+    Recalcule les baselines depuis l'historique, en streaming trié
+    (utilisateur, type, horodatage) : une seule baseline en mémoire à la fois.
+    Les agrégats de compaction comptent pour leur nombre d'échantillons (leur
+    variance interne est inconnue : seule compte la dispersion entre intervalles).
+    Les mises à jour encore en file sont retirées, dans la même transaction :
+    leurs mesures sont déjà lues ici. Retourne le nombre de baselines écrites.
+    """
+    M = models.Measurement
+    skip_pending(db, RECORDED_JOB, "baselines", user_id)
+    skip_pending(db, "baselines.update", "baselines", user_id)
+    delete = db.query(models.UserBaseline)
+    query = db.query(M.user_id, M.type, M.value, M.sample_count)
+    if user_id is not None:
+        delete = delete.filter(models.UserBaseline.user_id == user_id)
+        query = query.filter(M.user_id == user_id)
+    delete.delete(synchronize_session=False)
+    # Les anciennes baselines encore chargées dans la session seraient en conflit d'identité
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, models.UserBaseline):
+            db.expunge(obj)
+
+    written = 0
+    pending = []
+    current_key, state = None, None
+
+    def flush_state():
+        nonlocal written
+        if current_key is None:
+            return
+        count, mean, m2, ewma = state
+        pending.append(models.UserBaseline(
+            user_id=current_key[0], type=current_key[1],
+            count=count, mean=mean, m2=m2, ewma=ewma, updated_at=datetime.utcnow()
+        ))
+        written += 1
+
+    rows = query.order_by(M.user_id, M.type, M.timestamp).execution_options(yield_per=batch_size)
+    for uid, m_type, value, sample_count in rows:
+        if (uid, m_type) != current_key:
+            flush_state()
+            current_key, state = (uid, m_type), (0, 0.0, 0.0, None)
+        count, mean, m2, ewma = state
+        weight = sample_count or 1
+        count, mean, m2 = merge_moments((count, mean, m2), (weight, value, 0.0))
+        state = (count, mean, m2, ewma_update(ewma, value, weight=weight))
+        if len(pending) >= batch_size:
+            db.add_all(pending)
+            db.flush()
+            pending.clear()
+    flush_state()
+    db.add_all(pending)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baselines personnelles BioMetrics")
+    parser.add_argument("--rebuild", action="store_true", help="Recalculer depuis les mesures existantes")
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        written = rebuild_baselines(db, args.user_id)
+    finally:
+        db.close()
+    print(f"✅ {written} baselines reconstruites")
+
+
+if __name__ == "__main__":
+    main()
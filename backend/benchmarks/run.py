@@ -0,0 +1,357 @@
+"""
+Benchmarks de charge et de débit - BioMetrics API
+
+Scénarios : submit, batch_submit, summary, history, shared_link, estimate_hrv.
+Deux modes :
+- asgi : l'application est appelée en mémoire via httpx.ASGITransport
+- live : requêtes HTTP vers un uvicorn (lancé avec --spawn, ou déjà démarré)
+
+Le temps import → prêt d'un worker (import de main + lifespan) est mesuré
+dans un sous-processus neuf (--startup-runs).
+
+Chaque exécution écrit un fichier JSON (débit + p50/p95/p99 par scénario)
+dans benchmarks/results/, comparable d'un commit à l'autre avec --compare.
+
+Usage :
+    python -m benchmarks.seed --database-url sqlite:///bench.db --reset
+    python -m benchmarks.run --database-url sqlite:///bench.db --mode asgi
+    python -m benchmarks.run --database-url sqlite:///bench.db --mode live --spawn --workers 2
+    python -m benchmarks.run ... --compare benchmarks/results/<ancien>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+SCENARIOS = ["submit", "batch_submit", "summary", "history", "shared_link", "estimate_hrv"]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ──────────────────────────────────────────────────────────────
+# STATISTIQUES
+# ──────────────────────────────────────────────────────────────
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Percentile par interpolation linéaire (valeurs déjà triées, p entre 0 et 100)"""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return float(sorted_values[0])
+    rank = (len(sorted_values) - 1) * p / 100
+    lo = int(rank)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (rank - lo)
+
+
+def summarize(latencies_ms: list, elapsed_s: float, errors: int) -> dict:
+    values = sorted(latencies_ms)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(values) / elapsed_s, 1) if elapsed_s > 0 else 0.0,
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+
+# ──────────────────────────────────────────────────────────────
+# SCÉNARIOS
+# ──────────────────────────────────────────────────────────────
+
+class Context:
+    """Utilisateurs de benchmark (JWT pré-générés) et tokens de partage"""
+
+    def __init__(self, tokens: list, share_tokens: list, seed: int = 42):
+        self.tokens = tokens
+        self.share_tokens = share_tokens
+        self.rng = random.Random(seed)
+
+    def auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.rng.choice(self.tokens)}"}
+
+
+def load_context(batch_users: int = 200) -> Context:
+    """Lit les utilisateurs de benchmark dans la base et signe leurs JWT localement"""
+    from database import SessionLocal
+    from auth_utils import create_access_token
+    from benchmarks.seed import BENCH_EMAIL_DOMAIN
+    import models
+
+    db = SessionLocal()
+    try:
+        users = db.query(models.User.id, models.User.email).filter(
+            models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")
+        ).limit(batch_users).all()
+        if not users:
+            raise SystemExit("Aucun utilisateur de benchmark : lancez d'abord `python -m benchmarks.seed`")
+        share_tokens = [
+            row.token for row in db.query(models.ShareToken.token).filter(
+                models.ShareToken.user_id.in_([u.id for u in users]),
+                models.ShareToken.is_active == True
+            )
+        ]
+    finally:
+        db.close()
+
+    tokens = [create_access_token({"user_id": u.id, "email": u.email}) for u in users]
+    return Context(tokens, share_tokens)
+
+
+async def run_request(client: httpx.AsyncClient, ctx: Context, scenario: str) -> httpx.Response:
+    rng = ctx.rng
+    if scenario == "submit":
+        return await client.post("/api/v1/measurements/submit", headers=ctx.auth(), json={
+            "type": "hr", "value": round(rng.gauss(70, 8)),
+        })
+    if scenario == "batch_submit":
+        return await client.post("/api/v1/measurements/batch", headers=ctx.auth(), json={
+            "measurements": [
+                {"type": "steps", "value": float(rng.randint(0, 150))} for _ in range(50)
+            ]
+        })
+    if scenario == "summary":
+        return await client.get("/api/v1/measurements/summary", headers=ctx.auth())
+    if scenario == "history":
+        return await client.get("/api/v1/measurements/history/hr", headers=ctx.auth(),
+                                params={"limit": 500})
+    if scenario == "shared_link":
+        return await client.get(f"/api/v1/users/shared/{rng.choice(ctx.share_tokens)}")
+    if scenario == "estimate_hrv":
+        return await client.post("/api/v1/estimate/hrv", headers=ctx.auth(), json={
+            "hr_samples": [round(rng.gauss(72, 4)) for _ in range(30)],
+        })
+    raise ValueError(f"Scénario inconnu : {scenario}")
+
+
+async def run_scenario(client: httpx.AsyncClient, ctx: Context, scenario: str,
+                       requests: int, concurrency: int, warmup: int = 10) -> dict:
+    for _ in range(warmup):
+        await run_request(client, ctx, scenario)
+
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                res = await run_request(client, ctx, scenario)
+                if res.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+# ──────────────────────────────────────────────────────────────
+# MODES D'EXÉCUTION
+# ──────────────────────────────────────────────────────────────
+
+async def run_all(client: httpx.AsyncClient, ctx: Context, scenarios: list,
+                  requests: int, concurrency: int) -> dict:
+    results = {}
+    for scenario in scenarios:
+        if scenario == "shared_link" and not ctx.share_tokens:
+            print(f"  ⏭️  {scenario} : aucun token de partage, ignoré")
+            continue
+        stats = await run_scenario(client, ctx, scenario, requests, concurrency)
+        results[scenario] = stats
+        print(f"  {scenario:<14} {stats['throughput_rps']:>8} req/s   "
+              f"p50 {stats['p50_ms']:>7} ms   p95 {stats['p95_ms']:>7} ms   "
+              f"p99 {stats['p99_ms']:>7} ms   erreurs {stats['errors']}")
+    return results
+
+
+async def run_asgi(ctx: Context, scenarios: list, requests: int, concurrency: int) -> dict:
+    from main import app
+
+    # ASGITransport n'émet pas les événements lifespan : on les déclenche nous-mêmes
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run_all(client, ctx, scenarios, requests, concurrency)
+
+
+async def run_live(ctx: Context, base_url: str, scenarios: list, requests: int, concurrency: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        return await run_all(client, ctx, scenarios, requests, concurrency)
+
+
+def spawn_uvicorn(port: int, workers: int) -> subprocess.Popen:
+    """Démarre uvicorn dans un sous-processus et attend /health"""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("uvicorn n'a pas démarré en 30s")
+
+
+_STARTUP_SCRIPT = """
+import asyncio, main
+async def go():
+    async with main.app.router.lifespan_context(main.app):
+        print(main.app.state.startup_ms)
+asyncio.run(go())
+"""
+
+
+def measure_startup(runs: int) -> dict:
+    """Temps import → prêt (ms) d'un worker neuf, sur `runs` sous-processus"""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.check_output(
+            [sys.executable, "-c", _STARTUP_SCRIPT], cwd=BACKEND_DIR, env=os.environ.copy(),
+            stderr=subprocess.DEVNULL,
+        )
+        samples.append(float(out.decode().strip().splitlines()[-1]))
+    samples.sort()
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(samples, 50), 1),
+        "min_ms": samples[0],
+        "max_ms": samples[-1],
+    }
+
+
+# ──────────────────────────────────────────────────────────────
+# RÉSULTATS
+# ──────────────────────────────────────────────────────────────
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(meta: dict, results: dict, output_dir: str) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(output_dir, f"{stamp}_{meta['commit']}_{meta['mode']}.json")
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "scenarios": results}, f, indent=2)
+    return path
+
+
+def compare(previous_path: str, results: dict) -> None:
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\n📊 Comparaison avec {previous['meta'].get('commit')} ({previous_path})")
+    for scenario, stats in results.items():
+        old = previous["scenarios"].get(scenario)
+        if not old:
+            continue
+        parts = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if old[key]:
+                delta = (stats[key] - old[key]) / old[key] * 100
+                parts.append(f"{key} {delta:+.1f}%")
+        print(f"  {scenario:<14} " + "   ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks BioMetrics API")
+    parser.add_argument("--database-url", default=None, help="Remplace DATABASE_URL (même base que le seed)")
+    parser.add_argument("--mode", choices=["asgi", "live"], default="asgi")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Mode live sans --spawn")
+    parser.add_argument("--spawn", action="store_true", help="Mode live : lancer uvicorn localement")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="Requêtes mesurées par scénario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--startup-runs", type=int, default=3, help="0 pour ne pas mesurer le démarrage")
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--compare", default=None, help="Fichier JSON d'une exécution précédente")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, BACKEND_DIR)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Scénarios inconnus : {', '.join(sorted(unknown))}")
+
+    ctx = load_context()
+
+    startup = None
+    if args.startup_runs > 0:
+        startup = measure_startup(args.startup_runs)
+        print(f"\n🚀 Démarrage worker (import → prêt) : p50 {startup['p50_ms']} ms "
+              f"(min {startup['min_ms']}, max {startup['max_ms']})")
+    print(f"\n🏁 Benchmarks BioMetrics ({args.mode}) — {args.requests} requêtes × "
+          f"{len(scenarios)} scénarios, concurrence {args.concurrency}\n")
+
+    proc = None
+    try:
+        if args.mode == "asgi":
+            results = asyncio.run(run_asgi(ctx, scenarios, args.requests, args.concurrency))
+            target = "asgi"
+        else:
+            base_url = args.base_url
+            if args.spawn:
+                proc = spawn_uvicorn(args.port, args.workers)
+                base_url = f"http://127.0.0.1:{args.port}"
+            results = asyncio.run(run_live(ctx, base_url, scenarios, args.requests, args.concurrency))
+            target = base_url
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    from database import engine
+    meta = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "mode": args.mode,
+        "target": target,
+        "workers": args.workers if args.mode == "live" else None,
+        "database": engine.url.get_backend_name(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "python": platform.python_version(),
+        "startup": startup,
+    }
+    path = save_results(meta, results, args.output)
+    print(f"\n💾 Résultats : {path}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Générateur de données synthétiques pour les benchmarks
+
+Remplit une base (SQLite en local, PostgreSQL si disponible) avec
+N utilisateurs × M mesures réalistes par type, plus un lien de partage
+actif par utilisateur.
+
+Usage :
+    python -m benchmarks.seed --users 50 --per-type 500
+    python -m benchmarks.seed --database-url sqlite:///bench.db --reset
+"""
+import argparse
+import os
+import random
+import secrets
+import time
+from datetime import datetime, timedelta
+
+BENCH_EMAIL_DOMAIN = "bench.local"
+BENCH_PASSWORD = "BenchPassword123"
+INSERT_BATCH_SIZE = 5000
+
+TYPES = ["temperature", "hr", "steps", "hrv", "respiration", "activity"]
+
+# Copie locale pour ne pas importer le router (et FastAPI) depuis le générateur
+_UNITS = {
+    "temperature": "°C",
+    "hr": "bpm",
+    "steps": "pas",
+    "hrv": "ms",
+    "respiration": "resp/min",
+    "activity": "kcal"
+}
+
+
+def _profile(rng: random.Random) -> dict:
+    """Valeurs de base propres à un utilisateur (chacun a sa « norme »)"""
+    return {
+        "temperature": rng.gauss(36.7, 0.2),
+        "hr": rng.gauss(68, 7),
+        "steps": rng.uniform(40, 120),
+        "hrv": rng.gauss(45, 12),
+        "respiration": rng.gauss(15, 1.5),
+        "activity": rng.uniform(60, 200),
+    }
+
+
+def synthetic_value(rng: random.Random, measurement_type: str, base: float, ts: datetime) -> tuple[float, float]:
+    """Retourne (valeur, confiance) plausibles pour un type et un instant donnés"""
+    # Variation circadienne : FC/température plus basses la nuit
+    night = 1.0 if ts.hour < 6 else 0.0
+
+    if measurement_type == "temperature":
+        value = max(35.0, min(40.0, rng.gauss(base - 0.3 * night, 0.25)))
+        return round(value, 1), round(rng.uniform(0.5, 0.9), 2)
+    if measurement_type == "hr":
+        value = max(40.0, min(190.0, rng.gauss(base - 8 * night, 6)))
+        return round(value), round(rng.uniform(0.6, 0.95), 2)
+    if measurement_type == "steps":
+        value = 0 if night else max(0.0, rng.gauss(base, base / 2))
+        return float(int(value)), None
+    if measurement_type == "hrv":
+        value = max(10.0, min(150.0, rng.gauss(base + 10 * night, 8)))
+        return round(value, 1), round(rng.uniform(0.5, 0.9), 2)
+    if measurement_type == "respiration":
+        value = max(6.0, min(40.0, rng.gauss(base - night, 1.5)))
+        return round(value), round(rng.uniform(0.4, 0.85), 2)
+    # activity
+    value = max(0.0, rng.gauss(base, base / 3))
+    return round(value), None
+
+
+def bench_email(i: int) -> str:
+    return f"bench-user-{i}@{BENCH_EMAIL_DOMAIN}"
+
+
+def reset_bench_data(db) -> None:
+    """Supprime uniquement les utilisateurs de benchmark et leurs données"""
+    import models
+
+    ids = [
+        row.id for row in db.query(models.User.id).filter(
+            models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")
+        )
+    ]
+    if not ids:
+        return
+    # Tables filles d'abord (clés étrangères sans ON DELETE CASCADE), comme DELETE /auth/me
+    key_ids = db.query(models.ApiKey.id).filter(models.ApiKey.user_id.in_(ids)).scalar_subquery()
+    db.query(models.ApiKeyUsage).filter(models.ApiKeyUsage.api_key_id.in_(key_ids)).delete(synchronize_session=False)
+    for model in (models.ApiKey, models.ImportJob, models.TemperatureCalibration, models.DailyAggregate,
+                  models.UserBaseline, models.MeasurementTombstone, models.Measurement, models.ShareToken):
+        db.query(model).filter(model.user_id.in_(ids)).delete(synchronize_session=False)
+    db.query(models.User).filter(models.User.id.in_(ids)).delete(synchronize_session=False)
+    db.commit()
+
+
+def seed(db, users: int, per_type: int, days: int = 30, seed_value: int = 42) -> dict:
+    """
+    Insère `users` utilisateurs et `per_type` mesures par type et par utilisateur,
+    réparties sur les `days` derniers jours. Retourne un petit résumé.
+    """
+    from sqlalchemy import insert
+    import models
+    from auth_utils import hash_password
+
+    rng = random.Random(seed_value)
+    hashed = hash_password(BENCH_PASSWORD)  # bcrypt une seule fois, partagé
+    now = datetime.utcnow()
+
+    existing = db.query(models.User).filter(
+        models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")
+    ).count()
+
+    user_rows = [
+        {
+            "email": bench_email(existing + i),
+            "name": f"Bench User {existing + i}",
+            "hashed_password": hashed,
+            "is_active": True,
+            "created_at": now - timedelta(days=days),
+            "consent_given": True,
+        }
+        for i in range(users)
+    ]
+    db.execute(insert(models.User), user_rows)
+    db.commit()
+
+    user_ids = [
+        row.id for row in db.query(models.User.id).filter(
+            models.User.email.in_([u["email"] for u in user_rows])
+        )
+    ]
+
+    db.execute(insert(models.ShareToken), [
+        {
+            "user_id": uid,
+            "token": secrets.token_urlsafe(32),
+            "expires_at": now + timedelta(days=days),
+            "is_active": True,
+            "created_at": now,
+        }
+        for uid in user_ids
+    ])
+    db.commit()
+
+    step = timedelta(days=days) / max(per_type, 1)
+    batch = []
+    total = 0
+    for uid in user_ids:
+        profile = _profile(rng)
+        for t in TYPES:
+            for k in range(per_type):
+                ts = now - step * (per_type - k) + timedelta(seconds=rng.uniform(0, 60))
+                value, confidence = synthetic_value(rng, t, profile[t], ts)
+                batch.append({
+                    "user_id": uid,
+                    "type": t,
+                    "value": value,
+                    "unit": _UNITS[t],
+                    "confidence": confidence,
+                    "timestamp": ts,
+                })
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    db.execute(insert(models.Measurement), batch)
+                    db.commit()
+                    total += len(batch)
+                    batch = []
+    if batch:
+        db.execute(insert(models.Measurement), batch)
+        db.commit()
+        total += len(batch)
+
+    return {"users": len(user_ids), "measurements": total, "days": days}
+
+
+def run_migrations() -> None:
+    """Applique les migrations Alembic sur DATABASE_URL (équivalent `alembic upgrade head`)"""
+    from alembic import command
+    from alembic.config import Config
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cfg = Config(os.path.join(backend_dir, "alembic.ini"))
+    cfg.set_main_option("script_location", os.path.join(backend_dir, "migrations"))
+    command.upgrade(cfg, "head")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Générateur de données BioMetrics pour benchmarks")
+    parser.add_argument("--database-url", default=None, help="Remplace DATABASE_URL (ex: sqlite:///bench.db)")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--per-type", type=int, default=500, help="Mesures par type et par utilisateur")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Supprimer d'abord les données de benchmark existantes")
+    args = parser.parse_args()
+
+    # DATABASE_URL doit être fixé avant l'import de database.py
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    from database import SessionLocal, engine
+
+    run_migrations()
+
+    db = SessionLocal()
+    try:
+        if args.reset:
+            reset_bench_data(db)
+        started = time.perf_counter()
+        result = seed(db, args.users, args.per_type, args.days, args.seed)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+
+    print(f"✅ {result['users']} utilisateurs, {result['measurements']} mesures "
+          f"sur {result['days']} jours en {elapsed:.1f}s ({engine.url.get_backend_name()})")
+
+
+if __name__ == "__main__":
+    main()
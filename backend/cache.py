@@ -0,0 +1,322 @@
+"""
+Caches locaux par processus + bus d'invalidation inter-workers (PostgreSQL LISTEN/NOTIFY)
+
+Chaque worker garde ses caches en mémoire (LocalCache : LRU + TTL). Un écrivain
+publie un événement typé dans SA transaction :
+
+    publish(db, "user_measurements", user.id)     # ne commit pas
+
+- localement, les entrées concernées sont évincées juste après le commit ;
+- sur PostgreSQL, `pg_notify` part avec la transaction (rien si rollback) et
+  le thread d'écoute de chaque autre worker évince à son tour ses entrées.
+
+Sans bus (SQLite, connexion d'écoute perdue), les caches passent en mode TTL
+seul, avec un TTL court (CACHE_FALLBACK_TTL) : la péremption entre workers
+reste bornée. À chaque (re)connexion du bus, tous les caches sont vidés
+(événements manqués pendant la coupure).
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from database import DB_CONNECT_TIMEOUT, READ_DATABASE_URL, READ_YOUR_WRITES_SECONDS, replica_router
+from singleflight import SingleFlight
+
+logger = logging.getLogger("biometrics.cache")
+
+EVENT_KINDS = ("user", "api_key", "share_token", "user_measurements", "calibration", "population")
+CHANNEL = "biometrics_invalidation"
+# Identifie les notifications de ce processus (déjà appliquées au commit)
+WORKER_ID = uuid.uuid4().hex[:12]
+
+CACHE_BUS_ENABLED = os.getenv("CACHE_BUS_ENABLED", "1") == "1"
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))                  # secondes, bus connecté
+CACHE_FALLBACK_TTL = float(os.getenv("CACHE_FALLBACK_TTL", "5"))  # secondes, TTL seul
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+# Avec une réplique, une relecture juste après une invalidation peut être en
+# retard : les entrées concernées ne sont pas remises en cache pendant ce délai
+CACHE_SETTLE_SECONDS = READ_YOUR_WRITES_SECONDS if READ_DATABASE_URL else 0.0
+_BUS_PING_SECONDS = 30
+_BUS_MAX_BACKOFF_SECONDS = 30
+
+
+class LocalCache:
+    """
+    LRU borné clé → valeur (jamais None), avec étiquettes d'invalidation.
+
+    Une entrée porte des étiquettes (type d'événement, identifiant) ; par défaut
+    `(kind, clé)` pour chaque type de `invalidated_by`. Un événement évince
+    toutes les entrées qui portent son étiquette. `tag_kinds` : types des
+    étiquettes passées explicitement (`tags=`) ; les événements d'autres types
+    sont ignorés sans rien coûter aux chargements en cours.
+    """
+
+    def __init__(self, name: str, invalidated_by: tuple = (), max_entries: int = CACHE_MAX_ENTRIES,
+                 ttl: float = CACHE_TTL, fallback_ttl: float = CACHE_FALLBACK_TTL, bus=None,
+                 tag_kinds: tuple = ()):
+        self.name = name
+        self.invalidated_by = invalidated_by
+        self.kinds = frozenset(invalidated_by) | frozenset(tag_kinds)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.bus = bus or invalidation_bus
+        self._entries = OrderedDict()   # clé → (instant, valeur, étiquettes)
+        self._tags = {}                 # étiquette → {clés}
+        self._sequence = 0              # numéro de la dernière invalidation
+        self._invalidations = {}        # étiquette → (numéro, instant) de sa dernière invalidation
+        self._forgotten_through = 0     # numéros oubliés (élagage, clear) : refus prudent
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()  # chargements en cours, partagés par les appels simultanés
+        self.bus.register(self)
+
+    @property
+    def effective_ttl(self) -> float:
+        return self.ttl if self.bus.connected else min(self.ttl, self.fallback_ttl)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.effective_ttl:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags: tuple = None, generation: int = None) -> bool:
+        """
+        Met en cache. Refusé (False) si une de ses étiquettes a été invalidée après
+        `generation` (numéro d'invalidation lu avant le chargement : valeur périmée)
+        ou vient de l'être. Les invalidations d'autres étiquettes n'y font rien.
+        """
+        tags = tuple(tags) if tags is not None else tuple((kind, key) for kind in self.invalidated_by)
+        now = time.monotonic()
+        with self._lock:
+            invalidations = [self._invalidations[tag] for tag in tags if tag in self._invalidations]
+            if generation is not None and (
+                generation < self._forgotten_through or any(n > generation for n, _ in invalidations)
+            ):
+                return False
+            if CACHE_SETTLE_SECONDS and any(now - at < CACHE_SETTLE_SECONDS for _, at in invalidations):
+                return False
+            if not self.kinds.issuperset(kind for kind, _ in tags):
+                raise ValueError(f"Cache {self.name} : étiquette d'un type non déclaré dans {tags}")
+            self._remove(key)
+            self._entries[key] = (now, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def get_or_load(self, key, loader, tags=None, timeout: float = None):
+        """
+        Valeur en cache, sinon `loader()` (mise en cache si non None), exécuté une
+        seule fois pour les appels simultanés sur la même clé (singleflight.py) :
+        les autres attendent au plus `timeout` secondes.
+        `tags` peut être une fonction de la valeur chargée.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def load():
+            cached = self.get(key)   # mis en cache par un vol terminé entre-temps
+            if cached is not None:
+                return cached
+            generation = self._sequence
+            loaded = loader()
+            if loaded is not None:
+                self.set(key, loaded, tags(loaded) if callable(tags) else tags, generation)
+            return loaded
+        return self._flights.do(key, load, timeout)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_tag(self, kind: str, key, session: Session = None) -> None:
+        if kind not in self.kinds:
+            return
+        tag = (kind, key)
+        now = time.monotonic()
+        with self._lock:
+            self._sequence += 1
+            # Vols concernés : ceux des entrées étiquetées, et la clé elle-même pour les
+            # étiquettes par défaut (les autres sont refusés à la mise en cache, ci-dessus)
+            stale = set(self._tags.get(tag, ()))
+            if kind in self.invalidated_by:
+                stale.add(key)
+            for cached_key in stale:
+                self._remove(cached_key)
+                self._flights.forget(cached_key)
+            self._invalidations.pop(tag, None)   # réinsérée en dernier : dict trié par numéro
+            self._invalidations[tag] = (self._sequence, now)
+            if len(self._invalidations) > self.max_entries:
+                # Élaguer les plus anciennes ; un chargement commencé avant elles sera refusé
+                for _ in range(len(self._invalidations) - self.max_entries // 2):
+                    self._forgotten_through = self._invalidations.pop(next(iter(self._invalidations)))[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sequence += 1
+            self._forgotten_through = self._sequence
+            self._invalidations.clear()
+            self._flights.forget_all()
+            self._entries.clear()
+            self._tags.clear()
+
+    def _remove(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class InvalidationBus:
+    """
+    Diffusion des invalidations aux caches du processus, et réception de
+    celles des autres workers via une connexion PostgreSQL dédiée (LISTEN),
+    tenue par un thread avec reconnexion (backoff exponentiel).
+    """
+
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        self.connected = False
+        self._caches = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def register(self, cache) -> None:
+        """Abonne un cache : méthodes invalidate_tag(kind, key, session) et clear()"""
+        self._caches.append(cache)
+
+    def dispatch(self, kind: str, key, session: Session = None) -> None:
+        """`session` : transaction locale qui vient d'être validée (None : autre worker)"""
+        for cache in self._caches:
+            cache.invalidate_tag(kind, key, session)
+
+    def clear_all(self) -> None:
+        for cache in self._caches:
+            cache.clear()
+
+    def receive(self, payload: str) -> None:
+        """Événement d'un autre worker (ceux de ce processus sont déjà appliqués au commit)"""
+        try:
+            kind, key, *origin = json.loads(payload)
+        except (ValueError, TypeError):
+            logger.warning("Invalidation illisible ignorée : %r", payload)
+            return
+        if origin == [WORKER_ID]:
+            return
+        self.dispatch(kind, key)
+        if kind == "user_measurements":
+            # Read-your-writes étendu aux autres workers : prochaines lectures sur le primaire
+            replica_router.mark_write(key)
+
+    # ── Écoute ──────────────────────────────────────────────────
+
+    def start(self, database_url: str) -> None:
+        if self._thread is not None:
+            return
+        dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, args=(dsn,), name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+        self.connected = False
+
+    def _listen(self, dsn: str) -> None:
+        import psycopg2
+        import psycopg2.extensions
+
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(dsn, connect_timeout=DB_CONNECT_TIMEOUT)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {self.channel}")
+                self.clear_all()
+                self.connected = True
+                backoff = 1.0
+                logger.info("Bus d'invalidation connecté (canal %s)", self.channel)
+                last_ping = time.monotonic()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        # Détecte une connexion morte sans trafic
+                        if time.monotonic() - last_ping > _BUS_PING_SECONDS:
+                            cursor.execute("SELECT 1")
+                            last_ping = time.monotonic()
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.receive(conn.notifies.pop(0).payload)
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning("Bus d'invalidation indisponible (TTL seul), nouvel essai dans %.0f s : %r",
+                                   backoff, e)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, _BUS_MAX_BACKOFF_SECONDS)
+
+
+invalidation_bus = InvalidationBus()
+
+
+def publish(db: Session, kind: str, key) -> None:
+    """
+    Invalide `(kind, key)` dans tous les workers au commit de `db` (ne commit pas).
+    Aucun effet si la transaction est annulée.
+    """
+    if kind not in EVENT_KINDS:
+        raise ValueError(f"Type d'invalidation inconnu : {kind}")
+    pending = db.info.setdefault("invalidations", [])
+    if (kind, key) in pending:
+        return
+    pending.append((kind, key))
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                   {"channel": CHANNEL, "payload": json.dumps([kind, key, WORKER_ID])})
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidations(session):
+    for kind, key in session.info.pop("invalidations", ()):
+        invalidation_bus.dispatch(kind, key, session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_invalidations(session):
+    session.info.pop("invalidations", None)
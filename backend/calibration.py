@@ -0,0 +1,159 @@
+"""
+Calibration de température par utilisateur / appareil
+
+Le modèle de estimate_body_temperature est linéaire en ses coefficients :
+    T_corps = θ · x     avec x = (ΔT, T_batterie, log(t), 1)
+
+Chaque mesure de référence (thermomètre) met θ à jour par moindres carrés
+récursifs (RLS, avec facteur d'oubli) : O(1) par mise à jour, sans relire
+l'historique. Point de départ : les coefficients FeverPhone par défaut.
+
+Stockage compact : θ (4) + triangle supérieur de P (10) en float64 packés,
+113 octets par (utilisateur, appareil). Les coefficients actifs sont gardés
+en cache (cache.py) : une estimation ne touche la base qu'au premier appel.
+"""
+import math
+import os
+import struct
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+import models
+from cache import LocalCache
+
+# α (ΔT), β (T° batterie), γ (log du temps de contact), δ (offset) — FeverPhone simplifié
+DEFAULT_COEFFICIENTS = (1.15, 0.52, 0.65, 8.4)
+
+FORGETTING_FACTOR = float(os.getenv("CALIBRATION_FORGETTING_FACTOR", "0.99"))
+PRIOR_VARIANCE = float(os.getenv("CALIBRATION_PRIOR_VARIANCE", "0.1"))
+CACHE_SIZE = int(os.getenv("CALIBRATION_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CALIBRATION_CACHE_TTL", "300"))  # secondes
+
+_N = len(DEFAULT_COEFFICIENTS)
+_FORMAT_VERSION = 1
+_PACK = struct.Struct(f"<B{_N + _N * (_N + 1) // 2}d")
+_MAX_TRACE = PRIOR_VARIANCE * _N * 100  # anti-emballement de P sans excitation
+
+
+def features(battery_temp: float, contact_time: int, ambient_temp: float) -> tuple:
+    return (battery_temp - ambient_temp, battery_temp, math.log(max(contact_time, 1)), 1.0)
+
+
+def predict(theta, x) -> float:
+    return sum(t * v for t, v in zip(theta, x))
+
+
+# ──────────────────────────────────────────────────────────────
+# MOINDRES CARRÉS RÉCURSIFS
+# ──────────────────────────────────────────────────────────────
+
+def initial_covariance(variance: float = PRIOR_VARIANCE) -> list:
+    return [[variance if i == j else 0.0 for j in range(_N)] for i in range(_N)]
+
+
+def rls_update(theta, P, x, y: float, forgetting: float = FORGETTING_FACTOR) -> tuple[list, list]:
+    """Une étape RLS : retourne (θ, P) mis à jour pour l'observation (x, y)"""
+    Px = [sum(P[i][j] * x[j] for j in range(_N)) for i in range(_N)]
+    denom = forgetting + sum(x[i] * Px[i] for i in range(_N))
+    gain = [v / denom for v in Px]
+    error = y - predict(theta, x)
+    theta = [t + k * error for t, k in zip(theta, gain)]
+
+    # P ← (P − k·xᵀP) / λ ; P symétrique donc xᵀP = Pxᵀ
+    scale = 1 / forgetting if sum(P[i][i] for i in range(_N)) < _MAX_TRACE else 1.0
+    P = [[(P[i][j] - gain[i] * Px[j]) * scale for j in range(_N)] for i in range(_N)]
+    # Symétrisation contre la dérive numérique
+    P = [[(P[i][j] + P[j][i]) / 2 for j in range(_N)] for i in range(_N)]
+    return theta, P
+
+
+def pack_params(theta, P) -> bytes:
+    upper = [P[i][j] for i in range(_N) for j in range(i, _N)]
+    return _PACK.pack(_FORMAT_VERSION, *theta, *upper)
+
+
+def unpack_params(blob: bytes) -> tuple[list, list]:
+    version, *values = _PACK.unpack(blob)
+    if version != _FORMAT_VERSION:
+        raise ValueError(f"Format de calibration inconnu : v{version}")
+    theta, upper = list(values[:_N]), values[_N:]
+    P = [[0.0] * _N for _ in range(_N)]
+    it = iter(upper)
+    for i in range(_N):
+        for j in range(i, _N):
+            P[i][j] = P[j][i] = next(it)
+    return theta, P
+
+
+# ──────────────────────────────────────────────────────────────
+# CACHE DES COEFFICIENTS ACTIFS
+# ──────────────────────────────────────────────────────────────
+
+# user_id → {device_id: θ} (dict vide = pas de calibration), évincé sur événement "calibration"
+calibration_cache = LocalCache("calibration", invalidated_by=("user", "calibration"),
+                               max_entries=CACHE_SIZE, ttl=CACHE_TTL)
+
+
+def active_coefficients(db: Session, user_id: int, device_id: str = None) -> tuple:
+    """θ de l'appareil, sinon celui de l'utilisateur (tous appareils), sinon les coefficients par défaut"""
+    def load():
+        rows = db.query(models.TemperatureCalibration.device_id, models.TemperatureCalibration.params).filter(
+            models.TemperatureCalibration.user_id == user_id
+        ).all()
+        return {dev: tuple(unpack_params(params)[0]) for dev, params in rows}
+
+    per_device = calibration_cache.get_or_load(user_id, load)
+    return per_device.get(device_id or "") or per_device.get("") or DEFAULT_COEFFICIENTS
+
+
+# ──────────────────────────────────────────────────────────────
+# MISE À JOUR EN BASE
+# ──────────────────────────────────────────────────────────────
+
+def _locked_calibration(db: Session, user_id: int, device_id: str) -> models.TemperatureCalibration:
+    """Ligne de calibration verrouillée (FOR UPDATE sur PostgreSQL), créée si absente"""
+    query = db.query(models.TemperatureCalibration).filter(
+        models.TemperatureCalibration.user_id == user_id,
+        models.TemperatureCalibration.device_id == device_id
+    ).with_for_update()
+    calibration = query.first()
+    if calibration is not None:
+        return calibration
+
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(
+        insert(models.TemperatureCalibration)
+        .values(
+            user_id=user_id, device_id=device_id, samples=0,
+            params=pack_params(DEFAULT_COEFFICIENTS, initial_covariance()),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "device_id"])
+    )
+    return query.first()
+
+
+def calibrate(db: Session, user_id: int, device_id: str, x: tuple, reference_temp: float) -> tuple:
+    """
+    Intègre une mesure de référence. Retourne (calibration, prédiction avant, prédiction après).
+    Ne commit pas : publier l'invalidation "calibration" de l'utilisateur.
+    """
+    calibration = _locked_calibration(db, user_id, device_id or "")
+    theta, P = unpack_params(calibration.params)
+    before = predict(theta, x)
+    theta, P = rls_update(theta, P, x, reference_temp)
+    calibration.params = pack_params(theta, P)
+    calibration.samples += 1
+    calibration.updated_at = datetime.utcnow()
+    return calibration, before, predict(theta, x)
+
+
+def reset_calibration(db: Session, user_id: int, device_id: str = None) -> int:
+    """Supprime la calibration d'un appareil (ou de tous si device_id est None). Ne commit pas."""
+    query = db.query(models.TemperatureCalibration).filter(models.TemperatureCalibration.user_id == user_id)
+    if device_id is not None:
+        query = query.filter(models.TemperatureCalibration.device_id == device_id)
+    return query.delete(synchronize_session=False)
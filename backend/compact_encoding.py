@@ -0,0 +1,110 @@
+"""
+Encodages compacts des séries de mesures, négociés via l'en-tête Accept
+
+- application/json (défaut)                     : liste d'objets, inchangé
+- application/vnd.biometrics.columnar+json      : JSON colonnaire delta-encodé
+- application/msgpack (ou x-msgpack)            : même structure colonnaire en MessagePack
+                                                  (si le paquet `msgpack` est installé)
+
+Format colonnaire (une colonne par champ) :
+    {"format": "columnar-delta-v1", "count": 3, "columns": {
+        "timestamp": {"base": 1760000000000, "delta": [0, 60000, 60000]},   # epoch ms
+        "id":        {"base": 1201, "delta": [0, 1, 1]},
+        "value":     [72.0, 74.0, 71.0],
+        "unit":      {"const": "bpm"}}}
+Décodage : valeur[i] = base + somme(delta[0..i]) ; `const` = même valeur partout.
+Les clés et horodatages ISO ne sont plus répétés à chaque ligne.
+"""
+import json
+from datetime import datetime, timezone
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import msgpack
+except ImportError:  # dépendance optionnelle
+    msgpack = None
+
+COLUMNAR_JSON = "application/vnd.biometrics.columnar+json"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+FORMAT_NAME = "columnar-delta-v1"
+
+# Colonnes encodées en deltas successifs (entiers croissants)
+_DELTA_COLUMNS = ("timestamp", "id")
+
+
+def _epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # la base stocke de l'UTC naïf
+    return int(value.timestamp() * 1000)
+
+
+def _as_dict(record) -> dict:
+    if isinstance(record, dict):
+        return record
+    if hasattr(record, "model_dump"):
+        return record.model_dump()
+    raise TypeError(f"Enregistrement non encodable : {type(record).__name__}")
+
+
+def encode_columnar(records: list) -> dict:
+    """Liste d'objets (dicts ou modèles Pydantic) → structure colonnaire delta-encodée"""
+    rows = [_as_dict(r) for r in records]
+    columns = {}
+    if rows:
+        for key in rows[0]:
+            values = [row.get(key) for row in rows]
+            if key in _DELTA_COLUMNS and all(v is not None for v in values):
+                ints = [_epoch_ms(v) if isinstance(v, datetime) else int(v) for v in values]
+                columns[key] = {
+                    "base": ints[0],
+                    "delta": [0] + [b - a for a, b in zip(ints, ints[1:])],
+                }
+            elif all(v == values[0] for v in values):
+                columns[key] = {"const": values[0]}
+            else:
+                columns[key] = values
+    return {"format": FORMAT_NAME, "count": len(rows), "columns": jsonable_encoder(columns)}
+
+
+def preferred_format(request: Request) -> str:
+    """'msgpack', 'columnar' ou 'json' selon l'en-tête Accept"""
+    accept = request.headers.get("accept", "")
+    if msgpack is not None and any(t in accept for t in MSGPACK_TYPES):
+        return "msgpack"
+    if COLUMNAR_JSON in accept:
+        return "columnar"
+    return "json"
+
+
+def negotiated_response(request: Request, payload, series_keys: tuple = ()):
+    """
+    Réponse au format demandé par le client.
+
+    `payload` est soit une liste d'enregistrements, soit un dict dont les clés
+    `series_keys` contiennent des listes (ou des dicts type → liste) à encoder
+    en colonnes ; le reste du dict est conservé tel quel.
+    """
+    fmt = preferred_format(request)
+    headers = {"Vary": "Accept"}
+    if fmt == "json":
+        return JSONResponse(jsonable_encoder(payload), headers=headers)
+
+    if isinstance(payload, list):
+        body = encode_columnar(payload)
+    else:
+        body = jsonable_encoder({k: v for k, v in payload.items() if k not in series_keys})
+        for key in series_keys:
+            value = payload[key]
+            if isinstance(value, dict):
+                body[key] = {name: encode_columnar(items) for name, items in value.items()}
+            else:
+                body[key] = encode_columnar(value)
+
+    if fmt == "msgpack":
+        return Response(msgpack.packb(body, use_bin_type=True),
+                        media_type="application/msgpack", headers=headers)
+    return Response(json.dumps(body, separators=(",", ":"), ensure_ascii=False),
+                    media_type=COLUMNAR_JSON, headers=headers)
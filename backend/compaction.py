@@ -0,0 +1,237 @@
+"""
+Compaction des anciennes mesures en séries sous-échantillonnées
+
+Au-delà d'un âge donné (par type), les mesures brutes d'un intervalle sont
+remplacées par UNE ligne d'agrégat (moyenne, min, max, nombre d'échantillons) :
+- par heure après 90 jours, par jour après 365 jours (par défaut).
+La taille d'un compte croît alors avec le nombre d'utilisateurs, pas avec son ancienneté.
+
+Traitement par tranches (un utilisateur, un type, COMPACTION_CHUNK_BUCKETS intervalles)
+dans une transaction chacune : interruptible et reprenable, l'état est dans les
+données. Une mesure tardive dans un intervalle déjà compacté est fusionnée à
+l'agrégat existant au passage suivant.
+
+Planifiée via l'outbox (jobs.py) ; exécution manuelle :
+    python -m compaction [--dry-run]
+
+Politique par type (jours) via COMPACTION_POLICY, ex :
+    COMPACTION_POLICY='{"steps": {"hour": 30, "day": 180}}'
+"""
+import argparse
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import get_args
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from jobs import enqueue, job
+
+LEVELS = ("hour", "day")                  # du plus fin au plus grossier
+BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+DEFAULT_POLICY = {"hour": 90, "day": 365}  # âge minimal (jours) avant compaction
+TYPE_POLICIES = json.loads(os.getenv("COMPACTION_POLICY", "{}"))
+
+COMPACTION_ENABLED = os.getenv("COMPACTION_ENABLED", "1") == "1"
+COMPACTION_CHUNK_BUCKETS = int(os.getenv("COMPACTION_CHUNK_BUCKETS", "168"))
+COMPACTION_CHUNKS_PER_JOB = int(os.getenv("COMPACTION_CHUNKS_PER_JOB", "50"))
+COMPACTION_INTERVAL_SECONDS = int(os.getenv("COMPACTION_INTERVAL_SECONDS", str(6 * 3600)))
+COMPACTION_JOB_KEY = "measurements.compact"
+
+_DELETE_CHUNK = 500
+
+
+def policy_for(measurement_type: str) -> dict:
+    return {**DEFAULT_POLICY, **TYPE_POLICIES.get(measurement_type, {})}
+
+
+def floor_bucket(ts: datetime, level: str) -> datetime:
+    ts = ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if level == "day" else ts
+
+
+def _finer_than(level: str):
+    """Filtre : mesures brutes ou agrégats plus fins que `level`"""
+    finer = list(LEVELS[:LEVELS.index(level)])
+    column = models.Measurement.resolution
+    return or_(column.is_(None), column.in_(finer)) if finer else column.is_(None)
+
+
+def _not_coarser_than(level: str):
+    return or_(models.Measurement.resolution.is_(None),
+               models.Measurement.resolution.in_(LEVELS[:LEVELS.index(level) + 1]))
+
+
+def compacted_buckets(db: Session, user_id: int, readings: list, now: datetime = None) -> set:
+    """
+    Intervalles déjà compactés (type, niveau, début) couvrant des lectures [(type, horodatage)].
+    Seules les lectures plus anciennes que le premier seuil de leur type sont cherchées.
+    """
+    M = models.Measurement
+    now = now or datetime.utcnow()
+    old = defaultdict(list)
+    for measurement_type, timestamp in readings:
+        days = [d for d in policy_for(measurement_type).values() if d is not None]
+        if days and timestamp < now - timedelta(days=min(days)):
+            old[measurement_type].append(timestamp)
+
+    found = set()
+    for measurement_type, stamps in old.items():
+        rows = db.query(M.resolution, M.timestamp).filter(
+            M.user_id == user_id,
+            M.type == measurement_type,
+            M.timestamp >= floor_bucket(min(stamps), "day"),
+            M.timestamp <= max(stamps),
+            M.resolution.isnot(None)
+        ).all()
+        found.update((measurement_type, level, start) for level, start in rows)
+    return found
+
+
+def in_compacted(found: set, measurement_type: str, timestamp: datetime) -> bool:
+    return any((measurement_type, level, floor_bucket(timestamp, level)) in found for level in LEVELS)
+
+
+# ──────────────────────────────────────────────────────────────
+# COMPACTION D'UNE TRANCHE
+# ──────────────────────────────────────────────────────────────
+
+def aggregate(rows: list, level: str, bucket_start: datetime) -> models.Measurement:
+    """Fusionne des mesures (brutes ou agrégats) en un agrégat pondéré par échantillons"""
+    weights = [r.sample_count or 1 for r in rows]
+    n = sum(weights)
+    confidences = [(r.confidence, w) for r, w in zip(rows, weights) if r.confidence is not None]
+    return models.Measurement(
+        user_id=rows[0].user_id,
+        type=rows[0].type,
+        value=sum(r.value * w for r, w in zip(rows, weights)) / n,
+        unit=rows[0].unit,
+        confidence=(sum(c * w for c, w in confidences) / sum(w for _, w in confidences)) if confidences else None,
+        timestamp=bucket_start,
+        resolution=level,
+        sample_count=n,
+        min_value=min(r.min_value if r.min_value is not None else r.value for r in rows),
+        max_value=max(r.max_value if r.max_value is not None else r.value for r in rows),
+    )
+
+
+def compact_chunk(db: Session, level: str, user_id: int, measurement_type: str,
+                  start: datetime, cutoff: datetime) -> tuple[datetime, int, int]:
+    """
+    Compacte [start, min(start + N intervalles, cutoff)). Ne commit pas.
+    Retourne (fin de la tranche, agrégats écrits, lignes supprimées).
+    """
+    M = models.Measurement
+    end = min(start + timedelta(seconds=BUCKET_SECONDS[level] * COMPACTION_CHUNK_BUCKETS), cutoff)
+    rows = db.query(M).filter(
+        M.user_id == user_id,
+        M.type == measurement_type,
+        M.timestamp >= start,
+        M.timestamp < end,
+        _not_coarser_than(level)
+    ).all()
+
+    buckets = defaultdict(list)
+    for r in rows:
+        buckets[floor_bucket(r.timestamp, level)].append(r)
+
+    written, removed = 0, []
+    for bucket_start, group in buckets.items():
+        if len(group) == 1 and group[0].resolution == level:
+            continue  # déjà compacté
+        db.add(aggregate(group, level, bucket_start))
+        removed.extend(r.id for r in group)
+        written += 1
+
+    for i in range(0, len(removed), _DELETE_CHUNK):
+        db.query(M).filter(M.id.in_(removed[i:i + _DELETE_CHUNK])).delete(synchronize_session=False)
+    for r in rows:
+        db.expunge(r)
+    db.flush()
+    return end, written, len(removed)
+
+
+def run_compaction(db: Session, now: datetime = None, max_chunks: int = None,
+                   commit_each_chunk: bool = False, dry_run: bool = False) -> dict:
+    """
+    Compacte tout ce qui a dépassé son âge (jour d'abord, puis heure), tranche par tranche.
+    Avec `max_chunks`, s'arrête après ce nombre de tranches ("done": False s'il en reste).
+    """
+    M = models.Measurement
+    now = now or datetime.utcnow()
+    stats = {"chunks": 0, "aggregates": 0, "removed": 0, "done": True}
+
+    for level in reversed(LEVELS):
+        for measurement_type in get_args(schemas.MeasurementType):
+            days = policy_for(measurement_type).get(level)
+            if days is None:
+                continue
+            cutoff = floor_bucket(now - timedelta(days=days), level)
+            pending = db.query(M.user_id, func.min(M.timestamp)).filter(
+                M.type == measurement_type, M.timestamp < cutoff, _finer_than(level)
+            ).group_by(M.user_id).all()
+
+            for user_id, start in pending:
+                while start is not None:
+                    if max_chunks is not None and stats["chunks"] >= max_chunks:
+                        stats["done"] = False
+                        return stats
+                    if dry_run:
+                        stats["chunks"] += 1
+                        break
+                    end, written, removed = compact_chunk(
+                        db, level, user_id, measurement_type, floor_bucket(start, level), cutoff
+                    )
+                    stats["chunks"] += 1
+                    stats["aggregates"] += written
+                    stats["removed"] += removed
+                    if commit_each_chunk:
+                        db.commit()
+                    start = db.query(func.min(M.timestamp)).filter(
+                        M.user_id == user_id, M.type == measurement_type,
+                        M.timestamp >= end, M.timestamp < cutoff, _finer_than(level)
+                    ).scalar()
+    return stats
+
+
+# ──────────────────────────────────────────────────────────────
+# PLANIFICATION (outbox)
+# ──────────────────────────────────────────────────────────────
+
+@job(COMPACTION_JOB_KEY)
+def _compaction_job(db: Session, payload: dict) -> None:
+    # Une tranche bornée par job (une transaction) ; se replanifie aussitôt s'il reste du travail
+    stats = run_compaction(db, max_chunks=COMPACTION_CHUNKS_PER_JOB)
+    delay = 0 if not stats["done"] else COMPACTION_INTERVAL_SECONDS
+    enqueue(db, COMPACTION_JOB_KEY, {}, dedupe_key=COMPACTION_JOB_KEY, delay_seconds=delay)
+
+
+def schedule_compaction(db: Session) -> None:
+    """Planifie la compaction périodique si elle ne l'est pas déjà (idempotent). Ne commit pas."""
+    enqueue(db, COMPACTION_JOB_KEY, {}, dedupe_key=COMPACTION_JOB_KEY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compaction des anciennes mesures BioMetrics")
+    parser.add_argument("--dry-run", action="store_true", help="Compter les tranches sans rien modifier")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        stats = run_compaction(db, commit_each_chunk=True, dry_run=args.dry_run)
+        db.commit()
+    finally:
+        db.close()
+    if args.dry_run:
+        print(f"🔎 {stats['chunks']} couples utilisateur/type à compacter")
+    else:
+        print(f"✅ {stats['removed']} lignes → {stats['aggregates']} agrégats ({stats['chunks']} tranches)")
+
+
+if __name__ == "__main__":
+    main()
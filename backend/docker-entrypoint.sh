@@ -0,0 +1,10 @@
+#!/bin/sh
+# Point d'entrée de l'image : RUN_MIGRATIONS=1 applique les migrations Alembic avant la
+# commande (plateformes sans étape de pré-déploiement ; une seule instance à la fois).
+set -e
+
+if [ "$RUN_MIGRATIONS" = "1" ]; then
+    alembic upgrade head
+fi
+
+exec "$@"
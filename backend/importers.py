@@ -0,0 +1,420 @@
+"""
+Import en streaming d'exports tiers : Apple Health (export.xml), CSV (Google Fit, Fitbit…)
+
+Le fichier n'est jamais chargé en entier : lecture incrémentale d'un flux
+binaire (iterparse / csv.reader), insertion par lots de IMPORT_BATCH_SIZE
+mesures, un commit par lot avec la progression (table `import_jobs`).
+Mémoire constante quelle que soit la taille de l'export ; gzip accepté.
+
+Déduplication : client_id = uuid5(enregistrement source), donc réimporter le
+même export (ou un export plus récent qui le contient) n'insère que les nouveautés.
+Les mesures brutes compactées (compaction.py) n'ont plus de client_id : un
+enregistrement qui tombe dans un intervalle déjà compacté est tenu pour déjà
+importé (compté en doublon), sans quoi l'agrégat l'absorberait une deuxième fois.
+
+Baselines et agrégats journaliers ne sont pas mis à jour mesure par mesure :
+le job "imports.finalize" les recalcule pour l'utilisateur en fin d'import.
+
+Import d'un fichier local (sans passer par HTTP) :
+    python -m importers --user-id 42 --format apple_health export.xml.gz
+"""
+import argparse
+import csv
+import gzip
+import io
+import math
+import os
+import queue
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+import models
+from baselines import rebuild_baselines
+from cache import publish
+from compaction import compacted_buckets, in_compacted
+from database import apply_deadline, request_deadline
+from jobs import enqueue, job
+from routers.measurements import UNITS
+from routers.sync import insert_measurements_ignore_duplicates
+from stats import rebuild_daily_aggregates
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_STALE_SECONDS = int(os.getenv("IMPORT_STALE_SECONDS", "300"))  # import « running » sans progrès
+IMPORT_BATCH_SECONDS = float(os.getenv("IMPORT_BATCH_SECONDS", "30"))  # échéance de la transaction d'un lot
+IMPORT_NAMESPACE = uuid.UUID("6f1c2a4e-3b7d-5e9a-8c0f-2d4b6a8e1c3f")
+
+# Types de quantités Apple Health → MeasurementType
+APPLE_HEALTH_TYPES = {
+    "HKQuantityTypeIdentifierBodyTemperature": "temperature",
+    "HKQuantityTypeIdentifierHeartRate": "hr",
+    "HKQuantityTypeIdentifierStepCount": "steps",
+    "HKQuantityTypeIdentifierHeartRateVariabilitySDNN": "hrv",
+    "HKQuantityTypeIdentifierRespiratoryRate": "respiration",
+    "HKQuantityTypeIdentifierActiveEnergyBurned": "activity",
+}
+
+# En-têtes CSV (minuscules) → MeasurementType ; aussi valeurs d'une colonne `type`
+CSV_TYPE_ALIASES = {
+    "temperature": "temperature", "body temperature": "temperature", "température": "temperature",
+    "hr": "hr", "heart rate": "hr", "heart_rate": "hr", "bpm": "hr",
+    "average heart rate (bpm)": "hr", "fréquence cardiaque": "hr",
+    "steps": "steps", "step count": "steps", "pas": "steps",
+    "hrv": "hrv", "heart rate variability": "hrv", "rmssd": "hrv",
+    "respiration": "respiration", "respiratory rate": "respiration", "breathing rate": "respiration",
+    "activity": "activity", "calories": "activity", "calories (kcal)": "activity",
+    "active calories": "activity", "activity calories": "activity",
+}
+_CSV_TIMESTAMP_COLUMNS = ("timestamp", "datetime", "date time", "start_date", "startdate", "start")
+_CSV_TIME_COLUMNS = ("start time", "time")
+_CSV_DATE_FORMATS = ("%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M")
+
+# Unités source (normalisées) → conversion vers l'unité de UNITS, par type
+UNIT_ALIASES = {
+    "degc": "degC", "°c": "degC", "c": "degC", "celsius": "degC",
+    "degf": "degF", "°f": "degF", "f": "degF", "fahrenheit": "degF",
+    "count/min": "count/min", "bpm": "count/min", "/min": "count/min", "resp/min": "count/min",
+    "count": "count", "pas": "count", "steps": "count",
+    "ms": "ms",
+    "kcal": "kcal", "cal": "kcal", "kj": "kJ",
+}
+UNIT_CONVERSIONS = {
+    ("temperature", "degC"): lambda v: v,
+    ("temperature", "degF"): lambda v: (v - 32) * 5 / 9,
+    ("hr", "count/min"): lambda v: v,
+    ("steps", "count"): lambda v: v,
+    ("hrv", "ms"): lambda v: v,
+    ("respiration", "count/min"): lambda v: v,
+    ("activity", "kcal"): lambda v: v,
+    ("activity", "kJ"): lambda v: v / 4.184,
+}
+
+
+# ──────────────────────────────────────────────────────────────
+# CONVERSIONS
+# ──────────────────────────────────────────────────────────────
+
+def parse_timestamp(text: str) -> datetime:
+    """Horodatage source → datetime UTC naïf (comme le reste de la base)"""
+    text = text.strip()
+    try:
+        # Apple Health : "2024-03-01 08:30:00 +0100"
+        ts = datetime.fromisoformat(text.replace(" +", "+").replace(" -", "-").replace("Z", "+00:00"))
+    except ValueError:
+        for fmt in _CSV_DATE_FORMATS:
+            try:
+                ts = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"Horodatage illisible : {text!r}")
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def convert(measurement_type: str, value: float, unit: str = None):
+    """Valeur dans l'unité de UNITS, ou None si l'unité n'est pas gérée pour ce type"""
+    if not math.isfinite(value):
+        return None
+    if unit is None:
+        return value
+    conversion = UNIT_CONVERSIONS.get((measurement_type, UNIT_ALIASES.get(unit.strip().lower(), unit)))
+    return conversion(value) if conversion else None
+
+
+# ──────────────────────────────────────────────────────────────
+# PARSEURS (générateurs : (type, valeur, horodatage, clé source) ou None si ignoré)
+# ──────────────────────────────────────────────────────────────
+
+def parse_apple_health(stream):
+    """`Record` d'un export.xml Apple Health, en vidant l'arbre au fil de l'eau"""
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or elem.tag != "Record":
+            continue
+        attrs = elem.attrib
+        measurement_type = APPLE_HEALTH_TYPES.get(attrs.get("type"))
+        record = None
+        if measurement_type is not None:
+            try:
+                value = convert(measurement_type, float(attrs["value"]), attrs.get("unit"))
+                if value is not None:
+                    key = "|".join((attrs.get("sourceName", ""), attrs["type"], attrs["startDate"],
+                                    attrs.get("endDate", ""), attrs["value"]))
+                    record = (measurement_type, value, parse_timestamp(attrs["startDate"]), key)
+            except (KeyError, ValueError):
+                pass
+        yield record
+        root.clear()  # sans quoi la racine garde tous les éléments déjà lus
+
+
+def parse_csv(stream):
+    """
+    CSV avec en-tête, une ligne par instant :
+    - format long : colonnes `type`, `value` (et `unit` optionnelle) ;
+    - format large : une colonne par type reconnu (CSV_TYPE_ALIASES), ex. Google Fit.
+    Horodatage : colonne timestamp/datetime/start…, ou `date` + `start time`.
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    header = [h.strip().lower() for h in next(reader, [])]
+
+    def column(*names):
+        return next((header.index(n) for n in names if n in header), None)
+
+    ts_col, date_col, time_col = column(*_CSV_TIMESTAMP_COLUMNS), column("date"), column(*_CSV_TIME_COLUMNS)
+    if ts_col is None and date_col is None:
+        raise ValueError("Colonne d'horodatage introuvable dans l'en-tête CSV")
+    type_col, value_col, unit_col = column("type"), column("value"), column("unit")
+    long_format = type_col is not None and value_col is not None
+    metrics = [(i, CSV_TYPE_ALIASES[h]) for i, h in enumerate(header) if h in CSV_TYPE_ALIASES and i != type_col]
+    if not long_format and not metrics:
+        raise ValueError("Aucune colonne de mesure reconnue dans l'en-tête CSV")
+
+    for row in reader:
+        if not row:
+            continue
+        try:
+            if ts_col is not None:
+                timestamp = parse_timestamp(row[ts_col])
+            elif time_col is not None and row[time_col].strip():
+                timestamp = parse_timestamp(f"{row[date_col].strip()}T{row[time_col].strip()}")
+            else:
+                timestamp = parse_timestamp(row[date_col])
+        except (IndexError, ValueError):
+            yield None
+            continue
+
+        if long_format:
+            cells = [(CSV_TYPE_ALIASES.get(row[type_col].strip().lower()) if type_col < len(row) else None,
+                      row[value_col] if value_col < len(row) else "",
+                      row[unit_col] if unit_col is not None and unit_col < len(row) else None)]
+        else:
+            cells = [(m_type, row[i] if i < len(row) else "", None) for i, m_type in metrics]
+
+        for measurement_type, raw, unit in cells:
+            if not raw.strip():
+                continue
+            try:
+                value = convert(measurement_type, float(raw), unit or None) if measurement_type else None
+            except ValueError:
+                value = None
+            if value is None:
+                yield None
+                continue
+            yield measurement_type, value, timestamp, f"{measurement_type}|{timestamp.isoformat()}|{raw.strip()}"
+
+
+PARSERS = {"apple_health": parse_apple_health, "csv": parse_csv}
+
+
+# ──────────────────────────────────────────────────────────────
+# FLUX
+# ──────────────────────────────────────────────────────────────
+
+class CountingReader(io.RawIOBase):
+    """Compte les octets lus d'un flux binaire (progression de l'import)"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.bytes_read += n
+        return n
+
+
+class BodyStream(io.RawIOBase):
+    """
+    Flux binaire lu par le thread d'import, alimenté par la boucle async
+    (corps de requête) via une file bornée : au plus `max_chunks` morceaux
+    en mémoire, l'envoi ralentit si l'import prend du retard.
+    """
+
+    def __init__(self, max_chunks: int = 16):
+        self._queue = queue.Queue(max_chunks)
+        self._current = b""
+        self._eof = False
+        self._abandoned = False
+
+    def readable(self) -> bool:
+        return True
+
+    def feed(self, chunk) -> bool:
+        """Bloquant (à appeler hors boucle async). False si le lecteur a abandonné."""
+        while not self._abandoned:
+            try:
+                self._queue.put(chunk, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def finish(self, error: Exception = None) -> None:
+        """Fin du flux, ou erreur (ex. client déconnecté) remontée au lecteur"""
+        self.feed(error)
+
+    def abandon(self) -> None:
+        self._abandoned = True
+
+    def readinto(self, buffer) -> int:
+        while not self._current:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+                return 0
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            self._current = memoryview(item)
+        n = min(len(buffer), len(self._current))
+        buffer[:n] = self._current[:n]
+        self._current = self._current[n:]
+        return n
+
+
+def open_source(raw) -> tuple:
+    """(flux à parser, compteur d'octets) ; décompresse le gzip à la volée"""
+    counter = CountingReader(raw)
+    buffered = io.BufferedReader(counter, buffer_size=64 * 1024)
+    if buffered.peek(2)[:2] == b"\x1f\x8b":
+        return io.BufferedReader(gzip.GzipFile(fileobj=buffered), buffer_size=64 * 1024), counter
+    return buffered, counter
+
+
+# ──────────────────────────────────────────────────────────────
+# IMPORT
+# ──────────────────────────────────────────────────────────────
+
+def running_import(db: Session, user_id: int):
+    """Import en cours (avec progrès récent) de l'utilisateur, s'il y en a un"""
+    return db.query(models.ImportJob).filter(
+        models.ImportJob.user_id == user_id,
+        models.ImportJob.status == "running",
+        models.ImportJob.updated_at >= datetime.utcnow() - timedelta(seconds=IMPORT_STALE_SECONDS)
+    ).first()
+
+
+def start_import(db: Session, user_id: int, import_format: str) -> models.ImportJob:
+    if import_format not in PARSERS:
+        raise ValueError(f"Format d'import inconnu : {import_format}")
+    import_job = models.ImportJob(user_id=user_id, format=import_format, status="running",
+                                  bytes_read=0, records_seen=0, imported=0, duplicates=0, skipped=0)
+    db.add(import_job)
+    db.commit()
+    db.refresh(import_job)
+    return import_job
+
+
+def _write_batch(db: Session, import_job: models.ImportJob, batch: dict, counter: CountingReader) -> None:
+    """
+    Insère un lot {client_id: (type, valeur, horodatage)} et committe la progression,
+    en IMPORT_BATCH_SECONDS au plus (database.request_deadline) : l'import entier n'a pas d'échéance.
+    """
+    token = request_deadline.set(time.monotonic() + IMPORT_BATCH_SECONDS)
+    try:
+        if db.in_transaction():   # ouverte pendant la lecture du flux (rechargement d'import_job)
+            apply_deadline(db.connection())
+        _insert_batch(db, import_job, batch, counter)
+    finally:
+        request_deadline.reset(token)
+
+
+def _insert_batch(db: Session, import_job: models.ImportJob, batch: dict, counter: CountingReader) -> None:
+    compacted = compacted_buckets(db, import_job.user_id, [(m_type, ts) for m_type, _, ts in batch.values()])
+    rows = [
+        {"user_id": import_job.user_id, "client_id": client_id, "type": m_type,
+         "value": value, "unit": UNITS.get(m_type), "timestamp": timestamp}
+        for client_id, (m_type, value, timestamp) in batch.items()
+        if not in_compacted(compacted, m_type, timestamp)
+    ]
+    inserted = len(insert_measurements_ignore_duplicates(db, rows)) if rows else 0
+    import_job.imported += inserted
+    import_job.duplicates += len(batch) - inserted
+    import_job.bytes_read = counter.bytes_read
+    import_job.updated_at = datetime.utcnow()
+    if inserted:
+        publish(db, "user_measurements", import_job.user_id)
+    db.commit()
+
+
+def run_import(db: Session, import_job: models.ImportJob, raw, batch_size: int = IMPORT_BATCH_SIZE) -> models.ImportJob:
+    """
+    Importe le flux binaire `raw` (lu séquentiellement) pour import_job.user_id.
+    Une erreur de lecture marque l'import `failed` ; les lots déjà committés restent.
+    """
+    batch = {}
+    try:
+        stream, counter = open_source(raw)
+        for record in PARSERS[import_job.format](stream):
+            import_job.records_seen += 1
+            if record is None:
+                import_job.skipped += 1
+                continue
+            m_type, value, timestamp, key = record
+            batch[str(uuid.uuid5(IMPORT_NAMESPACE, f"{import_job.format}|{key}"))] = (m_type, value, timestamp)
+            if len(batch) >= batch_size:
+                _write_batch(db, import_job, batch, counter)
+                batch = {}
+        _write_batch(db, import_job, batch, counter)
+        import_job.status = "completed"
+    except Exception as e:
+        db.rollback()  # lot en cours abandonné, compteurs ramenés au dernier commit
+        import_job.status = "failed"
+        import_job.error = f"{type(e).__name__}: {e}"[:2000]
+    finally:
+        if isinstance(raw, BodyStream):
+            raw.abandon()
+
+    import_job.finished_at = import_job.updated_at = datetime.utcnow()
+    if import_job.imported:
+        enqueue(db, "imports.finalize", {"user_id": import_job.user_id},
+                dedupe_key=f"imports.finalize:{import_job.user_id}")
+    db.commit()
+    db.refresh(import_job)
+    return import_job
+
+
+@job("imports.finalize")
+def _finalize_import(db: Session, payload: dict) -> None:
+    # Une seule transaction (celle du job) : tout ou rien
+    rebuild_baselines(db, payload["user_id"], commit=False)
+    rebuild_daily_aggregates(db, payload["user_id"], commit=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import d'exports tiers BioMetrics")
+    parser.add_argument("path", help="Fichier à importer (.xml, .csv, éventuellement .gz)")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=sorted(PARSERS), required=True)
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        import_job = start_import(db, args.user_id, args.format)
+        with open(args.path, "rb") as f:
+            import_job = run_import(db, import_job, f)
+    finally:
+        db.close()
+    if import_job.status == "failed":
+        print(f"❌ Import #{import_job.id} interrompu : {import_job.error}")
+    print(f"✅ {import_job.imported} mesures importées, {import_job.duplicates} doublons, "
+          f"{import_job.skipped} ignorées (import #{import_job.id})")
+
+
+if __name__ == "__main__":
+    main()
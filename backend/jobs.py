@@ -0,0 +1,265 @@
+"""
+Jobs d'arrière-plan - outbox transactionnelle + pool de workers async
+
+Un handler HTTP ne fait qu'`enqueue()` : une ligne `outbox_jobs` insérée dans
+SA transaction (le job n'existe que si l'écriture est committée). Les workers
+du processus (démarrés par le lifespan de main.py) exécutent ensuite le job.
+
+Exactement une fois, même avec plusieurs workers / processus :
+- réclamation par SELECT … FOR UPDATE SKIP LOCKED (PostgreSQL) ;
+- la suppression du job, puis le handler, dans la même transaction :
+  soit tout est committé, soit rien (crash → le job redevient disponible).
+
+Échec : nouvel essai avec backoff exponentiel, puis statut `failed`
+après JOB_MAX_ATTEMPTS (à relancer avec `python -m jobs --retry-failed`).
+
+    @job("baselines.update")
+    def apply(db, payload): ...        # ne commit pas
+
+    enqueue(db, "baselines.update", {...}, dedupe_key=None)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal, engine
+
+logger = logging.getLogger("biometrics.jobs")
+
+JOB_RUNNER_ENABLED = os.getenv("JOB_RUNNER_ENABLED", "1") == "1"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "2"))
+JOB_BACKOFF_MAX_SECONDS = 300
+
+HANDLERS = {}
+
+
+def job(kind: str):
+    """Enregistre `fn(db, payload)` comme handler des jobs `kind`"""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: dict, dedupe_key: str = None, delay_seconds: float = 0) -> None:
+    """
+    Ajoute un job à la transaction en cours (ne commit pas).
+    Avec `dedupe_key`, ignoré si un job de même clé est déjà en attente
+    (un job abandonné, `failed`, ne compte pas : la clé peut être replanifiée).
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Type de job inconnu : {kind}")
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    now = datetime.utcnow()
+    db.execute(
+        insert(models.OutboxJob)
+        .values(
+            kind=kind, payload=json.dumps(payload, separators=(",", ":")), dedupe_key=dedupe_key,
+            status="pending", attempts=0, run_after=now + timedelta(seconds=delay_seconds), created_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=["dedupe_key"], index_where=models.OutboxJob.status == "pending")
+    )
+    db.info["jobs_enqueued"] = True
+
+
+def skip_pending(db: Session, kind: str, part: str, user_id: int = None) -> int:
+    """
+    Retire `part` des jobs `kind` non exécutés (en attente ou abandonnés) de `user_id`
+    (de tous sans), avant un recalcul complet qui les rendrait redondants. Un job sans
+    partie restante — ou sans payload["parts"] — est supprimé. Les jobs restent
+    verrouillés jusqu'au commit de l'appelant. Retourne le nombre de jobs touchés.
+    """
+    J = models.OutboxJob
+    touched = 0
+    for pending in db.query(J).filter(J.kind == kind, J.status.in_(("pending", "failed"))).with_for_update().all():
+        payload = json.loads(pending.payload)
+        if user_id is not None and payload.get("user_id") != user_id:
+            continue
+        parts = [p for p in payload.get("parts", ()) if p != part]
+        if parts:
+            pending.payload = json.dumps({**payload, "parts": parts}, separators=(",", ":"))
+        else:
+            db.delete(pending)
+        touched += 1
+    return touched
+
+
+# ──────────────────────────────────────────────────────────────
+# EXÉCUTION
+# ──────────────────────────────────────────────────────────────
+
+def backoff_seconds(attempts: int) -> float:
+    return min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_BACKOFF_MAX_SECONDS)
+
+
+def _record_failure(db: Session, job_id: int, error: Exception) -> None:
+    failed = db.query(models.OutboxJob).filter(models.OutboxJob.id == job_id).with_for_update().first()
+    if failed is None:  # traité entre-temps par un autre worker
+        return
+    failed.attempts += 1
+    failed.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if failed.attempts >= JOB_MAX_ATTEMPTS:
+        failed.status = "failed"
+        logger.error("Job %s (%s) abandonné après %d essais : %r", job_id, failed.kind, failed.attempts, error)
+    else:
+        failed.run_after = datetime.utcnow() + timedelta(seconds=backoff_seconds(failed.attempts))
+        logger.warning("Job %s (%s) en échec, nouvel essai #%d : %r", job_id, failed.kind, failed.attempts + 1, error)
+    db.commit()
+
+
+def process_next(session_factory=SessionLocal) -> bool:
+    """Réclame et exécute un job dû. Retourne False s'il n'y en avait aucun."""
+    with session_factory() as db:
+        claimed = db.query(models.OutboxJob).filter(
+            models.OutboxJob.status == "pending",
+            models.OutboxJob.run_after <= datetime.utcnow()
+        ).order_by(models.OutboxJob.id).with_for_update(skip_locked=True).first()
+        if claimed is None:
+            return False
+
+        job_id, kind = claimed.id, claimed.kind
+        try:
+            handler = HANDLERS.get(kind)
+            if handler is None:
+                raise LookupError(f"Aucun handler pour le job {kind}")
+            # Supprimé avant le handler : il peut replanifier un job de même dedupe_key.
+            # 0 ligne = déjà pris par un autre worker (bases sans SKIP LOCKED)
+            payload = json.loads(claimed.payload)
+            if db.query(models.OutboxJob).filter(models.OutboxJob.id == job_id).delete(synchronize_session=False) != 1:
+                db.rollback()
+                return True
+            handler(db, payload)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            _record_failure(db, job_id, e)
+        return True
+
+
+def run_pending(session_factory=SessionLocal, limit: int = None) -> int:
+    """Exécute les jobs dus jusqu'à épuisement (ou `limit`). Retourne le nombre traité."""
+    processed = 0
+    while (limit is None or processed < limit) and process_next(session_factory):
+        processed += 1
+    return processed
+
+
+class JobRunner:
+    """
+    Pool borné de `workers` tâches asyncio ; chaque job s'exécute dans le
+    threadpool (handlers synchrones SQLAlchemy). Réveil immédiat après le
+    commit d'un enqueue dans ce processus, sinon sondage toutes les `poll_seconds`
+    (jobs d'autres processus, nouveaux essais différés).
+    """
+
+    def __init__(self, session_factory=SessionLocal, workers: int = JOB_WORKERS,
+                 poll_seconds: float = JOB_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._loop = None
+        self._wakeup = None
+        self._tasks = []
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work(n)) for n in range(self.workers)]
+
+    def wake(self) -> None:
+        """Appelable depuis n'importe quel thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Laisse les jobs en cours se terminer (ils sont repris au redémarrage sinon)"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+        self._loop = None
+
+    async def _work(self, n: int) -> None:
+        while not self._stopping:
+            try:
+                processed = await run_in_threadpool(process_next, self.session_factory)
+            except Exception:
+                logger.exception("Worker de jobs #%d : erreur inattendue", n)
+                processed = False
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+# SQLite ne sait pas réclamer un job sans bloquer la base : un seul worker
+job_runner = JobRunner(workers=1 if engine.dialect.name == "sqlite" else JOB_WORKERS)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_runner(session):
+    if session.info.pop("jobs_enqueued", False):
+        job_runner.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jobs d'arrière-plan BioMetrics")
+    parser.add_argument("--drain", action="store_true", help="Exécuter les jobs dus puis quitter")
+    parser.add_argument("--retry-failed", action="store_true", help="Remettre en attente les jobs abandonnés")
+    args = parser.parse_args()
+
+    import main as app_module  # noqa: F401 — enregistre les handlers des routers
+    if args.retry_failed:
+        with SessionLocal() as db:
+            # Clé déjà replanifiée entre-temps : le job en attente suffit
+            J = models.OutboxJob
+            pending_keys = db.query(J.dedupe_key).filter(J.status == "pending", J.dedupe_key.isnot(None))
+            db.query(J).filter(J.status == "failed", J.dedupe_key.in_(pending_keys.scalar_subquery())).delete(
+                synchronize_session=False
+            )
+            count = db.query(J).filter(J.status == "failed").update(
+                {"status": "pending", "attempts": 0, "run_after": datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.commit()
+        print(f"🔁 {count} jobs remis en attente")
+    if args.drain:
+        print(f"✅ {run_pending()} jobs exécutés")
+    if not (args.drain or args.retry_failed):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
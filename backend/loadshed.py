@@ -0,0 +1,117 @@
+"""
+Délestage adaptatif : limite de concurrence AIMD, priorités et échéances par groupe de routes
+
+Quand PostgreSQL ralentit, les requêtes s'empilent dans le threadpool et la
+latence explose partout, /health compris. Ici, chaque worker :
+
+- classe la requête dans un groupe de routes (ROUTE_GROUPS) qui fixe sa
+  priorité et son budget de temps ; l'échéance suit la requête jusqu'à la
+  base (statement_timeout / lock_timeout, voir database.apply_deadline) ;
+- admet au plus `limit × part de la priorité` requêtes simultanées, et
+  répond 503 + Retry-After au-delà, avant tout travail. Les historiques et
+  imports (part 0,5) sont délestés les premiers, l'ingestion (part 1) en
+  dernier ; les sondes /health ne sont jamais limitées ;
+- ajuste `limit` en AIMD sur la latence observée : +1/limit par requête
+  rapide, × LOADSHED_BACKOFF pour une requête lente (au-delà de
+  LOADSHED_LATENCY_RATIO × son budget) ou échouée en 503, au plus une
+  baisse par « aller-retour » (requêtes commencées après la dernière baisse).
+  Les imports (sans budget) n'en informent que par leurs 503.
+
+La limite est propre au worker : rien n'est partagé entre processus.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+LOADSHED_ENABLED = os.getenv("LOADSHED_ENABLED", "1") == "1"
+LOADSHED_INITIAL_LIMIT = int(os.getenv("LOADSHED_INITIAL_LIMIT", "40"))
+LOADSHED_MIN_LIMIT = int(os.getenv("LOADSHED_MIN_LIMIT", "4"))
+LOADSHED_MAX_LIMIT = int(os.getenv("LOADSHED_MAX_LIMIT", "200"))
+LOADSHED_LATENCY_RATIO = float(os.getenv("LOADSHED_LATENCY_RATIO", "0.25"))
+LOADSHED_BACKOFF = 0.9
+
+EXEMPT, CRITICAL, NORMAL, LOW = "exempt", "critical", "normal", "low"
+PRIORITY_SHARES = {CRITICAL: 1.0, NORMAL: 0.8, LOW: 0.5}   # part de la limite accessible
+RETRY_AFTER = {CRITICAL: 1, NORMAL: 2, LOW: 10}             # secondes
+
+# groupe → (priorité, budget en secondes ou None)
+GROUPS = {
+    "health":  (EXEMPT, 2.0),
+    "ingest":  (CRITICAL, 10.0),
+    "default": (NORMAL, 5.0),
+    "history": (LOW, 15.0),
+    # Import d'un export complet (corps reçu en streaming, durée illimitée) : pas d'échéance
+    # de requête, chaque lot a la sienne (importers.IMPORT_BATCH_SECONDS), hors boucle AIMD
+    "bulk":    (LOW, None),
+}
+
+# (méthode ou None, préfixe du chemin, groupe) : la première règle qui correspond, sinon "default"
+ROUTE_GROUPS = (
+    (None, "/health", "health"),
+    ("POST", "/api/v1/measurements/submit", "ingest"),
+    ("POST", "/api/v1/measurements/batch", "ingest"),
+    ("POST", "/api/v1/sync/upload", "ingest"),
+    ("POST", "/api/v1/estimate/session", "ingest"),
+    ("GET", "/api/v1/measurements/history", "history"),
+    ("GET", "/api/v1/measurements/stats", "history"),
+    ("GET", "/api/v1/sync/changes", "history"),
+    ("POST", "/api/v1/imports", "bulk"),
+)
+
+
+def classify(method: str, path: str) -> tuple[str, str, Optional[float]]:
+    """(groupe, priorité, budget) d'une requête"""
+    for rule_method, prefix, group in ROUTE_GROUPS:
+        if (rule_method is None or rule_method == method) and path.startswith(prefix):
+            break
+    else:
+        group = "default"
+    return (group, *GROUPS[group])
+
+
+class AdaptiveLimiter:
+    """Limite de requêtes simultanées du worker, ajustée en AIMD"""
+
+    def __init__(self, initial: int = LOADSHED_INITIAL_LIMIT, min_limit: int = LOADSHED_MIN_LIMIT,
+                 max_limit: int = LOADSHED_MAX_LIMIT, backoff: float = LOADSHED_BACKOFF,
+                 enabled: bool = LOADSHED_ENABLED):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.enabled = enabled
+        self.inflight = 0
+        self.shed = 0                        # requêtes refusées depuis le démarrage
+        self._last_decrease = float("-inf")  # instant (monotonic) de la dernière baisse
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority: str) -> bool:
+        with self._lock:
+            if self.inflight >= max(1.0, self.limit * PRIORITY_SHARES[priority]):
+                self.shed += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, started: float, overloaded: Optional[bool]) -> None:
+        """Fin d'une requête admise à l'instant `started` (monotonic) ; None : sans effet sur la limite"""
+        with self._lock:
+            self.inflight -= 1
+            if overloaded is None:
+                return
+            if overloaded:
+                # Les requêtes déjà en vol lors de la dernière baisse ne la répètent pas
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+            elif self.inflight * 2 >= self.limit:
+                # Ne grandir que si la limite sert : un worker peu chargé ne la gonfle pas
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"limit": round(self.limit, 1), "inflight": self.inflight, "shed": self.shed}
+
+
+limiter = AdaptiveLimiter()
@@ -3,24 +3,94 @@ BioMetrics API - Mesure de Données Corporelles
 Auteur: TADAGBE LANDRY
 Version: 1.1 - Fix CORS Railway + Vercel
 """
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+import time
+
+_IMPORT_STARTED = time.perf_counter()  # avant tout autre import : mesure import → prêt
+
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime
-import bcrypt
 
-from routers import auth, measurements, estimates, users, apikeys
-from database import engine, Base
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeout
+
+from routers import auth, measurements, estimates, users, apikeys, sync, imports, population
+from middleware import CompressionMiddleware, LoadSheddingMiddleware, UsageMeteringMiddleware
+import database
+import jobs
+import compaction
+import cache
+import shares
+import usage
+from loadshed import limiter
+from population import POPULATION_ENABLED, schedule_population_refresh
+from singleflight import FlightTimeout
+
+logger = logging.getLogger("biometrics")
+
+# Le schéma n'est plus créé ici : `alembic upgrade head` est une étape séparée
+# (service `migrate` dans docker-compose), le worker démarre sans toucher la base.
+DB_WARMUP_TIMEOUT = float(os.getenv("DB_WARMUP_TIMEOUT", "5"))
+
+
+def schedule_periodic_jobs():
+    with database.SessionLocal() as db:
+        if compaction.COMPACTION_ENABLED:
+            compaction.schedule_compaction(db)
+        if shares.SHARE_SWEEP_ENABLED:
+            shares.schedule_share_sweep(db)
+        if POPULATION_ENABLED:
+            schedule_population_refresh(db)
+        db.commit()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Préchauffer le pool sans bloquer le démarrage si PostgreSQL est lent :
+    # au pire le worker démarre « non prêt » et /health/ready le signale.
+    try:
+        opened = await asyncio.wait_for(run_in_threadpool(database.warm_pool), DB_WARMUP_TIMEOUT)
+        logger.info("Pool DB préchauffé (%d connexions)", opened)
+    except Exception as e:
+        logger.warning("Préchauffage du pool DB impossible : %r", e)
+
+    app.state.startup_ms = round((time.perf_counter() - _IMPORT_STARTED) * 1000, 1)
+    logger.info("Worker prêt en %.1f ms (import → prêt)", app.state.startup_ms)
+
+    # Bus d'invalidation des caches entre workers (sinon : TTL court seul)
+    if cache.CACHE_BUS_ENABLED and database.engine.dialect.name == "postgresql":
+        cache.invalidation_bus.start(database.DATABASE_URL)
+
+    # Compteurs d'usage des clés API : écrits par lots (jamais par requête)
+    if usage.usage_meter.enabled:
+        await usage.usage_meter.start()
+
+    if jobs.JOB_RUNNER_ENABLED:
+        await jobs.job_runner.start()
+        try:
+            await run_in_threadpool(schedule_periodic_jobs)
+        except Exception as e:
+            logger.warning("Planification des jobs périodiques impossible : %r", e)
+    yield
+    await jobs.job_runner.stop()
+    if usage.usage_meter.enabled:
+        await usage.usage_meter.stop()
+    await run_in_threadpool(cache.invalidation_bus.stop)
+    database.engine.dispose()
 
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="BioMetrics API",
     description="API de mesure de données corporelles - Usage personnel bien-être",
     version="1.1.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan,
 )
 
 # ----------------------------------------------------------------
@@ -48,6 +118,9 @@ if raw:
         if origin:
             ALLOWED_ORIGINS.append(origin)
 
+# Délestage (loadshed.py) : ajouté avant CORS pour que ses 503 portent les en-têtes CORS
+app.add_middleware(LoadSheddingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
@@ -57,6 +130,48 @@ app.add_middleware(
     max_age=600,
 )
 
+# Compression Brotli/Gzip (seuil configurable, les réponses streamées restent streamées)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "500")),
+)
+
+# Comptage des appels par clé API, en mémoire (usage.py) ; ajouté en dernier :
+# la latence mesurée inclut la compression
+app.add_middleware(UsageMeteringMiddleware)
+
+
+def _overloaded() -> JSONResponse:
+    return JSONResponse({"detail": "Service momentanément surchargé, réessayez"}, status_code=503,
+                        headers={"Retry-After": "1"})
+
+
+# Une lecture coalescée (singleflight.py) dont le calcul partagé tarde : réessayer
+@app.exception_handler(FlightTimeout)
+async def flight_timeout_handler(request: Request, exc: FlightTimeout):
+    return _overloaded()
+
+
+# Échéance de la requête dépassée (database.request_deadline), requête SQL annulée par
+# statement_timeout / lock_timeout, ou pool épuisé : base surchargée, réessayer
+_DB_TIMEOUT_CODES = {"57014", "55P03"}   # query_canceled, lock_not_available
+
+
+@app.exception_handler(database.DeadlineExceeded)
+async def deadline_handler(request: Request, exc: database.DeadlineExceeded):
+    return _overloaded()
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return _overloaded()
+
+
+@app.exception_handler(OperationalError)
+async def db_timeout_handler(request: Request, exc: OperationalError):
+    if getattr(exc.orig, "pgcode", None) in _DB_TIMEOUT_CODES:
+        return _overloaded()
+    raise exc
 
 
 # Routers
@@ -65,6 +180,9 @@ app.include_router(measurements.router, prefix="/api/v1/measurements", tags=["Me
 app.include_router(estimates.router,    prefix="/api/v1/estimate",     tags=["Estimations ML"])
 app.include_router(users.router,        prefix="/api/v1/users",        tags=["Utilisateurs"])
 app.include_router(apikeys.router,      prefix="/api/v1/keys",         tags=["API Keys"])
+app.include_router(sync.router,         prefix="/api/v1/sync",         tags=["Synchronisation"])
+app.include_router(imports.router,      prefix="/api/v1/imports",      tags=["Imports"])
+app.include_router(population.router,   prefix="/api/v1/population",   tags=["Population"])
 
 @app.get("/")
 def root():
@@ -81,5 +199,26 @@ def root():
 def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness : le processus répond (aucun accès base)"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness : une connexion du pool répond à SELECT 1"""
+    ready = database.check_connection()
+    body = {
+        "status": "ready" if ready else "unavailable",
+        "database": ready,
+        "startup_ms": getattr(app.state, "startup_ms", None),
+        "load": limiter.snapshot(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1 +1,4 @@
-# from middleware import RateLimitMiddleware, LoggingMiddleware, SecurityHeadersMiddleware
\ No newline at end of file
+# from middleware import RateLimitMiddleware, LoggingMiddleware, SecurityHeadersMiddleware
+from middleware.compression import CompressionMiddleware
+from middleware.usage import UsageMeteringMiddleware
+from middleware.loadshed import LoadSheddingMiddleware
@@ -0,0 +1,152 @@
+"""
+Middleware de compression - Brotli / Gzip négociés via Accept-Encoding
+
+- Seuil de taille : les petites réponses complètes partent non compressées
+- Streaming : les StreamingResponse restent streamées, chaque morceau est
+  compressé puis « flush » aussitôt (pas de mise en tampon de l'export)
+- Brotli si le paquet `brotli` est installé et accepté par le client, sinon gzip
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle
+    brotli = None
+
+# Types déjà compressés ou binaires : inutile de recompresser
+_SKIP_PREFIXES = ("image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """'gzip, br;q=0.8, *;q=0' → {'gzip': 1.0, 'br': 0.8, '*': 0.0}"""
+    codings = {}
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[name.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(header: str) -> str | None:
+    """Meilleur encodage supporté par le client et le serveur (br > gzip)"""
+    codings = parse_accept_encoding(header or "")
+    wildcard = codings.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = codings.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data)
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Middleware ASGI pur (pas de BaseHTTPMiddleware : aucun tampon du corps)"""
+
+    def __init__(self, app, minimum_size: int = 500, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in headers or content_type.startswith(_SKIP_PREFIXES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message  # différé : dépend du premier morceau
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                # Premier morceau : décider de compresser ou non
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    passthrough = True
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() not in (b"content-length", b"vary")
+                ]
+                vary = [v for k, v in start_message.get("headers", []) if k.lower() == b"vary"]
+                vary_value = b", ".join(vary + [b"Accept-Encoding"])
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", vary_value)]
+
+                if not more_body:
+                    # Réponse complète : on connaît la taille compressée
+                    compressed = compressor.compress(body, final=True)
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start_message, "headers": headers})
+                    start_message = None
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+                await send({**start_message, "headers": headers})
+                start_message = None
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_wrapper)
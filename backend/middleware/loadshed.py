@@ -0,0 +1,62 @@
+"""
+Middleware de délestage (voir loadshed.py)
+
+Refuse en 503 + Retry-After, avant tout travail, les requêtes au-delà de la
+limite de concurrence de leur priorité ; pose l'échéance de la requête
+(database.request_deadline) et rapporte au limiteur sa latence.
+"""
+import time
+
+from starlette.responses import JSONResponse
+
+from database import request_deadline
+from loadshed import EXEMPT, LOADSHED_LATENCY_RATIO, RETRY_AFTER, classify, limiter as default_limiter
+
+
+class LoadSheddingMiddleware:
+    """Middleware ASGI pur : la requête refusée ne lit pas son corps"""
+
+    def __init__(self, app, limiter=None):
+        self.app = app
+        self.limiter = limiter or default_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        _, priority, budget = classify(scope["method"], scope["path"])
+        started = time.monotonic()
+        token = request_deadline.set(started + budget if budget is not None else None)
+        if priority == EXEMPT:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                request_deadline.reset(token)
+            return
+
+        if not self.limiter.try_acquire(priority):
+            request_deadline.reset(token)
+            response = JSONResponse({"detail": "Service momentanément surchargé, réessayez"},
+                                    status_code=503, headers={"Retry-After": str(RETRY_AFTER[priority])})
+            await response(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_deadline.reset(token)
+            latency = time.monotonic() - started
+            # 503 en aval : échéance, timeout SQL ou pool épuisé (voir main.py)
+            if budget is None:   # durée d'un import : celle de l'envoi, pas un signal de charge
+                self.limiter.release(started, True if status_code == 503 else None)
+            else:
+                self.limiter.release(started, status_code == 503 or latency > budget * LOADSHED_LATENCY_RATIO)
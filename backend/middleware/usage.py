@@ -0,0 +1,42 @@
+"""
+Middleware de comptage d'usage des clés API (voir usage.py)
+
+Pour chaque requête authentifiée par X-API-Key (auth_utils.get_current_user_or_key
+renseigne request.state.api_key_id) : endpoint (méthode + chemin de la route,
+pas l'URL : « /latest/{measurement_type} »), statut et durée jusqu'au dernier
+octet envoyé, comptés en mémoire — aucun accès base ici.
+"""
+import time
+
+from usage import usage_meter
+
+
+class UsageMeteringMiddleware:
+    """Middleware ASGI pur (pas de BaseHTTPMiddleware : aucun tampon du corps)"""
+
+    def __init__(self, app, meter=None):
+        self.app = app
+        self.meter = meter or usage_meter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.meter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            key_id = scope.get("state", {}).get("api_key_id")
+            if key_id is not None:
+                route = scope.get("route")
+                endpoint = f"{scope['method']} {getattr(route, 'path', scope['path'])}"
+                self.meter.record(key_id, endpoint, status_code, (time.perf_counter() - started) * 1000)
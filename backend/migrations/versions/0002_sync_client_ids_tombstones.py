@@ -0,0 +1,48 @@
+"""Sync hors-ligne : client_id unique par utilisateur, instant d'écriture + tombstones
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('measurements') as batch_op:
+        batch_op.add_column(sa.Column('client_id', sa.String(length=36), nullable=True))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.create_unique_constraint('uq_measurements_user_client', ['user_id', 'client_id'])
+    op.create_index('ix_measurements_user_id_id', 'measurements', ['user_id', 'id'])
+
+    op.create_table(
+        'measurement_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('measurement_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.String(length=36), nullable=True),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_measurement_tombstones_id', 'measurement_tombstones', ['id'])
+    op.create_index('ix_measurement_tombstones_user_id_id', 'measurement_tombstones', ['user_id', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_table('measurement_tombstones')
+    op.drop_index('ix_measurements_user_id_id', table_name='measurements')
+    with op.batch_alter_table('measurements') as batch_op:
+        batch_op.drop_constraint('uq_measurements_user_client', type_='unique')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('client_id')
@@ -0,0 +1,27 @@
+"""Index (user_id, type, timestamp) pour les historiques multi-types
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_measurements_user_type_timestamp', 'measurements', ['user_id', 'type', 'timestamp']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_measurements_user_type_timestamp', table_name='measurements')
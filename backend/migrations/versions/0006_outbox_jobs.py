@@ -0,0 +1,46 @@
+"""Table outbox des jobs d'arrière-plan
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=64), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('dedupe_key', sa.String(length=128), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_outbox_jobs_id'), 'outbox_jobs', ['id'], unique=False)
+    op.create_index('ix_outbox_jobs_status_run_after', 'outbox_jobs', ['status', 'run_after'], unique=False)
+    # Unique parmi les jobs en attente : un job abandonné ne bloque pas sa clé
+    op.create_index('ux_outbox_jobs_pending_dedupe_key', 'outbox_jobs', ['dedupe_key'], unique=True,
+                    postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ux_outbox_jobs_pending_dedupe_key', table_name='outbox_jobs')
+    op.drop_index('ix_outbox_jobs_status_run_after', table_name='outbox_jobs')
+    op.drop_index(op.f('ix_outbox_jobs_id'), table_name='outbox_jobs')
+    op.drop_table('outbox_jobs')
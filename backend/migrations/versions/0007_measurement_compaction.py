@@ -0,0 +1,34 @@
+"""Colonnes d'agrégat pour la compaction des anciennes mesures
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('measurements') as batch_op:
+        batch_op.add_column(sa.Column('resolution', sa.String(length=8), nullable=True))
+        batch_op.add_column(sa.Column('sample_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('min_value', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('max_value', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('measurements') as batch_op:
+        batch_op.drop_column('max_value')
+        batch_op.drop_column('min_value')
+        batch_op.drop_column('sample_count')
+        batch_op.drop_column('resolution')
@@ -0,0 +1,29 @@
+"""Index d'expiration des liens de partage (balayage, liste des liens actifs)
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_share_tokens_expires_at', 'share_tokens', ['expires_at'])
+    op.create_index(
+        'ix_share_tokens_user_active_expires', 'share_tokens', ['user_id', 'is_active', 'expires_at']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_share_tokens_user_active_expires', table_name='share_tokens')
+    op.drop_index('ix_share_tokens_expires_at', table_name='share_tokens')
@@ -0,0 +1,36 @@
+"""Compteurs d'usage des clés API par minute et par endpoint
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'api_key_usage',
+        sa.Column('api_key_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('endpoint', sa.String(length=200), nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.Column('errors', sa.Integer(), nullable=False),
+        sa.Column('latency_ms', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['api_key_id'], ['api_keys.id']),
+        sa.PrimaryKeyConstraint('api_key_id', 'bucket', 'endpoint'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('api_key_usage')
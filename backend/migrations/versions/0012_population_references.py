@@ -0,0 +1,43 @@
+"""Références de population anonymes (année de naissance, distributions par tranche d'âge)
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('birth_year', sa.Integer(), nullable=True))
+    op.create_table(
+        'population_references',
+        sa.Column('type', sa.String(), nullable=False),
+        sa.Column('band', sa.String(length=8), nullable=False),
+        sa.Column('count', sa.Float(), nullable=False),
+        sa.Column('digest', sa.LargeBinary(), nullable=True),
+        sa.Column('quantiles', sa.LargeBinary(), nullable=True),
+        sa.Column('watermark', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('type', 'band'),
+    )
+    op.add_column('daily_aggregates', sa.Column('in_population', sa.Boolean(), nullable=False,
+                                                server_default=sa.false()))
+    op.create_index('ix_daily_aggregates_updated_at', 'daily_aggregates', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_daily_aggregates_updated_at', table_name='daily_aggregates')
+    op.drop_column('daily_aggregates', 'in_population')
+    op.drop_table('population_references')
+    op.drop_column('users', 'birth_year')
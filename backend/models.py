@@ -1,7 +1,7 @@
 """
 Modèles de base de données
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, Boolean, Text, ForeignKey, Index, UniqueConstraint, LargeBinary, false, text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -17,6 +17,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     consent_given = Column(Boolean, default=False)  # RGPD
+    birth_year = Column(Integer, nullable=True)     # tranche d'âge des références de population
 
     measurements = relationship("Measurement", back_populates="user")
     api_keys = relationship("ApiKey", back_populates="user")
@@ -34,9 +35,149 @@ class Measurement(Base):
     raw_data = Column(Text, nullable=True)  # JSON des données brutes
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     notes = Column(Text, nullable=True)
+    client_id = Column(String(36), nullable=True)  # UUID généré par le mobile (sync idempotente)
+    created_at = Column(DateTime, nullable=True, default=datetime.utcnow)  # écriture serveur (curseur de sync)
+    # Agrégats issus de la compaction (compaction.py) : NULL = mesure brute
+    resolution = Column(String(8), nullable=True)   # hour | day ; value = moyenne de l'intervalle
+    sample_count = Column(Integer, nullable=True)
+    min_value = Column(Float, nullable=True)
+    max_value = Column(Float, nullable=True)
 
     user = relationship("User", back_populates="measurements")
 
+    @property
+    def is_aggregate(self) -> bool:
+        return self.resolution is not None
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "client_id", name="uq_measurements_user_client"),
+        Index("ix_measurements_user_id_id", "user_id", "id"),  # pull de sync par curseur
+        Index("ix_measurements_user_type_timestamp", "user_id", "type", "timestamp"),  # historiques
+    )
+
+
+class MeasurementTombstone(Base):
+    """Trace d'une mesure supprimée, pour propager la suppression aux appareils synchronisés"""
+    __tablename__ = "measurement_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    measurement_id = Column(Integer, nullable=False)
+    client_id = Column(String(36), nullable=True)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_measurement_tombstones_user_id_id", "user_id", "id"),
+    )
+
+
+class UserBaseline(Base):
+    """Statistiques glissantes par utilisateur et par type (Welford + EWMA), mises à jour en O(1)"""
+    __tablename__ = "user_baselines"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)      # somme des carrés des écarts (Welford)
+    ewma = Column(Float, nullable=True)                  # moyenne mobile exponentielle
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DailyAggregate(Base):
+    """Statistiques d'un jour par utilisateur et type : moments de Welford + t-digest (stats.py)"""
+    __tablename__ = "daily_aggregates"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    type = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    min_value = Column(Float, nullable=True)
+    max_value = Column(Float, nullable=True)
+    digest = Column(LargeBinary, nullable=True)     # sketches.TDigest sérialisé
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    # Moyenne déjà versée aux références de population (population.py) : jamais deux fois
+    in_population = Column(Boolean, nullable=False, default=False, server_default=false())
+
+    __table_args__ = (
+        Index("ix_daily_aggregates_updated_at", "updated_at"),   # reprise incrémentale de population.py
+    )
+
+
+class PopulationReference(Base):
+    """
+    Distribution anonyme des moyennes journalières par type et tranche d'âge,
+    utilisateurs consentants uniquement (population.py)
+    """
+    __tablename__ = "population_references"
+
+    type = Column(String, primary_key=True)
+    band = Column(String(8), primary_key=True)        # "30-39", "60+" ou "all"
+    count = Column(Float, nullable=False, default=0.0)   # jours-utilisateurs agrégés
+    digest = Column(LargeBinary, nullable=True)          # sketches.TDigest sérialisé
+    quantiles = Column(LargeBinary, nullable=True)       # p0..p100 en float64 packés
+    watermark = Column(DateTime, nullable=True)          # agrégats modifiés jusqu'à cet instant intégrés
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TemperatureCalibration(Base):
+    """Coefficients de température propres à un utilisateur et un appareil (moindres carrés récursifs)"""
+    __tablename__ = "temperature_calibrations"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    device_id = Column(String(64), primary_key=True, default="")   # "" = tous appareils
+    params = Column(LargeBinary, nullable=False)   # θ + triangle de P, float64 packés (calibration.py)
+    samples = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OutboxJob(Base):
+    """Travail différé enregistré dans la transaction de l'écriture (outbox), exécuté par jobs.py"""
+    __tablename__ = "outbox_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)                      # JSON
+    dedupe_key = Column(String(128), nullable=True)             # un seul job en attente par clé
+    status = Column(String(16), nullable=False, default="pending")  # pending | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_outbox_jobs_status_run_after", "status", "run_after"),
+        # Unique parmi les jobs en attente seulement : un job abandonné (failed)
+        # n'empêche pas de replanifier sa clé
+        Index("ux_outbox_jobs_pending_dedupe_key", "dedupe_key", unique=True,
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+    )
+
+
+class ImportJob(Base):
+    """Import d'un export tiers (Apple Health, CSV) : progression lisible pendant le streaming (importers.py)"""
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    format = Column(String(16), nullable=False)                      # apple_health | csv
+    status = Column(String(16), nullable=False, default="running")   # running | completed | failed
+    bytes_read = Column(BigInteger, nullable=False, default=0)
+    records_seen = Column(Integer, nullable=False, default=0)        # enregistrements lus dans le fichier
+    imported = Column(Integer, nullable=False, default=0)            # mesures insérées
+    duplicates = Column(Integer, nullable=False, default=0)          # déjà présentes (import rejoué)
+    skipped = Column(Integer, nullable=False, default=0)             # type non géré, valeur illisible
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_import_jobs_user_id_id", "user_id", "id"),
+    )
+
 
 class ApiKey(Base):
     __tablename__ = "api_keys"
@@ -52,6 +193,18 @@ class ApiKey(Base):
     user = relationship("User", back_populates="api_keys")
 
 
+class ApiKeyUsage(Base):
+    """Appels d'une clé API par minute et par endpoint, écrits par lots (usage.py)"""
+    __tablename__ = "api_key_usage"
+
+    api_key_id = Column(Integer, ForeignKey("api_keys.id"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)                 # début de la minute (UTC)
+    endpoint = Column(String(200), primary_key=True)            # "GET /api/v1/measurements/latest/{measurement_type}"
+    requests = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)         # réponses ≥ 400
+    latency_ms = Column(Float, nullable=False, default=0.0)     # somme des durées
+
+
 class ShareToken(Base):
     __tablename__ = "share_tokens"
 
@@ -61,3 +214,8 @@ class ShareToken(Base):
     expires_at = Column(DateTime, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_share_tokens_expires_at", "expires_at"),                           # balayage (shares.py)
+        Index("ix_share_tokens_user_active_expires", "user_id", "is_active", "expires_at"),  # liens actifs
+    )
@@ -0,0 +1,300 @@
+"""
+Références de population anonymes : « votre HRV par rapport aux personnes de votre âge »
+
+Distribution, par type de mesure et tranche d'âge, des moyennes journalières
+(daily_aggregates, un point par utilisateur et par jour) des seuls
+utilisateurs ayant donné leur consentement. Une ligne par (type, tranche)
+dans population_references : t-digest fusionnable + table de 101 quantiles
+(p0..p100) ; aucune donnée individuelle n'y figure.
+
+Calcul incrémental, sans relecture de la table : chaque passage lit, par
+l'index sur daily_aggregates.updated_at, les agrégats modifiés depuis le
+précédent (watermark) et inchangés depuis POPULATION_LAG_DAYS jours —
+journées passées importées ou synchronisées en retard comprises —, au plus
+POPULATION_ROWS_PER_JOB par job. Chaque moyenne versée est marquée
+(in_population) : jamais comptée deux fois ; une journée complétée après
+coup garde la moyenne déjà versée. À l'octroi du consentement, un job
+verse l'historique antérieur de l'utilisateur (backfill_user). Lecture en
+streaming : mémoire bornée par le lot, pas par la population. Un retrait
+de consentement s'applique aux données suivantes ; --rebuild recalcule tout.
+
+La recherche du rang percentile d'une valeur est une dichotomie dans la
+table de quantiles : O(log n), sans requête une fois la ligne en cache.
+
+Planifié via l'outbox (jobs.py) ; exécution manuelle :
+    python -m population [--rebuild]
+"""
+import argparse
+import os
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from typing import Optional, get_args
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import models
+from cache import LocalCache, publish
+from jobs import enqueue, job
+from schemas import MeasurementType
+from sketches import TDigest
+
+POPULATION_ENABLED = os.getenv("POPULATION_ENABLED", "1") == "1"
+POPULATION_LAG_DAYS = int(os.getenv("POPULATION_LAG_DAYS", "2"))
+POPULATION_ROWS_PER_JOB = int(os.getenv("POPULATION_ROWS_PER_JOB", "100000"))
+POPULATION_MIN_SAMPLES = int(os.getenv("POPULATION_MIN_SAMPLES", "50"))
+POPULATION_INTERVAL_SECONDS = int(os.getenv("POPULATION_INTERVAL_SECONDS", "21600"))
+POPULATION_JOB_KEY = "population.refresh"
+POPULATION_BACKFILL_JOB = "population.backfill_user"
+_STREAM_BATCH_SIZE = 5000
+
+ALL_BAND = "all"
+AGE_BANDS = ((18, 29, "18-29"), (30, 39, "30-39"), (40, 49, "40-49"), (50, 59, "50-59"), (60, None, "60+"))
+BANDS = tuple(label for _, _, label in AGE_BANDS) + (ALL_BAND,)
+QUANTILE_STEPS = 100   # table p0, p1, ..., p100
+
+
+def age_band(birth_year: Optional[int], on: date) -> Optional[str]:
+    """Tranche d'âge à la date `on` (âge approché à l'année), None si inconnue ou < 18 ans"""
+    if birth_year is None:
+        return None
+    age = on.year - birth_year
+    for low, high, label in AGE_BANDS:
+        if age >= low and (high is None or age <= high):
+            return label
+    return None
+
+
+def pack_quantiles(digest: TDigest) -> bytes:
+    return array("d", [digest.quantile(i / QUANTILE_STEPS) for i in range(QUANTILE_STEPS + 1)]).tobytes()
+
+
+def unpack_quantiles(blob: bytes) -> tuple:
+    table = array("d")
+    table.frombytes(blob)
+    return tuple(table)
+
+
+def percentile_rank(quantiles: tuple, value: float) -> float:
+    """Rang percentile (0–100) de `value`, par dichotomie dans une table p0..p100"""
+    if value <= quantiles[0]:
+        return 0.0
+    if value >= quantiles[-1]:
+        return 100.0
+    i = bisect_right(quantiles, value)   # quantiles[i - 1] <= value < quantiles[i]
+    low, high = quantiles[i - 1], quantiles[i]
+    return round(100 * (i - 1 + (value - low) / (high - low)) / (len(quantiles) - 1), 1)
+
+
+# ──────────────────────────────────────────────────────────────
+# CALCUL INCRÉMENTAL
+# ──────────────────────────────────────────────────────────────
+
+def _references(db: Session) -> dict:
+    """(type, tranche) → ligne verrouillée (passages sérialisés), toutes créées au premier passage"""
+    R = models.PopulationReference
+    references = {(r.type, r.band): r for r in db.query(R).with_for_update()}
+    for m_type in get_args(MeasurementType):
+        for band in BANDS:
+            if (m_type, band) not in references:
+                references[(m_type, band)] = R(type=m_type, band=band, count=0.0)
+                db.add(references[(m_type, band)])
+    return references
+
+
+def _watermark(references: dict) -> Optional[datetime]:
+    return max((r.watermark for r in references.values() if r.watermark), default=None)
+
+
+def _pending_rows():
+    """Moyennes journalières de consentants pas encore versées aux références"""
+    A, U = models.DailyAggregate, models.User
+    return (
+        select(A.user_id, A.type, A.day, A.mean, A.updated_at, U.birth_year)
+        .join(U, U.id == A.user_id)
+        .where(U.consent_given == True, U.is_active == True, A.count > 0, A.in_population == False)
+    )
+
+
+def _integrate(db: Session, references: dict, rows) -> tuple[int, Optional[datetime]]:
+    """
+    Verse les lignes (streamées) dans les digests et les marque in_population.
+    Retourne (nombre de moyennes, updated_at de la dernière). Ne commit pas.
+    """
+    A = models.DailyAggregate
+    digests, integrated, last_updated_at = {}, [], None
+    for user_id, m_type, day, mean, updated_at, birth_year in rows:
+        for band in (ALL_BAND, age_band(birth_year, day)):
+            key = (m_type, band)
+            if band is None or key not in references:
+                continue
+            digest = digests.get(key)
+            if digest is None:
+                stored = references[key].digest
+                digest = digests[key] = TDigest.from_bytes(stored) if stored else TDigest()
+            digest.add(mean)
+        integrated.append({"user_id": user_id, "type": m_type, "day": day, "in_population": True})
+        last_updated_at = updated_at
+    if integrated:
+        db.execute(update(A), integrated)   # UPDATE par clé primaire, en executemany
+
+    now = datetime.utcnow()
+    for key, digest in digests.items():
+        digest.compress()
+        reference = references[key]
+        reference.count = digest.count
+        reference.digest = digest.to_bytes()
+        reference.quantiles = pack_quantiles(digest)
+        reference.updated_at = now
+    for m_type in {m_type for m_type, _ in digests}:
+        publish(db, "population", m_type)
+    return len(integrated), last_updated_at
+
+
+def refresh_population_references(db: Session, now: datetime = None,
+                                  max_rows: int = POPULATION_ROWS_PER_JOB) -> dict:
+    """
+    Intègre au plus `max_rows` moyennes journalières modifiées depuis le dernier
+    passage (watermark) et stables depuis POPULATION_LAG_DAYS jours, par
+    l'index sur daily_aggregates.updated_at.
+    Retourne {"samples", "watermark", "done"} ("done": False s'il en reste). Ne commit pas.
+    """
+    A = models.DailyAggregate
+    settled = (now or datetime.utcnow()) - timedelta(days=POPULATION_LAG_DAYS)
+    references = _references(db)
+    watermark = _watermark(references)
+    query = _pending_rows().where(A.updated_at <= settled)
+    if watermark is not None:
+        # >= : lignes de même instant coupées par la limite d'un lot ; déjà versées = in_population
+        query = query.where(A.updated_at >= watermark)
+    rows = db.execute(query.order_by(A.updated_at).limit(max_rows).execution_options(yield_per=_STREAM_BATCH_SIZE))
+    samples, last_updated_at = _integrate(db, references, rows)
+
+    done = samples < max_rows
+    watermark = settled if done else last_updated_at
+    for reference in references.values():
+        reference.watermark = watermark
+    return {"samples": samples, "watermark": watermark, "done": done}
+
+
+def backfill_user(db: Session, user_id: int) -> int:
+    """
+    Verse l'historique d'un utilisateur qui vient de consentir : ses agrégats
+    antérieurs au watermark, que le passage périodique ne relira pas (lecture
+    par la clé primaire). Ne commit pas.
+    """
+    A = models.DailyAggregate
+    references = _references(db)
+    watermark = _watermark(references)
+    if watermark is None:
+        return 0   # aucun passage encore : le premier lira tout
+    rows = db.execute(
+        _pending_rows().where(A.user_id == user_id, A.updated_at < watermark)
+        .execution_options(yield_per=_STREAM_BATCH_SIZE)
+    )
+    return _integrate(db, references, rows)[0]
+
+
+def refresh_all(db: Session, now: datetime = None) -> dict:
+    """Intègre tout ce qui est en attente, un commit par lot de POPULATION_ROWS_PER_JOB moyennes"""
+    totals = {"samples": 0, "watermark": None, "done": False}
+    while not totals["done"]:
+        stats = refresh_population_references(db, now)
+        db.commit()
+        totals = {**stats, "samples": totals["samples"] + stats["samples"]}
+    return totals
+
+
+def rebuild_population_references(db: Session, now: datetime = None) -> dict:
+    """Recalcule tout depuis les agrégats journaliers (consentements actuels)"""
+    db.query(models.PopulationReference).delete(synchronize_session=False)
+    db.execute(update(models.DailyAggregate).where(models.DailyAggregate.in_population == True)
+               .values(in_population=False).execution_options(synchronize_session=False))
+    for m_type in get_args(MeasurementType):
+        publish(db, "population", m_type)
+    db.commit()
+    return refresh_all(db, now)
+
+
+@job(POPULATION_JOB_KEY)
+def _refresh_job(db: Session, payload: dict) -> None:
+    stats = refresh_population_references(db)
+    delay = 0 if not stats["done"] else POPULATION_INTERVAL_SECONDS
+    enqueue(db, POPULATION_JOB_KEY, {}, dedupe_key=POPULATION_JOB_KEY, delay_seconds=delay)
+
+
+@job(POPULATION_BACKFILL_JOB)
+def _backfill_job(db: Session, payload: dict) -> None:
+    backfill_user(db, payload["user_id"])
+
+
+def schedule_population_refresh(db: Session) -> None:
+    """Planifie le calcul périodique s'il ne l'est pas déjà (idempotent). Ne commit pas."""
+    enqueue(db, POPULATION_JOB_KEY, {}, dedupe_key=POPULATION_JOB_KEY)
+
+
+def schedule_user_backfill(db: Session, user_id: int) -> None:
+    """À l'octroi du consentement : intégrer l'historique de l'utilisateur. Ne commit pas."""
+    enqueue(db, POPULATION_BACKFILL_JOB, {"user_id": user_id},
+            dedupe_key=f"{POPULATION_BACKFILL_JOB}:{user_id}")
+
+
+# ──────────────────────────────────────────────────────────────
+# LECTURE
+# ──────────────────────────────────────────────────────────────
+
+# type → {tranche: (effectif, quantiles, watermark)}, évincé à chaque passage du job
+reference_cache = LocalCache("population", invalidated_by=("population",))
+
+
+def reference_tables(db: Session, measurement_type: str) -> dict:
+    def load():
+        R = models.PopulationReference
+        rows = db.query(R.band, R.count, R.quantiles, R.watermark).filter(
+            R.type == measurement_type, R.quantiles.isnot(None)
+        )
+        return {band: (count, unpack_quantiles(blob), watermark) for band, count, blob, watermark in rows}
+    return reference_cache.get_or_load(measurement_type, load)
+
+
+def compare(db: Session, measurement_type: str, value: float, birth_year: Optional[int],
+            today: date = None) -> Optional[dict]:
+    """
+    Rang percentile de `value` dans la tranche d'âge de l'utilisateur, sinon dans
+    toute la population si la tranche est inconnue ou compte moins de
+    POPULATION_MIN_SAMPLES jours-utilisateurs. None sans référence suffisante.
+    """
+    tables = reference_tables(db, measurement_type)
+    band = age_band(birth_year, today or datetime.utcnow().date())
+    for candidate in (band, ALL_BAND):
+        if candidate in tables and tables[candidate][0] >= POPULATION_MIN_SAMPLES:
+            count, quantiles, watermark = tables[candidate]
+            return {
+                "band": candidate,
+                "percentile": percentile_rank(quantiles, value),
+                "sample_size": int(count),
+                "through": watermark.date() if watermark else None,
+                "reference": {f"p{p}": round(quantiles[p * QUANTILE_STEPS // 100], 3)
+                              for p in (5, 25, 50, 75, 95)},
+            }
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Références de population BioMetrics")
+    parser.add_argument("--rebuild", action="store_true", help="Tout recalculer depuis les agrégats journaliers")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        stats = rebuild_population_references(db) if args.rebuild else refresh_all(db)
+    finally:
+        db.close()
+    print(f"✅ {stats['samples']} moyennes journalières intégrées, "
+          f"agrégats stables jusqu'au {stats['watermark']:%Y-%m-%d %H:%M}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Fenêtre récente en mémoire : dernières mesures de chaque utilisateur, par type
+
+Sert /measurements/latest, /measurements/summary et /users/shared (48 h) sans
+requête quand la fenêtre de l'utilisateur est chaude. Par type, des tableaux
+compacts (array) triés par horodatage — id, horodatage (µs), valeur, confiance,
+drapeaux — bornés à RECENT_CAPACITY points : ~33 octets par point, quelques Ko
+par utilisateur actif, aucun objet ORM.
+
+- hydratation paresseuse au premier accès : les RECENT_WINDOW_HOURS dernières
+  heures (une requête) + la dernière mesure des types absents de la fenêtre ;
+- /measurements/submit et /batch y ajoutent leurs lignes au commit ;
+- toute autre écriture (sync, suppression, import, autre worker) évince la
+  fenêtre via le bus d'invalidation (cache.py) : réhydratée au prochain accès ;
+- LRU sous un budget mémoire par worker (RECENT_MEMORY_BUDGET_MB), TTL des caches.
+
+Ce que la fenêtre ne sait pas (mesure avec note, dernière mesure compactée,
+période plus ancienne que les points gardés) est lu en base.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, get_args
+
+from sqlalchemy import desc, event, func, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from cache import CACHE_FALLBACK_TTL, CACHE_SETTLE_SECONDS, CACHE_TTL, invalidation_bus
+from singleflight import SingleFlight
+
+RECENT_STORE_ENABLED = os.getenv("RECENT_STORE_ENABLED", "1") == "1"
+RECENT_WINDOW_HOURS = int(os.getenv("RECENT_WINDOW_HOURS", "48"))
+RECENT_CAPACITY = int(os.getenv("RECENT_CAPACITY", "64"))   # points par type
+RECENT_MEMORY_BUDGET_MB = float(os.getenv("RECENT_MEMORY_BUDGET_MB", "32"))
+
+MEASUREMENT_TYPES = get_args(schemas.MeasurementType)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_HAS_NOTES = 1
+_WINDOW_OVERHEAD = 400   # octets : objets, dict des types (estimation)
+# Hydratée un peu plus large : une lecture de RECENT_WINDOW_HOURS dont le début a
+# été calculé juste avant l'hydratation reste couverte
+_WINDOW_MARGIN = timedelta(minutes=5)
+
+
+def to_micros(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def from_micros(micros: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+class RingBuffer:
+    """
+    Les `capacity` mesures les plus récentes d'un type, triées par horodatage
+    (une mesure arrivée en retard est insérée à sa place, la plus ancienne sort).
+    Complet à partir de `complete_from` (µs) : aucune mesure plus récente ne manque.
+    """
+    __slots__ = ("capacity", "complete_from", "unit", "ids", "timestamps", "values", "confidences", "flags")
+
+    def __init__(self, capacity: int, complete_from: int):
+        self.capacity = capacity
+        self.complete_from = complete_from
+        self.unit = None
+        self.ids = array("q")
+        self.timestamps = array("q")
+        self.values = array("d")
+        self.confidences = array("d")   # NaN : pas de confiance
+        self.flags = array("B")
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(sys.getsizeof(a) for a in (self.ids, self.timestamps, self.values, self.confidences, self.flags))
+
+    def add(self, measurement_id: int, timestamp: int, value: float, confidence: Optional[float],
+            has_notes: bool, unit: Optional[str]) -> None:
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.unit = unit
+        i = bisect_right(self.timestamps, timestamp)
+        self.ids.insert(i, measurement_id)
+        self.timestamps.insert(i, timestamp)
+        self.values.insert(i, value)
+        self.confidences.insert(i, math.nan if confidence is None else confidence)
+        self.flags.insert(i, _HAS_NOTES if has_notes else 0)
+        if len(self) > self.capacity:
+            # Les mesures jusqu'à celle qui sort peuvent désormais manquer
+            self.complete_from = max(self.complete_from, self.timestamps[0] + 1)
+            for a in (self.ids, self.timestamps, self.values, self.confidences, self.flags):
+                a.pop(0)
+
+    def row(self, i: int) -> tuple:
+        """(id, horodatage, valeur, confiance, a une note)"""
+        confidence = self.confidences[i]
+        return (self.ids[i], from_micros(self.timestamps[i]), self.values[i],
+                None if math.isnan(confidence) else confidence, bool(self.flags[i] & _HAS_NOTES))
+
+    def since(self, start: int) -> range:
+        """Indices des mesures d'horodatage ≥ start"""
+        return range(bisect_left(self.timestamps, start), len(self))
+
+
+class UserWindow:
+    """
+    Fenêtre d'un utilisateur : type → RingBuffer, ou None si aucune mesure de ce type.
+    Type absent : inconnu (dernière mesure compactée), lu en base.
+    """
+    __slots__ = ("buffers", "start", "loaded_at", "nbytes")
+
+    def __init__(self, start: int):
+        self.buffers = {}
+        self.start = start            # µs : début de la fenêtre hydratée
+        self.loaded_at = time.monotonic()
+        self.nbytes = _WINDOW_OVERHEAD
+
+    def add(self, capacity: int, m_type: str, *row) -> None:
+        buffer = self.buffers.get(m_type)
+        if buffer is None:
+            buffer = self.buffers[m_type] = RingBuffer(capacity, self.start)
+        buffer.add(*row)
+
+    def measure(self) -> int:
+        self.nbytes = _WINDOW_OVERHEAD + sum(b.nbytes for b in self.buffers.values() if b is not None)
+        return self.nbytes
+
+
+class RecentStore:
+    """Fenêtres récentes par utilisateur, LRU sous budget mémoire"""
+
+    def __init__(self, capacity: int = RECENT_CAPACITY, window_hours: int = RECENT_WINDOW_HOURS,
+                 budget_bytes: int = int(RECENT_MEMORY_BUDGET_MB * 1024 * 1024),
+                 ttl: float = CACHE_TTL, fallback_ttl: float = CACHE_FALLBACK_TTL,
+                 enabled: bool = RECENT_STORE_ENABLED, bus=None):
+        self.capacity = capacity
+        self.window = timedelta(hours=window_hours)
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.enabled = enabled
+        self.bus = bus or invalidation_bus
+        self.nbytes = 0
+        self._windows = OrderedDict()   # user_id → UserWindow
+        self._invalidated_at = {}       # user_id → instant de la dernière invalidation
+        self._loading = {}              # user_id → hydratation en cours (annulée par une invalidation)
+        self._flights = SingleFlight()  # une hydratation par utilisateur pour les lectures simultanées
+        self._lock = threading.Lock()
+        self.bus.register(self)
+
+    @property
+    def effective_ttl(self) -> float:
+        return self.ttl if self.bus.connected else min(self.ttl, self.fallback_ttl)
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def __contains__(self, user_id) -> bool:
+        return user_id in self._windows
+
+    # ── Lectures ────────────────────────────────────────────────
+
+    def latest(self, db: Session, user_id: int, m_type: str) -> tuple[bool, Optional[dict]]:
+        """
+        (connu, mesure) : la dernière mesure du type (champs de MeasurementOut, sauf
+        le texte de la note : "has_notes"), None s'il n'y en a aucune.
+        connu=False : à lire en base.
+        """
+        window = self._window(db, user_id)
+        if window is None or m_type not in window.buffers:
+            return False, None
+        buffer = window.buffers[m_type]
+        if buffer is None:
+            return True, None
+        with self._lock:
+            measurement_id, timestamp, value, confidence, has_notes = buffer.row(len(buffer) - 1)
+        return True, {
+            "id": measurement_id, "type": m_type, "value": value, "unit": buffer.unit,
+            "confidence": confidence, "timestamp": timestamp, "has_notes": has_notes,
+        }
+
+    def since(self, db: Session, user_id: int, start: datetime) -> Optional[list]:
+        """
+        Mesures d'horodatage ≥ start, tous types, de la plus récente à la plus
+        ancienne, ou None si la fenêtre ne couvre pas toute la période.
+        """
+        window = self._window(db, user_id)
+        start_us = to_micros(start)
+        if window is None or start_us < window.start or set(MEASUREMENT_TYPES) - window.buffers.keys():
+            return None
+        rows = []
+        with self._lock:
+            if any(b is not None and b.complete_from > start_us for b in window.buffers.values()):
+                return None
+            for m_type, buffer in window.buffers.items():
+                if buffer is None:
+                    continue
+                for i in buffer.since(start_us):
+                    _, timestamp, value, _, _ = buffer.row(i)
+                    rows.append({"type": m_type, "value": value, "unit": buffer.unit, "timestamp": timestamp})
+        rows.sort(key=lambda r: r["timestamp"], reverse=True)
+        return rows
+
+    # ── Hydratation, éviction ───────────────────────────────────
+
+    def _window(self, db: Session, user_id: int) -> Optional[UserWindow]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            window = self._windows.get(user_id)
+            if window is not None:
+                if time.monotonic() - window.loaded_at <= self.effective_ttl:
+                    self._windows.move_to_end(user_id)
+                    return window
+                self._drop(user_id)
+        return self._flights.do(user_id, lambda: self._load(db, user_id))
+
+    def _load(self, db: Session, user_id: int) -> UserWindow:
+        with self._lock:
+            window = self._windows.get(user_id)   # installée par un vol terminé entre-temps
+            if window is not None:
+                return window
+            token = self._loading[user_id] = object()
+        window = self._hydrate(db, user_id)
+        with self._lock:
+            if self._loading.get(user_id) is not token:
+                return window   # invalidée pendant la lecture : servie une fois, pas gardée
+            del self._loading[user_id]
+            if (
+                CACHE_SETTLE_SECONDS
+                and time.monotonic() - self._invalidated_at.get(user_id, float("-inf")) < CACHE_SETTLE_SECONDS
+            ):
+                return window
+            self._drop(user_id)
+            self._windows[user_id] = window
+            self.nbytes += window.measure()
+            self._shrink()
+        return window
+
+    def _hydrate(self, db: Session, user_id: int) -> UserWindow:
+        M = models.Measurement
+        start = datetime.utcnow() - self.window - _WINDOW_MARGIN
+        window = UserWindow(to_micros(start))
+        columns = (M.id, M.type, M.value, M.confidence, M.timestamp, M.notes.isnot(None), M.unit, M.resolution)
+
+        # Les `capacity` plus récentes par type dans la fenêtre (ROW_NUMBER par type)
+        rank = func.row_number().over(partition_by=M.type, order_by=desc(M.timestamp)).label("rank")
+        ranked = select(*columns, rank).where(M.user_id == user_id, M.timestamp >= start).subquery()
+        rows = db.execute(select(ranked).where(ranked.c.rank <= self.capacity)).all()
+        counts = {}
+        for measurement_id, m_type, value, confidence, timestamp, has_notes, unit, resolution, _ in rows:
+            if resolution is None:
+                window.add(self.capacity, m_type, measurement_id, to_micros(timestamp), value,
+                           confidence, has_notes, unit)
+            counts[m_type] = counts.get(m_type, 0) + 1
+        for m_type, buffer in window.buffers.items():
+            if counts[m_type] >= self.capacity:
+                buffer.complete_from = buffer.timestamps[0] + 1
+
+        # Types sans mesure dans la fenêtre : leur dernière mesure, en une requête
+        missing = [t for t in MEASUREMENT_TYPES if t not in counts]
+        if missing:
+            latest = union_all(*(
+                select(*columns).where(M.user_id == user_id, M.type == t)
+                .order_by(desc(M.timestamp)).limit(1).subquery().select()
+                for t in missing
+            ))
+            found = {row[1]: row for row in db.execute(latest)}
+            for m_type in missing:
+                row = found.get(m_type)
+                if row is None:
+                    window.buffers[m_type] = None
+                elif row[7] is None:
+                    window.add(self.capacity, m_type, row[0], to_micros(row[4]), row[2], row[3], row[5], row[6])
+        return window
+
+    def _shrink(self) -> None:
+        while self.nbytes > self.budget_bytes and len(self._windows) > 1:
+            self._drop(next(iter(self._windows)))
+
+    def _drop(self, user_id) -> None:
+        window = self._windows.pop(user_id, None)
+        if window is not None:
+            self.nbytes -= window.nbytes
+
+    # ── Écritures ───────────────────────────────────────────────
+
+    def stage(self, db: Session, user_id: int, measurements: list) -> None:
+        """
+        Mesures insérées dans la transaction de `db` (ids attribués : après flush),
+        ajoutées à la fenêtre de l'utilisateur au commit au lieu de l'évincer.
+        """
+        staged = db.info.setdefault("recent_rows", {}).setdefault(user_id, [])
+        staged.extend(
+            (m.type, m.id, to_micros(m.timestamp), m.value, m.confidence, m.notes is not None, m.unit)
+            for m in measurements
+        )
+
+    def invalidate_tag(self, kind: str, key, session: Session = None) -> None:
+        if kind not in ("user", "user_measurements"):
+            return
+        staged = session.info.get("recent_rows", {}).pop(key, None) if session is not None else None
+        self._flights.forget(key)
+        with self._lock:
+            self._loading.pop(key, None)
+            window = self._windows.get(key)
+            if kind == "user_measurements" and staged is not None:
+                if window is not None:
+                    for m_type, *row in staged:
+                        window.add(self.capacity, m_type, *row)
+                    before = window.nbytes
+                    self.nbytes += window.measure() - before
+                    self._shrink()
+                return
+            self._drop(key)
+            if CACHE_SETTLE_SECONDS:
+                now = time.monotonic()
+                self._invalidated_at[key] = now
+                if len(self._invalidated_at) > len(self._windows) + 1000:
+                    cutoff = now - CACHE_SETTLE_SECONDS
+                    self._invalidated_at = {k: at for k, at in self._invalidated_at.items() if at >= cutoff}
+
+    def clear(self) -> None:
+        self._flights.forget_all()
+        with self._lock:
+            self._loading.clear()
+            self._windows.clear()
+            self.nbytes = 0
+
+
+recent_store = RecentStore()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_staged(session, transaction):
+    # Après le commit (et la diffusion des invalidations) ou un rollback
+    if transaction.parent is None:
+        session.info.pop("recent_rows", None)
@@ -2,16 +2,22 @@
 Router API Keys - Génération et gestion des clés API développeurs
 """
 import secrets
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends, status
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
 from sqlalchemy.orm import Session
 from database import get_db
 import models
 import schemas
-from auth_utils import get_current_user
+from auth_utils import get_current_user, get_read_db, load_user
+from cache import LocalCache, publish
+from usage import usage_meter, usage_series
 
 router = APIRouter()
 
+# Clé → (id, user_id) des clés actives, évincée à la révocation (événement "api_key")
+api_key_cache = LocalCache("api_keys", tag_kinds=("api_key", "user"))
+
 def generate_api_key() -> str:
     """Génère une clé API au format bm_xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"""
     return f"bm_{secrets.token_hex(24)}"
@@ -74,24 +80,76 @@ def revoke_api_key(
         raise HTTPException(status_code=404, detail="Clé API introuvable")
 
     api_key.is_active = False
+    publish(db, "api_key", api_key.id)
     db.commit()
     return {"message": "Clé API révoquée avec succès"}
 
 
-def get_user_from_api_key(api_key: str, db: Session) -> models.User:
-    """Récupère l'utilisateur depuis une clé API (pour les routes protégées par API key)"""
-    key_obj = db.query(models.ApiKey).filter(
-        models.ApiKey.key == api_key,
-        models.ApiKey.is_active == True
+@router.get("/{key_id}/usage")
+def get_api_key_usage(
+    key_id: int,
+    granularity: Literal["hour", "day"] = "hour",
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Appels, erreurs et latence moyenne d'une clé, par heure ou par jour et par endpoint.
+    Par défaut : dernières 24 h (heure) ou 30 derniers jours (jour). Compteurs écrits
+    par lots : les dernières secondes (USAGE_FLUSH_SECONDS) peuvent manquer.
+    """
+    api_key = db.query(models.ApiKey.id).filter(
+        models.ApiKey.id == key_id,
+        models.ApiKey.user_id == current_user.id
     ).first()
-    if not key_obj:
+    if not api_key:
+        raise HTTPException(status_code=404, detail="Clé API introuvable")
+
+    now = datetime.utcnow()
+    end = datetime.combine(to_date + timedelta(days=1), datetime.min.time()) if to_date else now
+    if from_date:
+        start = datetime.combine(from_date, datetime.min.time())
+    elif granularity == "hour":
+        start = end - timedelta(hours=24)
+    else:
+        start = datetime.combine((end - timedelta(days=30)).date(), datetime.min.time())
+    if start >= end:
+        raise HTTPException(status_code=422, detail="Période vide : `from` doit précéder `to`")
+
+    return {"key_id": key_id, "granularity": granularity, "from": start, "to": end,
+            **usage_series(db, key_id, granularity, start, end)}
+
+
+def get_user_from_api_key(api_key: str, db: Session, request: Request = None) -> models.User:
+    """
+    Récupère l'utilisateur depuis une clé API (pour les routes protégées par API key).
+    Avec `request`, la clé est notée pour le comptage d'usage (middleware/usage.py),
+    qui tient aussi last_used_at à jour : aucune écriture par requête.
+    """
+    def resolve():
+        key_obj = db.query(models.ApiKey.id, models.ApiKey.user_id).filter(
+            models.ApiKey.key == api_key,
+            models.ApiKey.is_active == True
+        ).first()
+        return tuple(key_obj) if key_obj else None
+
+    resolved = api_key_cache.get_or_load(
+        api_key, resolve, tags=lambda r: (("api_key", r[0]), ("user", r[1]))
+    )
+    if not resolved:
         raise HTTPException(status_code=401, detail="Clé API invalide ou révoquée")
+    key_id, user_id = resolved
 
-    # Mettre à jour last_used_at
-    key_obj.last_used_at = datetime.utcnow()
-    db.commit()
+    if request is not None and usage_meter.enabled:
+        request.state.api_key_id = key_id
+    else:
+        db.query(models.ApiKey).filter(models.ApiKey.id == key_id).update(
+            {"last_used_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
 
-    user = db.query(models.User).filter(models.User.id == key_obj.user_id).first()
+    user = load_user(db, user_id)
     if not user or not user.is_active:
         raise HTTPException(status_code=401, detail="Utilisateur inactif")
     return user
@@ -7,6 +7,8 @@ from database import get_db
 import models
 import schemas
 from auth_utils import hash_password, verify_password, create_access_token, get_current_user
+from cache import publish
+from population import POPULATION_ENABLED, schedule_user_backfill
 
 router = APIRouter()
 
@@ -24,7 +26,8 @@ def register(user_data: schemas.UserRegister, db: Session = Depends(get_db)):
         email=user_data.email,
         name=user_data.name,
         hashed_password=hash_password(user_data.password),
-        consent_given=user_data.consent_given
+        consent_given=user_data.consent_given,
+        birth_year=user_data.birth_year
     )
     db.add(user)
     db.commit()
@@ -54,6 +57,25 @@ def get_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 
+@router.patch("/me", response_model=schemas.UserOut)
+def update_me(
+    update: schemas.UserUpdate,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Modifier son nom, son consentement ou son année de naissance"""
+    consented = current_user.consent_given
+    for field, value in update.model_dump(exclude_unset=True).items():
+        if value is not None or field == "birth_year":   # null efface l'année de naissance
+            setattr(current_user, field, value)
+    if current_user.consent_given and not consented and POPULATION_ENABLED:
+        schedule_user_backfill(db, current_user.id)   # son historique rejoint les références
+    publish(db, "user", current_user.id)
+    db.commit()
+    db.refresh(current_user)
+    return current_user
+
+
 @router.delete("/me")
 def delete_account(
     current_user: models.User = Depends(get_current_user),
@@ -64,11 +86,37 @@ def delete_account(
     db.query(models.Measurement).filter(
         models.Measurement.user_id == current_user.id
     ).delete()
+    db.query(models.MeasurementTombstone).filter(
+        models.MeasurementTombstone.user_id == current_user.id
+    ).delete()
+    db.query(models.UserBaseline).filter(
+        models.UserBaseline.user_id == current_user.id
+    ).delete()
+    db.query(models.TemperatureCalibration).filter(
+        models.TemperatureCalibration.user_id == current_user.id
+    ).delete()
+    db.query(models.DailyAggregate).filter(
+        models.DailyAggregate.user_id == current_user.id
+    ).delete()
+    db.query(models.ImportJob).filter(
+        models.ImportJob.user_id == current_user.id
+    ).delete()
+    # Supprimer les clés API et leurs compteurs d'usage
+    key_ids = db.query(models.ApiKey.id).filter(models.ApiKey.user_id == current_user.id)
+    db.query(models.ApiKeyUsage).filter(
+        models.ApiKeyUsage.api_key_id.in_(key_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+    for key_id, in key_ids:
+        publish(db, "api_key", key_id)
+    db.query(models.ApiKey).filter(
+        models.ApiKey.user_id == current_user.id
+    ).delete()
     # Supprimer les tokens de partage
     db.query(models.ShareToken).filter(
         models.ShareToken.user_id == current_user.id
     ).delete()
-    # Supprimer l'utilisateur
+    # Supprimer l'utilisateur (et ses entrées en cache dans tous les workers)
+    publish(db, "user", current_user.id)
     db.delete(current_user)
     db.commit()
     return {"message": "Compte et données supprimés avec succès"}
@@ -2,10 +2,23 @@
 Router Estimations - Température, HRV, Fréquence respiratoire
 """
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_db
 import models
 import schemas
-from auth_utils import get_current_user
+from auth_utils import get_current_user_or_key, get_read_db_or_key
+from cache import publish
+from routers.measurements import UNITS, record_measurements
+from routers.sync import insert_measurements_ignore_duplicates
+from calibration import (
+    DEFAULT_COEFFICIENTS, active_coefficients, calibrate, reset_calibration,
+    features as temperature_features, predict as predict_temperature, unpack_params as unpack_calibration,
+)
+from datetime import datetime
+import json
 import math
+import uuid
 
 router = APIRouter()
 
@@ -17,7 +30,8 @@ DISCLAIMER = "Estimation à titre informatif uniquement. Non certifié médical.
 # Basé sur FeverPhone (2022) - IMWUT - DOI 10.1145/3534582
 # ──────────────────────────────────────────────────────────────
 
-def estimate_body_temperature(battery_temp: float, contact_time: int, ambient_temp: float) -> tuple[float, float]:
+def estimate_body_temperature(battery_temp: float, contact_time: int, ambient_temp: float,
+                              coefficients: tuple = DEFAULT_COEFFICIENTS) -> tuple[float, float]:
     """
     Estime la température corporelle via le thermistor NTC de la batterie.
 
@@ -30,17 +44,14 @@ def estimate_body_temperature(battery_temp: float, contact_time: int, ambient_te
     T_corps ≈ α·ΔT + β·T_batterie + γ·log(t) + δ
 
     où ΔT = T_batterie - T_ambiante (delta de réchauffement)
+
+    `coefficients` = (α, β, γ, δ) : ceux du dataset FeverPhone (simplifié) par défaut,
+    ou ceux calibrés pour l'utilisateur / l'appareil (voir calibration.py).
     """
     delta_t = battery_temp - ambient_temp  # réchauffement dû au contact peau
 
-    # Coefficients calibrés sur le dataset FeverPhone (simplifié)
-    alpha = 1.15    # poids du delta de réchauffement
-    beta = 0.52     # poids de la T° batterie finale
-    gamma = 0.65    # contribution logarithmique du temps
-    delta = 8.4     # offset de calibration
-
-    contact_factor = math.log(max(contact_time, 1))
-    estimated = alpha * delta_t + beta * battery_temp + gamma * contact_factor + delta
+    x = temperature_features(battery_temp, contact_time, ambient_temp)
+    estimated = predict_temperature(coefficients, x)
 
     # Borner dans la plage humaine réaliste
     estimated = max(34.5, min(42.5, estimated))
@@ -107,6 +118,22 @@ def compute_hrv(rr_or_hr_samples: list, is_rr: bool = False) -> dict:
     }
 
 
+def hrv_confidence(samples: list, is_rr: bool = False) -> float:
+    """
+    Confiance du calcul HRV : part des échantillons dans la plage physiologique,
+    pondérée par leur nombre (≥ 30 intervalles exploitables = confiance pleine).
+    """
+    if not samples:
+        return 0.1
+    if is_rr:
+        valid = sum(1 for r in samples if 400 <= r <= 1500)
+    else:
+        valid = sum(1 for h in samples if 40 <= h <= 200)
+    ratio = valid / len(samples)
+    size_factor = min(1.0, valid / 30)
+    return round(max(0.1, min(0.95, ratio * (0.4 + 0.6 * size_factor))), 2)
+
+
 def interpret_hrv(rmssd: float) -> str:
     if rmssd < 20:
         return "HRV faible — Stress élevé ou récupération insuffisante"
@@ -146,6 +173,85 @@ def interpret_respiration(rr: float) -> str:
         return "Tachypnée sévère (> 40 resp/min) — consultez un médecin"
 
 
+# ──────────────────────────────────────────────────────────────
+# CALCULS (partagés par les endpoints d'estimation et /session)
+# ──────────────────────────────────────────────────────────────
+
+def run_temperature_estimate(data: schemas.TemperatureEstimateInput,
+                             coefficients: tuple = DEFAULT_COEFFICIENTS) -> dict:
+    estimated_temp, confidence = estimate_body_temperature(
+        data.battery_temp,
+        data.contact_time,
+        data.ambient_temp or 25.0,
+        coefficients
+    )
+    return {
+        "estimated_temp": estimated_temp,
+        "confidence": confidence,
+        "interpretation": interpret_temperature(estimated_temp),
+        "disclaimer": DISCLAIMER,
+        "calibrated": coefficients != DEFAULT_COEFFICIENTS,
+    }
+
+
+def run_hrv_estimate(data: schemas.HRVInput) -> dict:
+    if len(data.hr_samples) < 2:
+        raise HTTPException(status_code=400, detail="Au moins 2 échantillons requis")
+
+    try:
+        hrv_data = compute_hrv(data.hr_samples, is_rr=getattr(data, 'is_rr', False))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {
+        **hrv_data,
+        "interpretation": interpret_hrv(hrv_data["hrv_rmssd"]),
+    }
+
+
+def run_respiration_estimate(data: schemas.RespirationEstimateInput) -> dict:
+    valid, error_msg = validate_respiration_rate(data.respiration_rate)
+    if not valid:
+        raise HTTPException(status_code=422, detail=error_msg)
+
+    # Ajuster la confiance selon le bruit ambiant
+    noise_penalty = max(0, (data.noise_level or 0) - 30) / 100
+    adjusted_confidence = max(0.1, (data.confidence or 0.5) - noise_penalty)
+
+    return {
+        "respiration_rate": round(data.respiration_rate),
+        "confidence": round(adjusted_confidence, 2),
+        "interpretation": interpret_respiration(data.respiration_rate),
+        "disclaimer": DISCLAIMER,
+    }
+
+
+def derive_session_measurements(data: schemas.MeasurementSessionIn,
+                                coefficients: tuple = DEFAULT_COEFFICIENTS) -> tuple[dict, list]:
+    """
+    Exécute l'estimateur du type demandé (`coefficients` : calibration température).
+    Retourne (résultat d'estimation, [(type, valeur, confiance), ...] à enregistrer).
+    """
+    inputs = getattr(data, data.type)
+    if inputs is None:
+        raise HTTPException(status_code=422, detail=f"Champ '{data.type}' requis pour une session {data.type}")
+
+    if data.type == "temperature":
+        result = run_temperature_estimate(inputs, coefficients)
+        return result, [("temperature", result["estimated_temp"], result["confidence"])]
+
+    if data.type == "hrv":
+        result = run_hrv_estimate(inputs)
+        confidence = hrv_confidence(inputs.hr_samples, inputs.is_rr)
+        return result, [
+            ("hr", result["mean_hr"], confidence),
+            ("hrv", result["hrv_rmssd"], confidence),
+        ]
+
+    result = run_respiration_estimate(inputs)
+    return result, [("respiration", result["respiration_rate"], result["confidence"])]
+
+
 # ──────────────────────────────────────────────────────────────
 # ENDPOINTS
 # ──────────────────────────────────────────────────────────────
@@ -153,7 +259,8 @@ def interpret_respiration(rr: float) -> str:
 @router.post("/temperature", response_model=schemas.TemperatureEstimateOut)
 def estimate_temperature(
     data: schemas.TemperatureEstimateInput,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
 ):
     """
     Estime la température corporelle à partir du thermistor de la batterie.
@@ -162,25 +269,56 @@ def estimate_temperature(
     - battery_temp  : T° batterie après contact (lue via expo-device sur Android)
     - ambient_temp  : T° de départ (avant contact, = T° ambiante)
     - contact_time  : durée de contact peau-téléphone en secondes (min 30s, idéal 120s)
+    - device_id     : identifiant de l'appareil, pour utiliser sa calibration (optionnel)
+
+    Utilise les coefficients calibrés de l'utilisateur s'il y en a (gardés en mémoire).
     """
-    estimated_temp, confidence = estimate_body_temperature(
-        data.battery_temp,
-        data.contact_time,
-        data.ambient_temp or 25.0
-    )
+    coefficients = active_coefficients(db, current_user.id, data.device_id)
+    return run_temperature_estimate(data, coefficients)
 
+
+@router.post("/temperature/calibrate", response_model=schemas.TemperatureCalibrationOut)
+def calibrate_temperature(
+    data: schemas.TemperatureCalibrationInput,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """
+    Calibration avec un thermomètre de référence : mêmes entrées qu'une estimation,
+    plus `reference_temp` relevée au même moment. Chaque appel affine les coefficients
+    de l'utilisateur (ou de `device_id`) par moindres carrés récursifs.
+    """
+    x = temperature_features(data.battery_temp, data.contact_time, data.ambient_temp or 25.0)
+    calibration, before, after = calibrate(db, current_user.id, data.device_id, x, data.reference_temp)
+    publish(db, "calibration", current_user.id)
+    db.commit()
+    theta, _ = unpack_calibration(calibration.params)
     return {
-        "estimated_temp": estimated_temp,
-        "confidence": confidence,
-        "interpretation": interpret_temperature(estimated_temp),
-        "disclaimer": DISCLAIMER,
+        "device_id": calibration.device_id,
+        "samples": calibration.samples,
+        "coefficients": [round(t, 4) for t in theta],
+        "predicted_before": round(before, 2),
+        "predicted_after": round(after, 2),
     }
 
 
+@router.delete("/temperature/calibrate")
+def delete_temperature_calibration(
+    device_id: Optional[str] = None,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """Revenir aux coefficients par défaut (pour un appareil, ou tous si device_id absent)"""
+    deleted = reset_calibration(db, current_user.id, device_id)
+    publish(db, "calibration", current_user.id)
+    db.commit()
+    return {"deleted": deleted}
+
+
 @router.post("/hrv", response_model=schemas.HRVOut)
 def estimate_hrv(
     data: schemas.HRVInput,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_or_key)
 ):
     """
     Calcule la HRV (variabilité FC) depuis les données PPG caméra.
@@ -189,24 +327,13 @@ def estimate_hrv(
     - hr_samples : liste de fréquences cardiaques (bpm) capturées via PPG
       OU intervalles RR en ms si is_rr=True
     """
-    if len(data.hr_samples) < 2:
-        raise HTTPException(status_code=400, detail="Au moins 2 échantillons requis")
-
-    try:
-        hrv_data = compute_hrv(data.hr_samples, is_rr=getattr(data, 'is_rr', False))
-    except ValueError as e:
-        raise HTTPException(status_code=422, detail=str(e))
-
-    return {
-        **hrv_data,
-        "interpretation": interpret_hrv(hrv_data["hrv_rmssd"]),
-    }
+    return run_hrv_estimate(data)
 
 
 @router.post("/respiration", response_model=schemas.RespirationEstimateOut)
 def estimate_respiration(
     data: schemas.RespirationEstimateInput,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_or_key)
 ):
     """
     Valide et interprète la fréquence respiratoire mesurée via microphone.
@@ -221,17 +348,59 @@ def estimate_respiration(
     - noise_level      : niveau de bruit ambiant 0–100 (0 = silencieux)
     - confidence       : confiance calculée côté mobile (0–1)
     """
-    valid, error_msg = validate_respiration_rate(data.respiration_rate)
-    if not valid:
-        raise HTTPException(status_code=422, detail=error_msg)
+    return run_respiration_estimate(data)
 
-    # Ajuster la confiance selon le bruit ambiant
-    noise_penalty = max(0, (data.noise_level or 0) - 30) / 100
-    adjusted_confidence = max(0.1, (data.confidence or 0.5) - noise_penalty)
 
-    return {
-        "respiration_rate": round(data.respiration_rate),
-        "confidence": round(adjusted_confidence, 2),
-        "interpretation": interpret_respiration(data.respiration_rate),
-        "disclaimer": DISCLAIMER,
-    }
+@router.post("/session", response_model=schemas.MeasurementSessionOut)
+def measurement_session(
+    data: schemas.MeasurementSessionIn,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """
+    Estime ET enregistre en un seul aller-retour.
+
+    Exécute l'estimateur du type (temperature, hrv, respiration) puis enregistre
+    toutes les mesures dérivées (hrv → hr + hrv) dans une seule transaction,
+    confiance calculée incluse. Avec un client_id, la session est rejouable
+    sans doublon (même déduplication que /sync/upload).
+    """
+    coefficients = DEFAULT_COEFFICIENTS
+    if data.type == "temperature" and data.temperature is not None:
+        coefficients = active_coefficients(db, current_user.id, data.temperature.device_id)
+    result, derived = derive_session_measurements(data, coefficients)
+
+    base_id = data.client_id or uuid.uuid4()
+    timestamp = data.timestamp or datetime.utcnow()
+    raw_data = {**getattr(data, data.type).model_dump(), **(data.raw_data or {})}
+    rows = [
+        {
+            "user_id": current_user.id,
+            "client_id": str(uuid.uuid5(base_id, m_type)),
+            "type": m_type,
+            "value": value,
+            "unit": UNITS.get(m_type),
+            "confidence": confidence,
+            "timestamp": timestamp,
+            "raw_data": json.dumps(raw_data),
+            "notes": data.notes,
+        }
+        for m_type, value, confidence in derived
+    ]
+    inserted = insert_measurements_ignore_duplicates(db, rows)
+    scores = dict(zip(
+        (r.client_id for r in inserted),
+        record_measurements(db, current_user.id, [(r.type, r.value, r.timestamp) for r in inserted])
+    ))
+    stored = db.query(models.Measurement).filter(
+        models.Measurement.user_id == current_user.id,
+        models.Measurement.client_id.in_([r["client_id"] for r in rows])
+    ).order_by(models.Measurement.id).all()
+    out = []
+    for m in stored:
+        item = schemas.MeasurementOut.model_validate(m)
+        item.z_score, item.is_anomaly = scores.get(m.client_id, (None, None))
+        out.append(item)
+    db.commit()
+
+    return {"type": data.type, "estimate": result, "measurements": out}
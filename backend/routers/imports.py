@@ -0,0 +1,83 @@
+"""
+Router Imports - Exports tiers (Apple Health, CSV Google Fit / Fitbit) en streaming
+
+Le corps de la requête est le fichier brut (export.xml, .csv, éventuellement
+gzippé), lu au fil de l'envoi : l'import progresse pendant l'upload et se
+suit par GET /imports/{id}. Réimporter le même fichier est sans effet (dédup).
+"""
+import asyncio
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+
+from database import get_db
+import models
+import schemas
+from auth_utils import get_current_user_or_key
+from importers import BodyStream, run_import, running_import, start_import
+
+router = APIRouter()
+
+
+@router.post("/", response_model=schemas.ImportOut, status_code=status.HTTP_201_CREATED)
+async def import_export(
+    request: Request,
+    format: schemas.ImportFormat = Query(..., description="apple_health (export.xml) ou csv"),
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """
+    Importer un export complet. Envoyer le fichier tel quel comme corps de requête
+    (Content-Type: application/octet-stream), gzippé de préférence : export.xml.gz.
+    """
+    user_id = current_user.id
+    if await run_in_threadpool(running_import, db, user_id):
+        raise HTTPException(status_code=409, detail="Un import est déjà en cours pour ce compte")
+    import_job = await run_in_threadpool(start_import, db, user_id, format)
+
+    # Le parseur lit dans un thread pendant que la boucle reçoit le corps (mémoire bornée)
+    body = BodyStream()
+    task = asyncio.ensure_future(run_in_threadpool(run_import, db, import_job, body))
+    try:
+        async for chunk in request.stream():
+            if chunk and not await run_in_threadpool(body.feed, chunk):
+                break  # l'import s'est arrêté (format invalide…)
+        await run_in_threadpool(body.finish)
+    except ClientDisconnect as e:
+        await run_in_threadpool(body.finish, e)
+    import_job = await task
+
+    if import_job.status == "failed":
+        raise HTTPException(status_code=422, detail=f"Import #{import_job.id} interrompu : {import_job.error}")
+    return import_job
+
+
+@router.get("/", response_model=List[schemas.ImportOut])
+def list_imports(
+    limit: int = Query(20, ge=1, le=100),
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """Imports de l'utilisateur, du plus récent au plus ancien"""
+    return db.query(models.ImportJob).filter(
+        models.ImportJob.user_id == current_user.id
+    ).order_by(models.ImportJob.id.desc()).limit(limit).all()
+
+
+@router.get("/{import_id}", response_model=schemas.ImportOut)
+def get_import(
+    import_id: int,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """Progression d'un import (octets reçus, mesures insérées, doublons, ignorées)"""
+    import_job = db.query(models.ImportJob).filter(
+        models.ImportJob.id == import_id,
+        models.ImportJob.user_id == current_user.id
+    ).first()
+    if not import_job:
+        raise HTTPException(status_code=404, detail="Import introuvable")
+    return import_job
@@ -1,15 +1,23 @@
 """
 Router Mesures - Submit, Latest, History
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import and_, desc, false, func, or_, select
+from sqlalchemy.orm import aliased
 from database import get_db
 import models
 import schemas
-from auth_utils import get_current_user
-from datetime import datetime, date
-from typing import Optional, List
+from auth_utils import get_current_user_or_key, get_read_db_or_key
+from cache import publish
+from compact_encoding import negotiated_response
+from compaction import BUCKET_SECONDS, floor_bucket
+from baselines import RECORDED_JOB, RECORDED_PARTS, score_readings, update_baselines
+from recent import recent_store
+from jobs import enqueue, job
+from stats import apply_readings, compute_stats, invalidate_day
+from datetime import datetime, date, timedelta
+from typing import Optional, List, Literal, get_args
 import json
 
 router = APIRouter()
@@ -25,10 +33,39 @@ UNITS = {
 }
 
 
+def record_measurements(db: Session, user_id: int, readings: list) -> list:
+    """
+    Suites d'une insertion de mesures [(type, valeur, horodatage)] : scores d'anomalie
+    (retournés), baselines et agrégats journaliers (un seul job, appliqué après commit),
+    invalidation des caches de l'utilisateur.
+    """
+    if not readings:
+        return []
+    scores = score_readings(db, user_id, [(t, v) for t, v, _ in readings])
+    enqueue(db, RECORDED_JOB, {
+        "user_id": user_id,
+        "parts": list(RECORDED_PARTS),
+        "readings": [(t, v, ts.isoformat()) for t, v, ts in readings],
+    })
+    publish(db, "user_measurements", user_id)
+    return scores
+
+
+@job(RECORDED_JOB)
+def _apply_recorded(db: Session, payload: dict) -> None:
+    # Une partie retirée (jobs.skip_pending) a été couverte par un recalcul complet
+    parts = payload.get("parts", RECORDED_PARTS)
+    readings = [(t, v, datetime.fromisoformat(ts)) for t, v, ts in payload["readings"]]
+    if "baselines" in parts:
+        update_baselines(db, payload["user_id"], [(t, v) for t, v, _ in readings])
+    if "daily" in parts:
+        apply_readings(db, payload["user_id"], readings)
+
+
 @router.post("/submit", response_model=schemas.MeasurementOut)
 def submit_measurement(
     data: schemas.MeasurementSubmit,
-    current_user: models.User = Depends(get_current_user),
+    current_user: models.User = Depends(get_current_user_or_key),
     db: Session = Depends(get_db)
 ):
     """Soumettre une nouvelle mesure depuis le mobile"""
@@ -42,18 +79,64 @@ def submit_measurement(
         notes=data.notes
     )
     db.add(measurement)
+    # Score contre la baseline personnelle (lecture par clé primaire) ;
+    # sa mise à jour part dans l'outbox, exécutée après le commit
+    z_score, is_anomaly = record_measurements(
+        db, current_user.id, [(measurement.type, measurement.value, measurement.timestamp)]
+    )[0]
+    db.flush()
+    recent_store.stage(db, current_user.id, [measurement])
     db.commit()
     db.refresh(measurement)
+    measurement.z_score, measurement.is_anomaly = z_score, is_anomaly
     return measurement
 
 
+@router.post("/batch", response_model=List[schemas.MeasurementOut])
+def submit_batch(
+    data: schemas.MeasurementBatchSubmit,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """Soumettre plusieurs mesures en une seule requête (une transaction)"""
+    now = datetime.utcnow()
+    rows = [
+        models.Measurement(
+            user_id=current_user.id,
+            type=item.type,
+            value=item.value,
+            unit=UNITS.get(item.type),
+            timestamp=item.timestamp or now,
+            raw_data=json.dumps(item.raw_data) if item.raw_data else None,
+            notes=item.notes
+        )
+        for item in data.measurements
+    ]
+    db.add_all(rows)
+    scores = record_measurements(db, current_user.id, [(m.type, m.value, m.timestamp) for m in rows])
+    for m, (z_score, is_anomaly) in zip(rows, scores):
+        m.z_score, m.is_anomaly = z_score, is_anomaly
+    db.flush()  # ids attribués en un seul INSERT multi-lignes
+    recent_store.stage(db, current_user.id, rows)
+    # Sérialiser avant le commit : évite un SELECT de rafraîchissement par ligne
+    out = [schemas.MeasurementOut.model_validate(m) for m in rows]
+    db.commit()
+    return out
+
+
 @router.get("/latest/{measurement_type}", response_model=schemas.MeasurementOut)
 def get_latest(
     measurement_type: str,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
 ):
-    """Dernière mesure d'un type donné"""
+    """Dernière mesure d'un type donné (fenêtre récente en mémoire, sinon base)"""
+    known, latest = recent_store.latest(db, current_user.id, measurement_type)
+    if known and not (latest and latest["has_notes"]):
+        if latest is None:
+            raise HTTPException(status_code=404, detail=f"Aucune mesure '{measurement_type}' trouvée")
+        return {**latest, "notes": None}
+
     m = db.query(models.Measurement).filter(
         models.Measurement.user_id == current_user.id,
         models.Measurement.type == measurement_type
@@ -66,14 +149,21 @@ def get_latest(
 
 @router.get("/history/{measurement_type}", response_model=List[schemas.MeasurementOut])
 def get_history(
+    request: Request,
     measurement_type: str,
     from_date: Optional[date] = Query(None, alias="from"),
     to_date: Optional[date] = Query(None, alias="to"),
     limit: int = Query(100, le=500),
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
 ):
-    """Historique des mesures sur une période"""
+    """
+    Historique des mesures sur une période.
+    Les périodes anciennes compactées arrivent en agrégats (is_aggregate, resolution,
+    sample_count, min_value, max_value) à la place des mesures brutes.
+    Accept: application/vnd.biometrics.columnar+json ou application/msgpack
+    pour un encodage colonnaire compact.
+    """
     query = db.query(models.Measurement).filter(
         models.Measurement.user_id == current_user.id,
         models.Measurement.type == measurement_type
@@ -84,21 +174,175 @@ def get_history(
     if to_date:
         query = query.filter(models.Measurement.timestamp <= datetime.combine(to_date, datetime.max.time()))
     
-    return query.order_by(desc(models.Measurement.timestamp)).limit(limit).all()
+    rows = query.order_by(desc(models.Measurement.timestamp)).limit(limit).all()
+    return negotiated_response(request, [schemas.MeasurementOut.model_validate(m) for m in rows])
+
+
+def parse_types(types: str) -> list:
+    """'hr,hrv' → ['hr', 'hrv'] (types validés, ordre conservé, sans doublon)"""
+    allowed = get_args(schemas.MeasurementType)
+    parsed = list(dict.fromkeys(t.strip() for t in types.split(",") if t.strip()))
+    unknown = [t for t in parsed if t not in allowed]
+    if not parsed or unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Types invalides : {', '.join(unknown) or '(aucun)'} — attendus : {', '.join(allowed)}"
+        )
+    return parsed
+
+
+def bucket_expression(dialect: str, bucket: str, column):
+    """Début de l'intervalle (heure/jour) contenant `column`, selon le SGBD"""
+    if dialect == "postgresql":
+        return func.date_trunc(bucket, column)
+    fmt = "%Y-%m-%d %H:00:00" if bucket == "hour" else "%Y-%m-%d 00:00:00"
+    return func.strftime(fmt, column)
+
+
+@router.get("/history")
+def get_multi_history(
+    request: Request,
+    types: str = Query(..., description="Types séparés par des virgules, ex: hr,hrv,temperature"),
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    limit: int = Query(100, le=500, description="Points max par type"),
+    bucket: Optional[Literal["hour", "day"]] = None,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
+):
+    """
+    Historique de plusieurs types en une requête (une seule requête SQL indexée),
+    groupé par type. Avec `bucket`, retourne des agrégats (moyenne, min, max, nombre)
+    par heure ou par jour au lieu des mesures brutes ; sans `from`, sur les `limit`
+    intervalles précédant la dernière mesure de chaque type (scan borné).
+    Encodage colonnaire compact négociable via Accept (voir compact_encoding).
+    """
+    type_list = parse_types(types)
+    M = models.Measurement
+    filters = [M.user_id == current_user.id, M.type.in_(type_list)]
+    if from_date:
+        filters.append(M.timestamp >= datetime.combine(from_date, datetime.min.time()))
+    if to_date:
+        filters.append(M.timestamp <= datetime.combine(to_date, datetime.max.time()))
+
+    series = {t: [] for t in type_list}
+
+    if bucket:
+        if from_date is None:
+            # Dernière mesure par type (index user_id, type, timestamp) → fenêtre de `limit` intervalles
+            span = timedelta(seconds=BUCKET_SECONDS[bucket] * (limit - 1))
+            windows = []
+            for t in type_list:
+                latest = db.query(func.max(M.timestamp)).filter(*filters, M.type == t).scalar()
+                if latest is not None:
+                    windows.append(and_(M.type == t, M.timestamp >= floor_bucket(latest, bucket) - span))
+            filters.append(or_(*windows) if windows else false())
+
+        period = bucket_expression(db.get_bind().dialect.name, bucket, M.timestamp).label("period")
+        # Les agrégats de compaction pèsent leur nombre d'échantillons
+        weight = func.coalesce(M.sample_count, 1)
+        # Les `limit` intervalles les plus récents par type, en SQL (ROW_NUMBER sur le regroupement)
+        grouped = select(
+            M.type.label("type"), period,
+            (func.sum(M.value * weight) / func.sum(weight)).label("value"),
+            func.min(func.coalesce(M.min_value, M.value)).label("min"),
+            func.max(func.coalesce(M.max_value, M.value)).label("max"),
+            func.sum(weight).label("count"),
+            func.row_number().over(partition_by=M.type, order_by=desc(period)).label("rank")
+        ).where(*filters).group_by(M.type, period).subquery()
+        g = grouped.c
+        rows = db.execute(
+            select(g.type, g.period, g.value, g.min, g.max, g.count)
+            .where(g.rank <= limit).order_by(g.type, desc(g.period))
+        ).all()
+        for m_type, start, avg_value, min_value, max_value, count in rows:
+            if isinstance(start, str):  # SQLite : strftime retourne du texte
+                start = datetime.fromisoformat(start)
+            series[m_type].append({
+                "timestamp": start,
+                "value": round(avg_value, 2),
+                "min": min_value,
+                "max": max_value,
+                "count": count,
+            })
+    else:
+        # Les `limit` plus récentes par type, en une requête (ROW_NUMBER par type)
+        rank = func.row_number().over(partition_by=M.type, order_by=desc(M.timestamp)).label("rank")
+        ranked = select(M, rank).where(*filters).subquery()
+        recent = aliased(M, ranked)
+        rows = db.execute(
+            select(recent).where(ranked.c.rank <= limit).order_by(recent.type, desc(recent.timestamp))
+        ).scalars().all()
+        for m in rows:
+            series[m.type].append(schemas.MeasurementOut.model_validate(m))
+
+    payload = {"from": from_date, "to": to_date, "bucket": bucket, "series": series}
+    return negotiated_response(request, payload, series_keys=("series",))
+
+
+def parse_percentiles(percentiles: str) -> tuple:
+    """'5,50,95' → (5.0, 50.0, 95.0), chacun dans ]0, 100["""
+    try:
+        parsed = tuple(dict.fromkeys(float(p) for p in percentiles.split(",") if p.strip()))
+    except ValueError:
+        parsed = ()
+    if not parsed or len(parsed) > 20 or any(not 0 < p < 100 for p in parsed):
+        raise HTTPException(status_code=422, detail="percentiles : 1 à 20 valeurs dans ]0, 100[, ex: 5,50,95")
+    return parsed
+
+
+@router.get("/stats")
+def get_stats(
+    types: str = Query(..., description="Types séparés par des virgules, ex: hr,hrv"),
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    percentiles: str = Query("5,50,95", description="Percentiles séparés par des virgules"),
+    method: Literal["auto", "exact", "sketch"] = "auto",
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
+):
+    """
+    Statistiques de distribution par type sur une période : nombre, moyenne,
+    écart-type, min, max et percentiles (ex : médiane de FC au repos du mois, p5/p95).
+
+    `auto` : calcul exact sur les mesures brutes pour une période courte et récente
+    (≤ STATS_EXACT_MAX_DAYS jours), sinon fusion des agrégats journaliers (t-digest),
+    qui répond en quelques millisecondes même sur une année.
+    """
+    type_list = parse_types(types)
+    used, stats = compute_stats(
+        db, current_user.id, type_list, from_date, to_date, parse_percentiles(percentiles), method
+    )
+    return {"from": from_date, "to": to_date, "method": used, "stats": stats}
 
 
 @router.get("/summary")
 def get_summary(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
 ):
-    """Résumé de toutes les dernières mesures"""
+    """Résumé de toutes les dernières mesures (fenêtre récente en mémoire, sinon base)"""
+    return {"user": current_user.name, "summary": latest_summary(db, current_user.id)}
+
+
+def latest_summary(db: Session, user_id: int) -> dict:
     types = ["temperature", "hr", "steps", "hrv", "respiration", "activity"]
     summary = {}
     
     for t in types:
+        known, latest = recent_store.latest(db, user_id, t)
+        if known:
+            if latest:
+                summary[t] = {
+                    "value": latest["value"],
+                    "unit": latest["unit"],
+                    "timestamp": latest["timestamp"].isoformat(),
+                    "confidence": latest["confidence"]
+                }
+            continue
+
         m = db.query(models.Measurement).filter(
-            models.Measurement.user_id == current_user.id,
+            models.Measurement.user_id == user_id,
             models.Measurement.type == t
         ).order_by(desc(models.Measurement.timestamp)).first()
         
@@ -109,14 +353,13 @@ def get_summary(
                 "timestamp": m.timestamp.isoformat(),
                 "confidence": m.confidence
             }
-    
-    return {"user": current_user.name, "summary": summary}
+    return summary
 
 
 @router.delete("/{measurement_id}")
 def delete_measurement(
     measurement_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: models.User = Depends(get_current_user_or_key),
     db: Session = Depends(get_db)
 ):
     """Supprimer une mesure spécifique"""
@@ -128,6 +371,12 @@ def delete_measurement(
     if not m:
         raise HTTPException(status_code=404, detail="Mesure introuvable")
     
+    # Tombstone : la suppression sera propagée aux appareils synchronisés
+    db.add(models.MeasurementTombstone(
+        user_id=m.user_id, measurement_id=m.id, client_id=m.client_id
+    ))
+    invalidate_day(db, m.user_id, m.type, m.timestamp)
+    publish(db, "user_measurements", m.user_id)
     db.delete(m)
     db.commit()
     return {"message": "Mesure supprimée"}
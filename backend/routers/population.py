@@ -0,0 +1,46 @@
+"""
+Router Population - Comparaison anonyme aux personnes de même tranche d'âge
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from auth_utils import get_current_user_or_key, get_read_db_or_key
+from population import compare
+
+router = APIRouter()
+
+RECENT_DAYS = 7   # valeur comparée par défaut : moyenne des 7 derniers jours
+
+
+@router.get("/percentile", response_model=schemas.PopulationPercentileOut)
+def get_percentile(
+    measurement_type: schemas.MeasurementType = Query(..., alias="type"),
+    value: Optional[float] = None,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_read_db_or_key)
+):
+    """
+    Rang percentile d'une valeur (par défaut, sa moyenne des 7 derniers jours)
+    parmi les utilisateurs consentants de sa tranche d'âge
+    """
+    if value is None:
+        A = models.DailyAggregate
+        total, weighted = db.query(func.sum(A.count), func.sum(A.count * A.mean)).filter(
+            A.user_id == current_user.id, A.type == measurement_type,
+            A.day > datetime.utcnow().date() - timedelta(days=RECENT_DAYS)
+        ).one()
+        if not total:
+            raise HTTPException(status_code=404,
+                                detail=f"Aucune mesure '{measurement_type}' ces {RECENT_DAYS} derniers jours")
+        value = weighted / total
+
+    result = compare(db, measurement_type, value, current_user.birth_year)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Pas encore assez de données de référence pour ce type")
+    return {"type": measurement_type, "value": round(value, 3), **result}
@@ -0,0 +1,256 @@
+"""
+Router Sync - Synchronisation hors-ligne du mobile
+
+Upload : lots de mesures portant un client_id (UUID généré sur l'appareil),
+dédupliqués par la contrainte unique (user_id, client_id) avec
+ON CONFLICT DO NOTHING → un upload rejoué après une coupure réseau est sans effet.
+
+Pull : modifications depuis un curseur opaque émis par le serveur
+(dernier id de mesure + dernier id de tombstone vus), suppressions incluses.
+Un appareil resté hors-ligne une semaine se réconcilie en quelques pages.
+
+Garantie du curseur : les ids sont attribués à l'insertion, pas au commit ;
+sur PostgreSQL, une transaction peut committer un id inférieur à une ligne
+déjà visible. Le curseur n'avance donc que sur les lignes écrites il y a plus
+de SYNC_SAFETY_LAG_SECONDS (created_at / deleted_at) : les plus récentes sont
+renvoyées mais relues au pull suivant. Aucune ligne n'est manquée tant
+qu'aucune transaction d'écriture ne dure plus que ce délai ; l'appareil
+applique les changements par id / client_id, une relecture est sans effet.
+"""
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func, or_
+
+from database import get_db
+import models
+import schemas
+from auth_utils import get_current_user_or_key
+from cache import publish
+from routers.measurements import UNITS, record_measurements
+from stats import invalidate_day
+
+router = APIRouter()
+
+INSERT_CHUNK_SIZE = 500  # reste sous la limite de paramètres SQLite
+# Au-delà de la plus longue transaction d'écriture (budget ingestion, lot d'import)
+SYNC_SAFETY_LAG_SECONDS = float(os.getenv("SYNC_SAFETY_LAG_SECONDS", "60"))
+
+
+# ──────────────────────────────────────────────────────────────
+# CURSEUR
+# ──────────────────────────────────────────────────────────────
+
+def encode_cursor(last_measurement_id: int, last_tombstone_id: int) -> str:
+    raw = json.dumps({"m": last_measurement_id, "t": last_tombstone_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> tuple[int, int]:
+    if not cursor:
+        return 0, 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(data["m"]), int(data["t"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur de synchronisation invalide")
+
+
+def safety_horizon() -> datetime:
+    """Lignes écrites avant cet instant : committées ou abandonnées, aucun id inférieur à venir"""
+    return datetime.utcnow() - timedelta(seconds=SYNC_SAFETY_LAG_SECONDS)
+
+
+def stable_count(rows: list, written_at, horizon: datetime) -> int:
+    """Nombre de lignes en tête de `rows` (triées par id) écrites avant `horizon`"""
+    for count, row in enumerate(rows):
+        stamp = written_at(row)
+        if stamp is not None and stamp >= horizon:
+            return count
+    return len(rows)
+
+
+# ──────────────────────────────────────────────────────────────
+# INSERTION IDEMPOTENTE
+# ──────────────────────────────────────────────────────────────
+
+def insert_measurements_ignore_duplicates(db: Session, rows: list[dict]) -> list:
+    """
+    Insère des lignes `measurements` (dicts complets avec user_id et client_id)
+    en ignorant celles dont (user_id, client_id) existe déjà.
+    Retourne les lignes réellement insérées (id, client_id, type, value, timestamp). Ne commit pas.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    inserted = []
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + INSERT_CHUNK_SIZE]
+        stmt = (
+            insert(models.Measurement)
+            .values(chunk)
+            .on_conflict_do_nothing(index_elements=["user_id", "client_id"])
+            .returning(
+                models.Measurement.id, models.Measurement.client_id,
+                models.Measurement.type, models.Measurement.value, models.Measurement.timestamp
+            )
+        )
+        inserted.extend(db.execute(stmt).all())
+    return inserted
+
+
+def record_tombstones(db: Session, measurements: list) -> None:
+    """Ajoute une tombstone par mesure supprimée (à appeler avant le commit)"""
+    now = datetime.utcnow()
+    db.add_all([
+        models.MeasurementTombstone(
+            user_id=m.user_id,
+            measurement_id=m.id,
+            client_id=m.client_id,
+            deleted_at=now,
+        )
+        for m in measurements
+    ])
+
+
+# ──────────────────────────────────────────────────────────────
+# ENDPOINTS
+# ──────────────────────────────────────────────────────────────
+
+@router.post("/upload", response_model=schemas.SyncUploadOut)
+def upload(
+    data: schemas.SyncUpload,
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """Envoyer les mesures (et suppressions) accumulées hors-ligne — rejouable sans doublon"""
+    # Un même client_id répété dans le lot ne compte qu'une fois
+    unique = {str(item.client_id): item for item in data.measurements}
+    rows = [
+        {
+            "user_id": current_user.id,
+            "client_id": client_id,
+            "type": item.type,
+            "value": item.value,
+            "unit": UNITS.get(item.type),
+            "timestamp": item.timestamp,
+            "raw_data": json.dumps(item.raw_data) if item.raw_data else None,
+            "notes": item.notes,
+        }
+        for client_id, item in unique.items()
+    ]
+    inserted = insert_measurements_ignore_duplicates(db, rows) if rows else []
+    accepted = len(inserted)
+    # Baselines : seulement les mesures nouvelles (un upload rejoué ne compte pas deux fois)
+    record_measurements(db, current_user.id, [(r.type, r.value, r.timestamp) for r in inserted])
+
+    deleted = 0
+    if data.deleted:
+        to_delete = db.query(models.Measurement).filter(
+            models.Measurement.user_id == current_user.id,
+            models.Measurement.client_id.in_([str(c) for c in data.deleted])
+        ).all()
+        record_tombstones(db, to_delete)
+        for m in to_delete:
+            invalidate_day(db, m.user_id, m.type, m.timestamp)
+            db.delete(m)
+        deleted = len(to_delete)
+        if deleted:
+            publish(db, "user_measurements", current_user.id)
+
+    ids = {}
+    if unique:
+        ids = dict(
+            db.query(models.Measurement.client_id, models.Measurement.id).filter(
+                models.Measurement.user_id == current_user.id,
+                models.Measurement.client_id.in_(list(unique))
+            ).all()
+        )
+    db.commit()
+
+    return {
+        "accepted": accepted,
+        "duplicates": len(unique) - accepted,
+        "deleted": deleted,
+        "ids": ids,
+    }
+
+
+@router.get("/changes", response_model=schemas.SyncChangesOut)
+def pull_changes(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """
+    Modifications depuis `cursor` (tout l'historique si absent), par pages de `limit`.
+    Rappeler avec le curseur retourné tant que has_more est vrai.
+    """
+    last_m, last_t = decode_cursor(cursor)
+    horizon = safety_horizon()
+
+    # Les agrégats de compaction restent côté serveur : l'appareil garde ses mesures brutes
+    measurements = db.query(models.Measurement).filter(
+        models.Measurement.user_id == current_user.id,
+        models.Measurement.id > last_m,
+        models.Measurement.resolution.is_(None)
+    ).order_by(models.Measurement.id).limit(limit + 1).all()
+
+    tombstones = db.query(models.MeasurementTombstone).filter(
+        models.MeasurementTombstone.user_id == current_user.id,
+        models.MeasurementTombstone.id > last_t
+    ).order_by(models.MeasurementTombstone.id).limit(limit + 1).all()
+
+    more_m = len(measurements) > limit
+    more_t = len(tombstones) > limit
+    measurements = measurements[:limit]
+    tombstones = tombstones[:limit]
+
+    # Le curseur s'arrête avant la première ligne trop récente : elle et les suivantes seront relues
+    stable_m = stable_count(measurements, lambda m: m.created_at, horizon)
+    stable_t = stable_count(tombstones, lambda t: t.deleted_at, horizon)
+    next_m = measurements[stable_m - 1].id if stable_m else last_m
+    next_t = tombstones[stable_t - 1].id if stable_t else last_t
+    # Page tronquée par une ligne récente : la suite est plus récente encore, inutile de boucler
+    has_more = (more_m and stable_m == limit) or (more_t and stable_t == limit)
+
+    return {
+        "measurements": measurements,
+        "deleted": [
+            {"id": t.measurement_id, "client_id": t.client_id, "deleted_at": t.deleted_at}
+            for t in tombstones
+        ],
+        "cursor": encode_cursor(next_m, next_t),
+        "has_more": has_more,
+    }
+
+
+@router.get("/cursor")
+def current_cursor(
+    current_user: models.User = Depends(get_current_user_or_key),
+    db: Session = Depends(get_db)
+):
+    """
+    Curseur « maintenant » : pour un appareil qui ne veut que les modifications futures.
+    Arrêté à l'horizon de sécurité : les écritures des dernières secondes seront reçues au pull.
+    """
+    horizon = safety_horizon()
+    last_m = db.query(func.max(models.Measurement.id)).filter(
+        models.Measurement.user_id == current_user.id,
+        or_(models.Measurement.created_at.is_(None), models.Measurement.created_at < horizon)
+    ).scalar() or 0
+    last_t = db.query(func.max(models.MeasurementTombstone.id)).filter(
+        models.MeasurementTombstone.user_id == current_user.id,
+        models.MeasurementTombstone.deleted_at < horizon
+    ).scalar() or 0
+    return {"cursor": encode_cursor(last_m, last_t)}
@@ -3,11 +3,14 @@ Router Utilisateurs - Partage de données, gestion profil
 """
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_public_read_db
 import models
 import schemas
-from auth_utils import get_current_user
+from auth_utils import get_current_user, get_read_db
+from cache import LocalCache, publish
+from recent import recent_store
 from datetime import datetime, timedelta
+from typing import List, Optional
 import secrets
 import os
 
@@ -15,6 +18,10 @@ router = APIRouter()
 
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 
+# Liens publics par token (sans les mesures), évincés à la révocation du lien (cache.py)
+share_cache = LocalCache("shares", tag_kinds=("share_token", "user"))
+SHARED_WINDOW = timedelta(hours=48)
+
 
 @router.post("/share", response_model=schemas.ShareOut)
 def create_share_link(
@@ -41,46 +48,91 @@ def create_share_link(
     }
 
 
+@router.get("/shares", response_model=List[schemas.ShareListOut])
+def list_shares(
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Liens de partage actifs, du plus proche de l'expiration au plus lointain"""
+    # Parcours de l'index (user_id, is_active, expires_at) : aucun lien expiré ou révoqué lu
+    shares = db.query(models.ShareToken).filter(
+        models.ShareToken.user_id == current_user.id,
+        models.ShareToken.is_active == True,
+        models.ShareToken.expires_at > datetime.utcnow()
+    ).order_by(models.ShareToken.expires_at).all()
+    return [
+        {
+            "token": s.token,
+            "expires_at": s.expires_at,
+            "created_at": s.created_at,
+            "share_url": f"{BASE_URL}/api/v1/users/shared/{s.token}"
+        } for s in shares
+    ]
+
+
 @router.get("/shared/{token}")
-def get_shared_data(token: str, db: Session = Depends(get_db)):
+def get_shared_data(token: str, db: Session = Depends(get_public_read_db)):
     """Accéder aux données partagées via un token public"""
-    share_token = db.query(models.ShareToken).filter(
-        models.ShareToken.token == token,
-        models.ShareToken.is_active == True
-    ).first()
-    
-    if not share_token:
+    cached = share_cache.get_or_load(
+        token, lambda: load_shared_data(db, token),
+        tags=lambda c: (("share_token", c[0]), ("user", c[1]))
+    )
+    if not cached:
         raise HTTPException(status_code=404, detail="Lien de partage invalide")
+    _, user_id, expires_at, body = cached
     
-    if share_token.expires_at < datetime.utcnow():
-        share_token.is_active = False
-        db.commit()
+    # Désactivation / suppression des liens expirés : balayage périodique (shares.py)
+    if expires_at < datetime.utcnow():
         raise HTTPException(status_code=410, detail="Lien de partage expiré")
+    if body is None:
+        raise HTTPException(status_code=404, detail="Lien de partage invalide")
     
-    # Retourner les mesures récentes (48h)
-    recent_measurements = db.query(models.Measurement).filter(
-        models.Measurement.user_id == share_token.user_id,
-        models.Measurement.timestamp >= datetime.utcnow() - timedelta(hours=48)
-    ).order_by(models.Measurement.timestamp.desc()).all()
+    return {**body, "measurements": shared_measurements(db, user_id)}
+
+
+def load_shared_data(db: Session, token: str) -> Optional[tuple]:
+    """
+    (id du lien, id de l'utilisateur, expiration, réponse sans les mesures) ou None
+    si le token est inconnu. Réponse None pour un lien révoqué.
+    """
+    # Recherche par l'index unique du token : coût constant quel que soit l'âge de la table
+    share_token = db.query(models.ShareToken).filter(models.ShareToken.token == token).first()
+    
+    if not share_token:
+        return None
+    if not share_token.is_active:
+        return share_token.id, share_token.user_id, share_token.expires_at, None
     
     user = db.query(models.User).filter(models.User.id == share_token.user_id).first()
     
-    return {
+    return share_token.id, share_token.user_id, share_token.expires_at, {
         "user_name": user.name,
         "shared_at": share_token.created_at,
         "expires_at": share_token.expires_at,
-        "measurements": [
-            {
-                "type": m.type,
-                "value": m.value,
-                "unit": m.unit,
-                "timestamp": m.timestamp
-            } for m in recent_measurements
-        ],
         "disclaimer": "Données à titre informatif uniquement. Non médical."
     }
 
 
+def shared_measurements(db: Session, user_id: int) -> list:
+    """Mesures des dernières 48 h (fenêtre récente en mémoire, sinon base)"""
+    start = datetime.utcnow() - SHARED_WINDOW
+    measurements = recent_store.since(db, user_id, start)
+    if measurements is not None:
+        return measurements
+    recent_measurements = db.query(models.Measurement).filter(
+        models.Measurement.user_id == user_id,
+        models.Measurement.timestamp >= start
+    ).order_by(models.Measurement.timestamp.desc()).all()
+    return [
+        {
+            "type": m.type,
+            "value": m.value,
+            "unit": m.unit,
+            "timestamp": m.timestamp
+        } for m in recent_measurements
+    ]
+
+
 @router.delete("/share/{token}")
 def revoke_share(
     token: str,
@@ -97,5 +149,6 @@ def revoke_share(
         raise HTTPException(status_code=404, detail="Lien introuvable")
     
     share_token.is_active = False
+    publish(db, "share_token", share_token.id)
     db.commit()
     return {"message": "Lien de partage révoqué"}
@@ -3,15 +3,22 @@ Schémas Pydantic - Validation des données entrantes/sortantes
 """
 from pydantic import BaseModel, EmailStr, validator
 from typing import Optional, List, Literal
-from datetime import datetime
+from datetime import date, datetime
+from uuid import UUID
 
 
 # ── Auth ──────────────────────────────────────────────────────
+def _check_birth_year(v):
+    if v is not None and not (1900 <= v <= datetime.utcnow().year):
+        raise ValueError("Année de naissance invalide")
+    return v
+
 class UserRegister(BaseModel):
     email: EmailStr
     password: str
     name: str
     consent_given: bool = False
+    birth_year: Optional[int] = None   # facultatif : comparaison à sa tranche d'âge
 
     @validator('password')
     def password_strength(cls, v):
@@ -19,6 +26,19 @@ class UserRegister(BaseModel):
             raise ValueError("Le mot de passe doit avoir au moins 8 caractères")
         return v
 
+    @validator('birth_year')
+    def plausible_birth_year(cls, v):
+        return _check_birth_year(v)
+
+class UserUpdate(BaseModel):
+    name: Optional[str] = None
+    consent_given: Optional[bool] = None
+    birth_year: Optional[int] = None
+
+    @validator('birth_year')
+    def plausible_birth_year(cls, v):
+        return _check_birth_year(v)
+
 class UserLogin(BaseModel):
     email: EmailStr
     password: str
@@ -29,6 +49,7 @@ class UserOut(BaseModel):
     name: str
     created_at: datetime
     consent_given: bool
+    birth_year: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -49,6 +70,15 @@ class MeasurementSubmit(BaseModel):
     raw_data: Optional[dict] = None
     notes: Optional[str] = None
 
+class MeasurementBatchSubmit(BaseModel):
+    measurements: List[MeasurementSubmit]
+
+    @validator('measurements')
+    def batch_size(cls, v):
+        if not (1 <= len(v) <= 500):
+            raise ValueError("Un lot doit contenir entre 1 et 500 mesures")
+        return v
+
 class MeasurementOut(BaseModel):
     id: int
     type: str
@@ -57,6 +87,89 @@ class MeasurementOut(BaseModel):
     confidence: Optional[float]
     timestamp: datetime
     notes: Optional[str]
+    # Renseignés à l'enregistrement, par rapport à la baseline personnelle (voir baselines.py)
+    z_score: Optional[float] = None
+    is_anomaly: Optional[bool] = None
+    # Points compactés (anciennes mesures) : moyenne de l'intervalle `resolution`
+    is_aggregate: bool = False
+    resolution: Optional[str] = None
+    sample_count: Optional[int] = None
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
+
+# ── Sync hors-ligne ───────────────────────────────────────────
+
+class SyncMeasurementIn(BaseModel):
+    client_id: UUID           # généré sur l'appareil : rejouer l'upload ne crée pas de doublon
+    type: MeasurementType
+    value: float
+    timestamp: datetime       # heure de la mesure sur l'appareil (obligatoire hors-ligne)
+    raw_data: Optional[dict] = None
+    notes: Optional[str] = None
+
+class SyncUpload(BaseModel):
+    measurements: List[SyncMeasurementIn] = []
+    deleted: List[UUID] = []  # client_id des mesures supprimées sur l'appareil
+
+    @validator('measurements', 'deleted')
+    def batch_size(cls, v):
+        if len(v) > 500:
+            raise ValueError("Maximum 500 éléments par lot")
+        return v
+
+class SyncUploadOut(BaseModel):
+    accepted: int             # nouvelles mesures insérées
+    duplicates: int           # déjà présentes (upload rejoué)
+    deleted: int
+    ids: dict                 # client_id → id serveur
+
+class SyncMeasurementOut(MeasurementOut):
+    client_id: Optional[str]
+
+class SyncTombstoneOut(BaseModel):
+    id: int                   # id serveur de la mesure supprimée
+    client_id: Optional[str]
+    deleted_at: datetime
+
+class SyncChangesOut(BaseModel):
+    measurements: List[SyncMeasurementOut]
+    deleted: List[SyncTombstoneOut]
+    cursor: str               # à renvoyer tel quel au prochain pull
+    has_more: bool
+
+
+# ── Références de population ──────────────────────────────────
+
+class PopulationPercentileOut(BaseModel):
+    type: str
+    value: float              # valeur comparée (par défaut : moyenne des 7 derniers jours)
+    band: str                 # tranche d'âge de comparaison, "all" = toute la population
+    percentile: float         # part de la population sous cette valeur (0–100)
+    sample_size: int          # jours-utilisateurs de la référence
+    through: date             # agrégats journaliers intégrés jusqu'à cette date
+    reference: dict           # p5, p25, p50, p75, p95 de la tranche
+
+
+# ── Imports d'exports tiers ───────────────────────────────────
+ImportFormat = Literal["apple_health", "csv"]
+
+class ImportOut(BaseModel):
+    id: int
+    format: str
+    status: str            # running | completed | failed
+    bytes_read: int
+    records_seen: int
+    imported: int
+    duplicates: int
+    skipped: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -68,6 +181,7 @@ class TemperatureEstimateInput(BaseModel):
     battery_temp: float   # T° batterie après contact cutané (°C)
     contact_time: int     # Durée contact peau-téléphone (secondes)
     ambient_temp: Optional[float] = 25.0  # T° avant contact (ambiante)
+    device_id: Optional[str] = None   # calibration propre à l'appareil (sinon celle de l'utilisateur)
 
     @validator('contact_time')
     def min_contact(cls, v):
@@ -81,11 +195,34 @@ class TemperatureEstimateInput(BaseModel):
             raise ValueError("battery_temp doit être entre 15°C et 60°C")
         return v
 
+    @validator('device_id')
+    def valid_device_id(cls, v):
+        if v is not None and len(v) > 64:
+            raise ValueError("device_id : 64 caractères maximum")
+        return v
+
 class TemperatureEstimateOut(BaseModel):
     estimated_temp: float
     confidence: float
     interpretation: str
     disclaimer: str = "Cette estimation est à titre informatif uniquement."
+    calibrated: bool = False
+
+class TemperatureCalibrationInput(TemperatureEstimateInput):
+    reference_temp: float   # T° mesurée au même moment par un thermomètre (°C)
+
+    @validator('reference_temp')
+    def valid_reference_temp(cls, v):
+        if not (34 <= v <= 43):
+            raise ValueError("reference_temp doit être entre 34°C et 43°C")
+        return v
+
+class TemperatureCalibrationOut(BaseModel):
+    device_id: str
+    samples: int
+    coefficients: List[float]   # α (ΔT), β (T° batterie), γ (log t), δ (offset)
+    predicted_before: float     # prédiction non bornée avant / après intégration
+    predicted_after: float
 
 
 # ── Estimates : HRV / Fréquence Cardiaque ────────────────────
@@ -123,6 +260,24 @@ class RespirationEstimateOut(BaseModel):
     disclaimer: str = "Cette estimation est à titre informatif uniquement."
 
 
+# ── Session de mesure (estimation + enregistrement) ──────────
+
+class MeasurementSessionIn(BaseModel):
+    type: Literal["temperature", "hrv", "respiration"]
+    temperature: Optional[TemperatureEstimateInput] = None   # requis si type = temperature
+    hrv: Optional[HRVInput] = None                           # requis si type = hrv
+    respiration: Optional[RespirationEstimateInput] = None   # requis si type = respiration
+    timestamp: Optional[datetime] = None
+    raw_data: Optional[dict] = None
+    notes: Optional[str] = None
+    client_id: Optional[UUID] = None  # rejouer la session ne crée pas de doublon
+
+class MeasurementSessionOut(BaseModel):
+    type: str
+    estimate: dict                     # même contenu que /estimate/{type}
+    measurements: List[MeasurementOut]  # mesures dérivées enregistrées
+
+
 # ── Sharing ───────────────────────────────────────────────────
 
 class ShareCreate(BaseModel):
@@ -133,6 +288,9 @@ class ShareOut(BaseModel):
     expires_at: datetime
     share_url: str
 
+class ShareListOut(ShareOut):
+    created_at: Optional[datetime] = None
+
 
 # ── API Keys ──────────────────────────────────────────────────
 
@@ -0,0 +1,100 @@
+"""
+Balayage des liens de partage expirés
+
+Un lien expiré est désactivé par le balayage (plus au moment où quelqu'un
+l'ouvre), puis supprimé SHARE_RETENTION_DAYS jours après son expiration :
+entre-temps, l'ouvrir répond 410 « expiré » plutôt que 404. La table ne
+garde ainsi que les liens vivants ou récents.
+
+Traitement par lots de SHARE_SWEEP_BATCH_SIZE lignes (sélection par l'index
+sur expires_at), planifié via l'outbox (jobs.py) ; exécution manuelle :
+    python -m shares
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+import models
+from jobs import enqueue, job
+
+SHARE_SWEEP_ENABLED = os.getenv("SHARE_SWEEP_ENABLED", "1") == "1"
+SHARE_RETENTION_DAYS = int(os.getenv("SHARE_RETENTION_DAYS", "30"))
+SHARE_SWEEP_BATCH_SIZE = int(os.getenv("SHARE_SWEEP_BATCH_SIZE", "1000"))
+SHARE_SWEEP_BATCHES_PER_JOB = 20
+SHARE_SWEEP_INTERVAL_SECONDS = int(os.getenv("SHARE_SWEEP_INTERVAL_SECONDS", "3600"))
+SHARE_SWEEP_JOB_KEY = "shares.sweep"
+
+
+def deactivate_expired(db: Session, now: datetime, limit: int = SHARE_SWEEP_BATCH_SIZE) -> int:
+    """Désactive au plus `limit` liens expirés encore actifs. Ne commit pas."""
+    T = models.ShareToken
+    ids = select(T.id).where(T.is_active == True, T.expires_at < now).limit(limit)
+    return db.execute(
+        update(T).where(T.id.in_(ids)).values(is_active=False).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def delete_expired(db: Session, now: datetime, limit: int = SHARE_SWEEP_BATCH_SIZE) -> int:
+    """Supprime au plus `limit` liens expirés depuis plus de SHARE_RETENTION_DAYS. Ne commit pas."""
+    T = models.ShareToken
+    ids = select(T.id).where(T.expires_at < now - timedelta(days=SHARE_RETENTION_DAYS)).limit(limit)
+    return db.execute(
+        delete(T).where(T.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def sweep_share_tokens(db: Session, now: datetime = None, max_batches: int = None,
+                       commit_each_batch: bool = False) -> dict:
+    """
+    Désactive puis supprime par lots. Avec `max_batches`, s'arrête après ce
+    nombre de lots ("done": False s'il en reste).
+    Les réponses en cache (routers/users.py) vérifient l'expiration elles-mêmes :
+    rien à invalider ici.
+    """
+    now = now or datetime.utcnow()
+    stats = {"deactivated": 0, "deleted": 0, "done": True}
+    batches = 0
+    for step, key in ((deactivate_expired, "deactivated"), (delete_expired, "deleted")):
+        while True:
+            if max_batches is not None and batches >= max_batches:
+                stats["done"] = False
+                return stats
+            count = step(db, now)
+            batches += 1
+            stats[key] += count
+            if commit_each_batch:
+                db.commit()
+            if count < SHARE_SWEEP_BATCH_SIZE:
+                break
+    return stats
+
+
+@job(SHARE_SWEEP_JOB_KEY)
+def _sweep_job(db: Session, payload: dict) -> None:
+    stats = sweep_share_tokens(db, max_batches=SHARE_SWEEP_BATCHES_PER_JOB)
+    delay = 0 if not stats["done"] else SHARE_SWEEP_INTERVAL_SECONDS
+    enqueue(db, SHARE_SWEEP_JOB_KEY, {}, dedupe_key=SHARE_SWEEP_JOB_KEY, delay_seconds=delay)
+
+
+def schedule_share_sweep(db: Session) -> None:
+    """Planifie le balayage périodique s'il ne l'est pas déjà (idempotent). Ne commit pas."""
+    enqueue(db, SHARE_SWEEP_JOB_KEY, {}, dedupe_key=SHARE_SWEEP_JOB_KEY)
+
+
+def main():
+    argparse.ArgumentParser(description="Balayage des liens de partage expirés BioMetrics").parse_args()
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        stats = sweep_share_tokens(db, commit_each_batch=True)
+    finally:
+        db.close()
+    print(f"✅ {stats['deactivated']} liens désactivés, {stats['deleted']} supprimés")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Coalescence des lectures identiques simultanées (« single-flight »)
+
+Quand un lien de partage circule dans un groupe, ou que plusieurs onglets
+rafraîchissent le tableau de bord en même temps, des centaines de requêtes
+identiques arrivent ensemble sur un cache froid. Par clé, un seul appelant
+(le « meneur ») exécute le calcul ; les autres attendent son résultat — ou
+son exception, relevée chez chacun — au plus `timeout` secondes
+(FlightTimeout au-delà, 503 côté API).
+
+    flights = SingleFlight()
+    flights.do(token, lambda: load(db, token))                  # handlers sync
+    await flights.do_async(token, lambda: load_async(token))    # handlers async
+
+Les deux formes partagent les mêmes vols : un handler async peut attendre un
+calcul lancé par un handler sync (threadpool), et inversement.
+Le résultat est partagé entre requêtes : il ne doit dépendre d'aucune session.
+LocalCache (cache.py) et la fenêtre récente (recent.py) coalescent ainsi leurs
+chargements : une rafale sur un même lien de partage = un seul jeu de requêtes.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", "10"))   # secondes
+
+
+class FlightTimeout(TimeoutError):
+    """Le calcul en cours pour cette clé n'a pas abouti dans le délai"""
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = SINGLEFLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._flights = {}   # clé → Future du calcul en cours
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def forget(self, key) -> None:
+        """
+        Après une écriture : les appels suivants ne rejoignent plus le calcul en
+        cours (lu avant l'écriture) ; ceux qui l'attendent déjà le reçoivent.
+        """
+        with self._lock:
+            self._flights.pop(key, None)
+
+    def forget_all(self) -> None:
+        with self._lock:
+            self._flights.clear()
+
+    def _join(self, key) -> tuple[Future, bool]:
+        """(vol de la clé, True si l'appelant le mène)"""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+            return future, True
+
+    def _land(self, key, future: Future, value=None, error: BaseException = None) -> None:
+        # Retiré avant de publier le résultat : un appel ultérieur relance un calcul frais
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def do(self, key, fn, timeout: float = None):
+        """Résultat de `fn()`, exécutée une seule fois pour les appels simultanés sur `key`"""
+        future, leader = self._join(key)
+        if leader:
+            try:
+                value = fn()
+            except BaseException as e:
+                self._land(key, future, error=e)
+                raise
+            self._land(key, future, value)
+            return value
+        try:
+            return future.result(self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            if future.done():
+                raise   # TimeoutError levée par le calcul lui-même
+            raise FlightTimeout(f"Calcul en cours pour {key!r} : délai dépassé") from None
+
+    async def do_async(self, key, fn, timeout: float = None):
+        """Comme do(), pour une coroutine `fn()` ; l'attente ne bloque pas la boucle"""
+        future, leader = self._join(key)
+        if leader:
+            try:
+                value = await fn()
+            except BaseException as e:
+                self._land(key, future, error=e)
+                raise
+            self._land(key, future, value)
+            return value
+        try:
+            # shield : un appelant qui abandonne n'annule pas le vol des autres
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                          self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            if future.done():
+                raise
+            raise FlightTimeout(f"Calcul en cours pour {key!r} : délai dépassé") from None
+
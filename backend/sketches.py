@@ -0,0 +1,138 @@
+"""
+Résumés statistiques fusionnables
+
+- TDigest : quantiles approchés (erreur relative faible aux extrémités p1/p99),
+  fusionnable : le digest d'une année = fusion des digests journaliers.
+- merge_moments : fusion de (n, moyenne, M2) de Welford (Chan et al.),
+  pour des moyenne / écart-type exacts sur n'importe quelle union de jours.
+
+Sérialisation compacte : centroïdes (moyenne, poids) en float32, ~0,5 Ko par digest.
+"""
+import math
+import struct
+
+_HEADER = struct.Struct("<BHddI")   # version, compression, min, max, nb de centroïdes
+_CENTROID = struct.Struct("<ff")
+_FORMAT_VERSION = 1
+
+
+class TDigest:
+    """t-digest « merging » (Dunning) : centroïdes triés, taille bornée par `compression`"""
+
+    def __init__(self, compression: int = 100):
+        self.compression = compression
+        self.centroids = []      # [(moyenne, poids)] triés par moyenne
+        self._buffer = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self) -> float:
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self._buffer)
+
+    def add(self, value: float, weight: float = 1) -> None:
+        self._buffer.append((value, weight))
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self.compress()
+
+    def merge(self, *others: "TDigest") -> "TDigest":
+        for other in others:
+            other.compress()
+            self._buffer.extend(other.centroids)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.compress()
+        return self
+
+    def compress(self) -> None:
+        if not self._buffer:
+            return
+        items = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(w for _, w in items)
+        merged = []
+        mean, weight = items[0]
+        cumulative = 0.0
+        # Échelle k1 : un centroïde couvre au plus une unité de k(q) → petits aux extrémités
+        k_limit = self._k(0.0) + 1
+        for next_mean, next_weight in items[1:]:
+            if self._k((cumulative + weight + next_weight) / total) <= k_limit:
+                mean = (mean * weight + next_mean * next_weight) / (weight + next_weight)
+                weight += next_weight
+            else:
+                merged.append((mean, weight))
+                cumulative += weight
+                k_limit = self._k(cumulative / total) + 1
+                mean, weight = next_mean, next_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(max(-1.0, min(1.0, 2 * q - 1)))
+
+    def quantile(self, q: float) -> float:
+        """Quantile q ∈ [0, 1], interpolé entre les centres des centroïdes"""
+        self.compress()
+        if not self.centroids:
+            return math.nan
+        if len(self.centroids) == 1 or q <= 0:
+            return self.min if q <= 0 else (self.max if q >= 1 else self.centroids[0][0])
+        if q >= 1:
+            return self.max
+        total = sum(w for _, w in self.centroids)
+        target = q * total
+        # Premier / dernier demi-centroïde : interpolation vers min / max
+        first_mean, first_weight = self.centroids[0]
+        if target < first_weight / 2:
+            return self.min + (first_mean - self.min) * target / (first_weight / 2)
+        last_mean, last_weight = self.centroids[-1]
+        if target > total - last_weight / 2:
+            return last_mean + (self.max - last_mean) * (target - (total - last_weight / 2)) / (last_weight / 2)
+
+        cumulative = first_weight / 2   # position du centre du centroïde courant
+        for (m0, w0), (m1, w1) in zip(self.centroids, self.centroids[1:]):
+            step = (w0 + w1) / 2
+            if target <= cumulative + step:
+                return m0 + (m1 - m0) * (target - cumulative) / step
+            cumulative += step
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        self.compress()
+        body = b"".join(_CENTROID.pack(m, w) for m, w in self.centroids)
+        return _HEADER.pack(_FORMAT_VERSION, self.compression, self.min, self.max, len(self.centroids)) + body
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "TDigest":
+        version, compression, minimum, maximum, n = _HEADER.unpack_from(blob)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Format de digest inconnu : v{version}")
+        digest = cls(compression)
+        digest.min, digest.max = minimum, maximum
+        digest.centroids = list(_CENTROID.iter_unpack(blob[_HEADER.size:_HEADER.size + n * _CENTROID.size]))
+        return digest
+
+
+def merge_moments(a: tuple, b: tuple) -> tuple:
+    """Fusion de deux (n, moyenne, M2) de Welford"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    mean = mean_a + delta * n_b / n
+    m2 = m2_a + m2_b + delta * delta * n_a * n_b / n
+    return n, mean, m2
+
+
+def exact_percentile(sorted_values: list, q: float) -> float:
+    """Percentile par interpolation linéaire, comme percentile_cont de PostgreSQL"""
+    if not sorted_values:
+        return math.nan
+    position = q * (len(sorted_values) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
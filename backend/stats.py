@@ -0,0 +1,311 @@
+"""
+Statistiques de distribution : nombre, moyenne, écart-type, min, max, percentiles
+
+Deux méthodes :
+- exacte   : sur les mesures brutes de la période — percentile_cont en SQL sur
+             PostgreSQL, tri en Python ailleurs (SQLite en dev). Périodes courtes.
+- sketch   : fusion des agrégats journaliers (moments de Welford + t-digest),
+             quelques centaines d'octets par jour : une année = ~365 lignes lues.
+
+Les agrégats journaliers sont tenus à jour après chaque écriture par le job
+"measurements.recorded" (apply_readings, avec les baselines) et recalculés pour
+le jour d'une suppression (invalidate_day).
+Initialisation depuis l'existant :
+    python -m stats --rebuild [--user-id 42]
+"""
+import argparse
+import math
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Float, cast, func, select
+from sqlalchemy.orm import Session
+
+import models
+from baselines import RECORDED_JOB
+from jobs import enqueue, job, skip_pending
+from sketches import TDigest, exact_percentile, merge_moments
+
+STATS_EXACT_MAX_DAYS = int(os.getenv("STATS_EXACT_MAX_DAYS", "31"))
+# Au-delà, les mesures brutes peuvent avoir été compactées (compaction.py)
+RAW_RETENTION_DAYS = 90
+
+
+# ──────────────────────────────────────────────────────────────
+# AGRÉGATS JOURNALIERS
+# ──────────────────────────────────────────────────────────────
+
+def _locked_day(db: Session, user_id: int, measurement_type: str, day: date) -> models.DailyAggregate:
+    """Agrégat du jour verrouillé (FOR UPDATE sur PostgreSQL), créé si absent"""
+    query = db.query(models.DailyAggregate).filter(
+        models.DailyAggregate.user_id == user_id,
+        models.DailyAggregate.type == measurement_type,
+        models.DailyAggregate.day == day
+    ).with_for_update()
+    aggregate = query.first()
+    if aggregate is not None:
+        return aggregate
+
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    db.execute(
+        insert(models.DailyAggregate)
+        .values(user_id=user_id, type=measurement_type, day=day, count=0, mean=0.0, m2=0.0)
+        .on_conflict_do_nothing(index_elements=["user_id", "type", "day"])
+    )
+    return query.first()
+
+
+def _fold(aggregate: models.DailyAggregate, values: list) -> None:
+    """Ajoute [(valeur, poids)] à un agrégat journalier"""
+    digest = TDigest.from_bytes(aggregate.digest) if aggregate.digest else TDigest()
+    moments = (aggregate.count, aggregate.mean, aggregate.m2)
+    for value, weight in values:
+        digest.add(value, weight)
+        moments = merge_moments(moments, (weight, value, 0.0))
+    aggregate.count, aggregate.mean, aggregate.m2 = moments
+    aggregate.min_value = digest.min
+    aggregate.max_value = digest.max
+    aggregate.digest = digest.to_bytes()
+    aggregate.updated_at = datetime.utcnow()
+
+
+def apply_readings(db: Session, user_id: int, readings: list) -> None:
+    """Intègre [(type, valeur, horodatage), ...] aux agrégats journaliers. Ne commit pas."""
+    groups = defaultdict(list)
+    for measurement_type, value, timestamp in readings:
+        groups[(measurement_type, timestamp.date())].append((value, 1))
+    for (measurement_type, day), values in sorted(groups.items()):
+        _fold(_locked_day(db, user_id, measurement_type, day), values)
+
+
+def rebuild_day(db: Session, user_id: int, measurement_type: str, day: date) -> None:
+    """Recalcule un agrégat journalier depuis les mesures (après une suppression). Ne commit pas."""
+    M = models.Measurement
+    aggregate = _locked_day(db, user_id, measurement_type, day)
+    aggregate.count, aggregate.mean, aggregate.m2, aggregate.digest = 0, 0.0, 0.0, None
+    start = datetime.combine(day, datetime.min.time())
+    rows = db.query(M.value, M.sample_count).filter(
+        M.user_id == user_id, M.type == measurement_type,
+        M.timestamp >= start, M.timestamp < start + timedelta(days=1)
+    ).all()
+    if rows:
+        _fold(aggregate, [(value, count or 1) for value, count in rows])
+    else:
+        db.delete(aggregate)
+
+
+# Jobs mis en file avant "measurements.recorded" (routers/measurements.py)
+@job("stats.daily")
+def _apply_daily(db: Session, payload: dict) -> None:
+    apply_readings(db, payload["user_id"], [
+        (t, v, datetime.fromisoformat(ts)) for t, v, ts in payload["readings"]
+    ])
+
+
+@job("stats.rebuild_day")
+def _rebuild_day(db: Session, payload: dict) -> None:
+    rebuild_day(db, payload["user_id"], payload["type"], date.fromisoformat(payload["day"]))
+
+
+def invalidate_day(db: Session, user_id: int, measurement_type: str, timestamp: datetime) -> None:
+    """Met en file le recalcul du jour d'une mesure supprimée (un seul job en attente par jour)"""
+    day = timestamp.date().isoformat()
+    enqueue(db, "stats.rebuild_day", {"user_id": user_id, "type": measurement_type, "day": day},
+            dedupe_key=f"stats.day:{user_id}:{measurement_type}:{day}")
+
+
+def rebuild_daily_aggregates(db: Session, user_id: int = None, batch_size: int = 5000,
+                             commit: bool = True) -> int:
+    """
+    Recalcule tous les agrégats journaliers en streaming trié. Retourne le nombre de jours écrits.
+    Un jour déjà versé aux références de population le reste (population.py) : pas de double compte.
+    """
+    A, M = models.DailyAggregate, models.Measurement
+    # Intégrations encore en file : leurs mesures sont lues ici (même transaction)
+    skip_pending(db, RECORDED_JOB, "daily", user_id)
+    skip_pending(db, "stats.daily", "daily", user_id)
+    delete = db.query(A)
+    integrated = db.query(A.user_id, A.type, A.day).filter(A.in_population == True)
+    query = db.query(M.user_id, M.type, M.timestamp, M.value, M.sample_count)
+    if user_id is not None:
+        delete = delete.filter(A.user_id == user_id)
+        integrated = integrated.filter(A.user_id == user_id)
+        query = query.filter(M.user_id == user_id)
+    integrated = set(integrated.all())
+    delete.delete(synchronize_session=False)
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, A):
+            db.expunge(obj)
+
+    written, pending = 0, []
+    current_key, values = None, []
+
+    def flush_day():
+        nonlocal written
+        if current_key is None:
+            return
+        aggregate = models.DailyAggregate(
+            user_id=current_key[0], type=current_key[1], day=current_key[2], count=0, mean=0.0, m2=0.0,
+            in_population=current_key in integrated
+        )
+        _fold(aggregate, values)
+        pending.append(aggregate)
+        written += 1
+
+    rows = query.order_by(M.user_id, M.type, M.timestamp).execution_options(yield_per=batch_size)
+    for uid, m_type, timestamp, value, sample_count in rows:
+        key = (uid, m_type, timestamp.date())
+        if key != current_key:
+            flush_day()
+            current_key, values = key, []
+        values.append((value, sample_count or 1))
+        if len(pending) >= batch_size:
+            db.add_all(pending)
+            db.flush()
+            pending.clear()
+    flush_day()
+    db.add_all(pending)
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return written
+
+
+# ──────────────────────────────────────────────────────────────
+# CALCUL
+# ──────────────────────────────────────────────────────────────
+
+def _summary(count, mean, stddev, minimum, maximum, percentiles: dict) -> dict:
+    def clean(value):
+        return None if value is None or (isinstance(value, float) and math.isnan(value)) else round(value, 3)
+    return {
+        "count": count,
+        "mean": clean(mean),
+        "stddev": clean(stddev),
+        "min": clean(minimum),
+        "max": clean(maximum),
+        "percentiles": {k: clean(v) for k, v in percentiles.items()},
+    }
+
+
+def _label(p: float) -> str:
+    return f"p{p:g}"
+
+
+def _empty(percentiles: tuple) -> dict:
+    return _summary(0, None, None, None, None, {_label(p): None for p in percentiles})
+
+
+def exact_stats(db: Session, user_id: int, types: list, start: datetime, end: datetime,
+                percentiles: tuple) -> dict:
+    M = models.Measurement
+    filters = [M.user_id == user_id, M.type.in_(types), M.resolution.is_(None)]
+    if start is not None:
+        filters.append(M.timestamp >= start)
+    if end is not None:
+        filters.append(M.timestamp < end)
+    result = {t: _empty(percentiles) for t in types}
+
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import ARRAY, array
+        fractions = cast(array([p / 100 for p in percentiles]), ARRAY(Float))
+        rows = db.execute(
+            select(
+                M.type, func.count(), func.avg(M.value), func.stddev_samp(M.value),
+                func.min(M.value), func.max(M.value),
+                func.percentile_cont(fractions).within_group(M.value)
+            ).where(*filters).group_by(M.type)
+        ).all()
+        for m_type, count, mean, stddev, minimum, maximum, values in rows:
+            result[m_type] = _summary(count, mean, stddev, minimum, maximum,
+                                      {_label(p): v for p, v in zip(percentiles, values)})
+        return result
+
+    values_by_type = defaultdict(list)
+    for m_type, value in db.execute(select(M.type, M.value).where(*filters).order_by(M.type, M.value)):
+        values_by_type[m_type].append(value)
+    for m_type, values in values_by_type.items():
+        n = len(values)
+        mean = sum(values) / n
+        stddev = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1)) if n > 1 else None
+        result[m_type] = _summary(n, mean, stddev, values[0], values[-1],
+                                  {_label(p): exact_percentile(values, p / 100) for p in percentiles})
+    return result
+
+
+def sketch_stats(db: Session, user_id: int, types: list, from_date: date, to_date: date,
+                 percentiles: tuple) -> dict:
+    A = models.DailyAggregate
+    query = db.query(A.type, A.count, A.mean, A.m2, A.digest).filter(A.user_id == user_id, A.type.in_(types))
+    if from_date is not None:
+        query = query.filter(A.day >= from_date)
+    if to_date is not None:
+        query = query.filter(A.day <= to_date)
+
+    moments = defaultdict(lambda: (0, 0.0, 0.0))
+    digests = defaultdict(list)
+    for m_type, count, mean, m2, digest in query:
+        moments[m_type] = merge_moments(moments[m_type], (count, mean, m2))
+        if digest:
+            digests[m_type].append(TDigest.from_bytes(digest))
+
+    result = {t: _empty(percentiles) for t in types}
+    for m_type, (n, mean, m2) in moments.items():
+        if n == 0:
+            continue
+        merged = TDigest().merge(*digests[m_type])
+        result[m_type] = _summary(
+            n, mean, math.sqrt(m2 / (n - 1)) if n > 1 else None, merged.min, merged.max,
+            {_label(p): merged.quantile(p / 100) for p in percentiles}
+        )
+    return result
+
+
+def choose_method(from_date: date, to_date: date, today: date = None) -> str:
+    """Exacte pour une période courte et récente (mesures encore brutes), sinon sketch"""
+    today = today or datetime.utcnow().date()
+    if from_date is None:
+        return "sketch"
+    span = ((to_date or today) - from_date).days + 1
+    if span > STATS_EXACT_MAX_DAYS or (today - from_date).days > RAW_RETENTION_DAYS:
+        return "sketch"
+    return "exact"
+
+
+def compute_stats(db: Session, user_id: int, types: list, from_date: date = None, to_date: date = None,
+                  percentiles: tuple = (5, 50, 95), method: str = "auto") -> tuple[str, dict]:
+    """Retourne (méthode utilisée, {type: statistiques})"""
+    if method == "auto":
+        method = choose_method(from_date, to_date)
+    if method == "exact":
+        start = datetime.combine(from_date, datetime.min.time()) if from_date else None
+        end = datetime.combine(to_date + timedelta(days=1), datetime.min.time()) if to_date else None
+        return method, exact_stats(db, user_id, types, start, end, percentiles)
+    return method, sketch_stats(db, user_id, types, from_date, to_date, percentiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrégats journaliers BioMetrics")
+    parser.add_argument("--rebuild", action="store_true", help="Recalculer depuis les mesures existantes")
+    parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        written = rebuild_daily_aggregates(db, args.user_id)
+    finally:
+        db.close()
+    print(f"✅ {written} agrégats journaliers reconstruits")
+
+
+if __name__ == "__main__":
+    main()
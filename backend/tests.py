@@ -11,6 +11,47 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 
+def _sqlite_client():
+    """TestClient branché sur une base SQLite en mémoire + un utilisateur authentifié"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from database import Base, get_db, get_public_read_db
+    from auth_utils import create_access_token, get_read_db, get_read_db_or_key
+    from cache import invalidation_bus
+    import models
+    import main
+
+    invalidation_bus.clear_all()  # une base neuve par test : ids réutilisés
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[get_db] = override_get_db
+    main.app.dependency_overrides[get_read_db] = override_get_db
+    main.app.dependency_overrides[get_read_db_or_key] = override_get_db
+    main.app.dependency_overrides[get_public_read_db] = override_get_db
+
+    db = Session()
+    user = models.User(email="test@example.com", name="Test", hashed_password="x", consent_given=True)
+    db.add(user)
+    db.commit()
+    token = create_access_token({"user_id": user.id, "email": user.email})
+    db.close()
+
+    client = TestClient(main.app)
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client, Session
+
+
 def test_temperature_estimation():
     """Tester le modèle d'estimation de température"""
     from routers.estimates import estimate_body_temperature, interpret_temperature
@@ -91,6 +132,1221 @@ def test_unit_mapping():
     print("✅ test_unit_mapping - PASSÉ")
 
 
+def test_benchmark_percentiles():
+    """Tester les statistiques de latence des benchmarks"""
+    from benchmarks.run import percentile, summarize
+
+    values = sorted(float(v) for v in range(1, 101))
+    assert percentile(values, 50) == 50.5
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 100) == 100.0
+    assert percentile([], 95) == 0.0
+
+    stats = summarize(list(range(1, 101)), elapsed_s=2.0, errors=3)
+    assert stats["requests"] == 100
+    assert stats["throughput_rps"] == 50.0
+    assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+
+    print("✅ test_benchmark_percentiles - PASSÉ")
+
+
+def test_benchmark_reset():
+    """Tester la remise à zéro des données de benchmark, clés étrangères actives"""
+    from datetime import date, datetime
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from benchmarks.seed import reset_bench_data, seed
+    import models
+
+    engine = create_engine("sqlite://")
+    event.listen(engine, "connect", lambda conn, _: conn.execute("PRAGMA foreign_keys=ON"))
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        seed(db, users=2, per_type=3)
+        uid = db.query(models.User.id).first().id
+        key = models.ApiKey(user_id=uid, name="bench", key="bm_bench")
+        db.add_all([key, models.MeasurementTombstone(user_id=uid, measurement_id=1),
+                    models.UserBaseline(user_id=uid, type="hr"),
+                    models.DailyAggregate(user_id=uid, type="hr", day=date(2026, 10, 1), count=1, mean=60.0, m2=0.0),
+                    models.TemperatureCalibration(user_id=uid, params=b""),
+                    models.ImportJob(user_id=uid, format="csv")])
+        db.flush()
+        db.add(models.ApiKeyUsage(api_key_id=key.id, bucket=datetime(2026, 10, 1), endpoint="GET /", requests=1))
+        db.commit()
+
+        reset_bench_data(db)
+        assert db.query(models.User).count() == 0 and db.query(models.ApiKeyUsage).count() == 0
+
+    print("✅ test_benchmark_reset - PASSÉ")
+
+
+def test_health_probes():
+    """Tester les sondes liveness/readiness sans base de données"""
+    import main
+
+    client = TestClient(main.app)  # sans `with` : pas de lifespan, pas de connexion
+    assert client.get("/health/live").status_code == 200
+
+    with patch("database.check_connection", return_value=False):
+        res = client.get("/health/ready")
+        assert res.status_code == 503
+        assert res.json()["database"] is False
+
+    with patch("database.check_connection", return_value=True):
+        assert client.get("/health/ready").status_code == 200
+
+    print("✅ test_health_probes - PASSÉ")
+
+
+def test_sync_upload_idempotent_and_pull():
+    """Tester l'upload idempotent (client_id), le pull par curseur avec tombstones et l'horizon de sécurité"""
+    import uuid
+    from datetime import datetime
+    import main
+    import models
+    from routers import sync
+
+    client, Session = _sqlite_client()
+    lag = sync.SYNC_SAFETY_LAG_SECONDS
+    sync.SYNC_SAFETY_LAG_SECONDS = 0
+    try:
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        batch = {"measurements": [
+            {"client_id": cid, "type": "hr", "value": 70 + i, "timestamp": "2026-10-01T08:00:00"}
+            for i, cid in enumerate(ids)
+        ]}
+        first = client.post("/api/v1/sync/upload", json=batch).json()
+        assert first["accepted"] == 3 and first["duplicates"] == 0
+
+        replay = client.post("/api/v1/sync/upload", json=batch).json()
+        assert replay["accepted"] == 0 and replay["duplicates"] == 3
+        assert replay["ids"] == first["ids"]
+
+        page = client.get("/api/v1/sync/changes", params={"limit": 2}).json()
+        assert len(page["measurements"]) == 2 and page["has_more"]
+        page = client.get("/api/v1/sync/changes", params={"cursor": page["cursor"], "limit": 2}).json()
+        assert len(page["measurements"]) == 1 and not page["has_more"]
+
+        client.post("/api/v1/sync/upload", json={"deleted": [ids[0]]})
+        delta = client.get("/api/v1/sync/changes", params={"cursor": page["cursor"]}).json()
+        assert delta["measurements"] == []
+        assert [d["client_id"] for d in delta["deleted"]] == [ids[0]]
+
+        # Commit dans le désordre : l'id 20 est visible avant l'id 19, encore en transaction
+        sync.SYNC_SAFETY_LAG_SECONDS = 60
+        fresh = dict(user_id=1, type="hr", value=80, timestamp=datetime(2026, 10, 2), created_at=datetime.utcnow())
+        with Session() as db:
+            db.add(models.Measurement(id=20, **fresh))
+            db.commit()
+        early = client.get("/api/v1/sync/changes", params={"cursor": delta["cursor"]}).json()
+        assert [m["id"] for m in early["measurements"]] == [20] and early["cursor"] == delta["cursor"]
+        assert sync.decode_cursor(client.get("/api/v1/sync/cursor").json()["cursor"])[0] < 19
+        with Session() as db:
+            db.add(models.Measurement(id=19, **fresh))
+            db.commit()
+        late = client.get("/api/v1/sync/changes", params={"cursor": early["cursor"]}).json()
+        assert [m["id"] for m in late["measurements"]] == [19, 20]   # rien de manqué
+    finally:
+        sync.SYNC_SAFETY_LAG_SECONDS = lag
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_sync_upload_idempotent_and_pull - PASSÉ")
+
+
+def test_measurement_session():
+    """Tester la session : estimation HRV + enregistrement hr/hrv en un appel, rejouable"""
+    import uuid
+    import main
+
+    client, _ = _sqlite_client()
+    try:
+        body = {
+            "type": "hrv",
+            "hrv": {"hr_samples": [72, 74, 70, 73, 75, 71, 72, 68, 74, 73]},
+            "client_id": str(uuid.uuid4()),
+        }
+        res = client.post("/api/v1/estimate/session", json=body)
+        assert res.status_code == 200, res.text
+        data = res.json()
+        assert "interpretation" in data["estimate"]
+        assert sorted(m["type"] for m in data["measurements"]) == ["hr", "hrv"]
+        assert all(m["confidence"] is not None for m in data["measurements"])
+
+        replay = client.post("/api/v1/estimate/session", json=body).json()
+        assert [m["id"] for m in replay["measurements"]] == [m["id"] for m in data["measurements"]]
+
+        missing = client.post("/api/v1/estimate/session", json={"type": "temperature"})
+        assert missing.status_code == 422
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_measurement_session - PASSÉ")
+
+
+def test_multi_type_history():
+    """Tester l'historique multi-types groupé, brut et agrégé par jour"""
+    import main
+
+    client, _ = _sqlite_client()
+    try:
+        client.post("/api/v1/measurements/batch", json={"measurements": [
+            {"type": "hr", "value": 60, "timestamp": "2026-10-01T08:00:00"},
+            {"type": "hr", "value": 80, "timestamp": "2026-10-01T20:00:00"},
+            {"type": "hr", "value": 70, "timestamp": "2026-10-02T08:00:00"},
+            {"type": "hrv", "value": 42, "timestamp": "2026-10-01T08:00:00"},
+        ]})
+
+        raw = client.get("/api/v1/measurements/history", params={"types": "hr,hrv,temperature", "limit": 2}).json()
+        assert [m["value"] for m in raw["series"]["hr"]] == [70, 80]  # 2 plus récentes
+        assert len(raw["series"]["hrv"]) == 1
+        assert raw["series"]["temperature"] == []
+
+        daily = client.get("/api/v1/measurements/history", params={"types": "hr", "bucket": "day"}).json()
+        oct_1 = daily["series"]["hr"][-1]
+        assert oct_1["count"] == 2 and oct_1["value"] == 70 and oct_1["min"] == 60 and oct_1["max"] == 80
+
+        # Limite par type appliquée en SQL ; sans `from`, fenêtre de `limit` jours avant la dernière mesure
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 50, "timestamp": "2025-01-01T08:00:00"})
+        recent = client.get("/api/v1/measurements/history", params={"types": "hr,hrv", "bucket": "day", "limit": 3}).json()
+        assert [p["timestamp"][:10] for p in recent["series"]["hr"]] == ["2026-10-02", "2026-10-01"]
+        assert len(recent["series"]["hrv"]) == 1
+        ranged = client.get("/api/v1/measurements/history",
+                            params={"types": "hr", "bucket": "day", "limit": 2, "from": "2024-01-01"}).json()
+        assert [p["timestamp"][:10] for p in ranged["series"]["hr"]] == ["2026-10-02", "2026-10-01"]
+        everything = client.get("/api/v1/measurements/history",
+                                params={"types": "hr", "bucket": "day", "from": "2024-01-01"}).json()
+        assert len(everything["series"]["hr"]) == 3
+
+        assert client.get("/api/v1/measurements/history", params={"types": "hr,foo"}).status_code == 422
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_multi_type_history - PASSÉ")
+
+
+def test_compression_middleware_streaming():
+    """Tester la compression : seuil de taille et réponses streamées"""
+    import gzip
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse, PlainTextResponse
+    from middleware import CompressionMiddleware
+
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/export")
+    def export():
+        return StreamingResponse((f"ligne {i},72.0\n" for i in range(1000)), media_type="text/csv")
+
+    client = TestClient(app)
+    res = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in res.headers
+
+    with client.stream("GET", "/export", headers={"Accept-Encoding": "gzip"}) as res:
+        assert res.headers["content-encoding"] == "gzip"
+        assert "content-length" not in res.headers  # toujours streamé
+        raw = b"".join(res.iter_raw())
+    assert gzip.decompress(raw).decode().count("\n") == 1000
+
+    print("✅ test_compression_middleware_streaming - PASSÉ")
+
+
+def test_columnar_encoding_shrinks_history():
+    """Tester l'encodage colonnaire delta : décodable et beaucoup plus compact"""
+    import json
+    from datetime import datetime, timedelta
+    from compact_encoding import encode_columnar
+
+    t0 = datetime(2026, 10, 1)
+    rows = [
+        {"id": 100 + i, "type": "hr", "value": 70.0 + i % 5, "unit": "bpm",
+         "timestamp": t0 + timedelta(minutes=20 * i)}
+        for i in range(504)  # une semaine, une mesure toutes les 20 min
+    ]
+    encoded = encode_columnar(rows)
+    cols = encoded["columns"]
+    assert encoded["count"] == 504
+    assert cols["unit"] == {"const": "bpm"}
+    assert cols["id"]["base"] == 100 and set(cols["id"]["delta"][1:]) == {1}
+    assert set(cols["timestamp"]["delta"][1:]) == {20 * 60 * 1000}
+
+    verbose = json.dumps(rows, default=str)
+    compact = json.dumps(encoded, separators=(",", ":"))
+    assert len(compact) * 5 < len(verbose)
+
+    print("✅ test_columnar_encoding_shrinks_history - PASSÉ")
+
+
+def test_replica_routing():
+    """Tester le routage lecture : réplique, read-your-writes, repli si réplique HS"""
+    import tempfile
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+    from database import ReplicaRouter
+
+    tmp = tempfile.mkdtemp()
+    primary = create_engine(f"sqlite:///{tmp}/primary.db")
+    replica = create_engine(f"sqlite:///{tmp}/replica.db")
+    for eng, name in ((primary, "primary"), (replica, "replica")):
+        with eng.begin() as conn:
+            conn.execute(text("CREATE TABLE whoami (name TEXT)"))
+            conn.execute(text(f"INSERT INTO whoami VALUES ('{name}')"))
+
+    Writer, Reader = sessionmaker(bind=primary), sessionmaker(bind=replica)
+    router = ReplicaRouter(Writer, Reader, replica, sticky_seconds=60)
+
+    def served_by(user_id):
+        with router.session_for(user_id) as db:
+            return db.execute(text("SELECT name FROM whoami")).scalar()
+
+    assert served_by(1) == "replica"
+    router.mark_write(1)
+    assert served_by(1) == "primary"   # read-your-writes
+    assert served_by(2) == "replica"   # autres utilisateurs inchangés
+
+    down = create_engine(f"sqlite:///{tmp}/absent/replica.db")  # dossier inexistant
+    broken = ReplicaRouter(Writer, sessionmaker(bind=down), down)
+    with broken.session_for(2) as db:
+        assert db.execute(text("SELECT name FROM whoami")).scalar() == "primary"
+
+    print("✅ test_replica_routing - PASSÉ")
+
+
+def test_baselines_welford_and_anomaly():
+    """Tester la baseline incrémentale (Welford) et le score d'anomalie à l'envoi"""
+    import statistics
+    from datetime import datetime, timedelta
+    from sqlalchemy import func
+    import compaction
+    import main
+    from baselines import welford_update, stddev, rebuild_baselines
+    from jobs import run_pending
+    import models
+
+    values = [61.0, 64.5, 59.0, 62.0, 63.5, 60.0, 61.5, 62.5, 60.5, 63.0]
+    count, mean, m2 = 0, 0.0, 0.0
+    for v in values:
+        count, mean, m2 = welford_update(count, mean, m2, v)
+    assert abs(mean - statistics.mean(values)) < 1e-9
+    assert abs(stddev(count, m2) - statistics.stdev(values)) < 1e-9
+
+    client, Session = _sqlite_client()
+    try:
+        batch = client.post("/api/v1/measurements/batch", json={"measurements": [
+            {"type": "hr", "value": v} for v in values
+        ]}).json()
+        assert batch[-1]["z_score"] is None  # baseline encore trop courte au 10e envoi
+        with Session() as db:                # un seul job par écriture
+            assert [j.kind for j in db.query(models.OutboxJob)] == ["measurements.recorded"]
+        assert run_pending(Session) == 1     # baselines + agrégats journaliers, en arrière-plan
+        with Session() as db:
+            assert db.query(models.UserBaseline).one().count == 10
+            assert db.query(models.DailyAggregate).one().count == 10
+
+        normal = client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 62}).json()
+        assert normal["is_anomaly"] is False
+        run_pending(Session)
+        spike = client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 120}).json()
+        assert spike["is_anomaly"] is True and spike["z_score"] > 3
+        run_pending(Session)
+
+        with Session() as db:
+            before = db.query(models.UserBaseline).one()
+            snapshot = (before.count, before.mean, before.m2)
+            assert rebuild_baselines(db) == 1
+            after = db.query(models.UserBaseline).one()
+            assert after.count == snapshot[0] == 12
+            assert abs(after.mean - snapshot[1]) < 1e-9 and abs(after.m2 - snapshot[2]) < 1e-6
+
+        # Mesure dont le job est encore en file : comptée une fois par le recalcul, pas deux
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 61})
+        with Session() as db:
+            rebuild_baselines(db, 1)
+        run_pending(Session)
+        with Session() as db:
+            assert db.query(models.UserBaseline).one().count == 13
+            assert db.query(func.sum(models.DailyAggregate.count)).scalar() == 13
+
+        # Historique compacté : les agrégats comptent pour leurs échantillons
+        old = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(days=120)
+        with Session() as db:
+            db.add_all(models.Measurement(user_id=1, type="hr", value=55.0 + i % 3,
+                                          timestamp=old + timedelta(minutes=i)) for i in range(20))
+            db.commit()
+            rebuild_baselines(db, 1)
+            raw = db.query(models.UserBaseline).one()
+            raw = (raw.count, raw.mean)
+            compaction.run_compaction(db)
+            db.commit()
+            assert db.query(models.Measurement).filter_by(resolution="hour").count() == 1
+            rebuild_baselines(db, 1)
+            compacted = db.query(models.UserBaseline).one()
+            assert compacted.count == raw[0] == 33 and abs(compacted.mean - raw[1]) < 1e-9
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_baselines_welford_and_anomaly - PASSÉ")
+
+
+def test_temperature_calibration_rls():
+    """Tester la calibration RLS par appareil, son stockage compact et le cache"""
+    import math
+    import main
+    from calibration import (
+        DEFAULT_COEFFICIENTS, initial_covariance, pack_params, unpack_params, calibration_cache,
+    )
+
+    theta, P = unpack_params(pack_params(DEFAULT_COEFFICIENTS, initial_covariance()))
+    assert tuple(theta) == DEFAULT_COEFFICIENTS and len(pack_params(theta, P)) == 113
+
+    # Appareil dont le thermistor lit ~1°C trop bas : le modèle par défaut sous-estime
+    def true_temp(battery, contact, ambient):
+        return 1.15 * (battery - ambient) + 0.52 * battery + 0.65 * math.log(contact) + 8.4 + 0.9
+
+    sessions = [(33.0 + 0.1 * i, 60 + 5 * i, 27.0 + 0.1 * (i % 4)) for i in range(15)]
+    client, _ = _sqlite_client()
+    calibration_cache.clear()
+    try:
+        probe = {"battery_temp": 33.4, "contact_time": 90, "ambient_temp": 27.2, "device_id": "pixel-7"}
+        default = client.post("/api/v1/estimate/temperature", json=probe).json()
+        assert default["calibrated"] is False
+
+        for battery, contact, ambient in sessions:
+            out = client.post("/api/v1/estimate/temperature/calibrate", json={
+                "battery_temp": battery, "contact_time": contact, "ambient_temp": ambient,
+                "device_id": "pixel-7", "reference_temp": round(true_temp(battery, contact, ambient), 2),
+            }).json()
+        assert out["samples"] == 15
+        assert abs(out["predicted_after"] - true_temp(battery, contact, ambient)) < 0.2
+
+        calibrated = client.post("/api/v1/estimate/temperature", json=probe).json()
+        expected = true_temp(33.4, 90, 27.2)
+        assert calibrated["calibrated"] is True
+        assert abs(calibrated["estimated_temp"] - expected) < abs(default["estimated_temp"] - expected)
+        assert calibration_cache.get(1) is not None  # estimations suivantes sans requête
+
+        other = client.post("/api/v1/estimate/temperature", json={**probe, "device_id": "autre"}).json()
+        assert other["calibrated"] is False
+
+        assert client.delete("/api/v1/estimate/temperature/calibrate").json()["deleted"] == 1
+        assert client.post("/api/v1/estimate/temperature", json=probe).json()["calibrated"] is False
+    finally:
+        main.app.dependency_overrides.clear()
+        calibration_cache.clear()
+
+    print("✅ test_temperature_calibration_rls - PASSÉ")
+
+
+def test_outbox_jobs_retry_and_runner():
+    """Tester l'outbox : déduplication, nouvel essai puis abandon, exécution par le pool async"""
+    import asyncio
+    from datetime import datetime, timedelta
+    from unittest.mock import patch
+    import jobs
+    import models
+
+    _, Session = _sqlite_client()
+    calls = []
+
+    @jobs.job("test.flaky")
+    def flaky(db, payload):
+        calls.append(payload["n"])
+        if payload.get("fail"):
+            raise RuntimeError("indisponible")
+
+    try:
+        with Session() as db:
+            jobs.enqueue(db, "test.flaky", {"n": 1}, dedupe_key="unique")
+            jobs.enqueue(db, "test.flaky", {"n": 2}, dedupe_key="unique")  # ignoré
+            jobs.enqueue(db, "test.flaky", {"n": 3, "fail": True})
+            db.commit()
+
+        assert jobs.run_pending(Session) == 2 and calls == [1, 3]
+        with Session() as db:
+            job = db.query(models.OutboxJob).one()  # seul le job en échec reste
+            assert job.attempts == 1 and job.status == "pending" and job.run_after > datetime.utcnow()
+            job.run_after = datetime.utcnow() - timedelta(seconds=1)
+            db.commit()
+
+        with patch("jobs.JOB_MAX_ATTEMPTS", 2):
+            jobs.run_pending(Session)
+        with Session() as db:
+            assert db.query(models.OutboxJob).one().status == "failed"
+            db.query(models.OutboxJob).delete()
+            db.commit()
+
+        # Un job périodique abandonné n'empêche pas de le replanifier
+        with Session() as db:
+            jobs.enqueue(db, "test.flaky", {"n": 4, "fail": True}, dedupe_key="periodic")
+            db.commit()
+        with patch("jobs.JOB_MAX_ATTEMPTS", 1):
+            jobs.run_pending(Session)
+        with Session() as db:
+            jobs.enqueue(db, "test.flaky", {"n": 5}, dedupe_key="periodic")
+            jobs.enqueue(db, "test.flaky", {"n": 6}, dedupe_key="periodic")  # ignoré : déjà en attente
+            db.commit()
+            assert sorted(j.status for j in db.query(models.OutboxJob)) == ["failed", "pending"]
+        assert jobs.run_pending(Session) == 1 and calls[-2:] == [4, 5]
+        with Session() as db:
+            db.query(models.OutboxJob).delete()
+            db.commit()
+        calls.clear()
+
+        # Deux workers sur une base fichier (connexions distinctes)
+        import tempfile
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from database import Base
+        shared = create_engine(f"sqlite:///{tempfile.mkdtemp()}/jobs.db", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=shared)
+        FileSession = sessionmaker(bind=shared)
+
+        async def scenario():
+            runner = jobs.JobRunner(FileSession, workers=2, poll_seconds=0.05)
+            await runner.start()
+            with FileSession() as db:
+                for n in range(10, 15):
+                    jobs.enqueue(db, "test.flaky", {"n": n})
+                db.commit()
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if len(calls) >= 5:
+                    break
+            await runner.stop()
+
+        asyncio.run(scenario())
+        assert sorted(calls) == [10, 11, 12, 13, 14]  # exactement une fois chacun
+    finally:
+        jobs.HANDLERS.pop("test.flaky", None)
+
+    print("✅ test_outbox_jobs_retry_and_runner - PASSÉ")
+
+
+def test_compaction_downsamples_old_measurements():
+    """Tester la compaction : agrégats horaires/journaliers pondérés, reprise, fusion tardive"""
+    from datetime import datetime, timedelta
+    import main
+    import models
+    import compaction
+    from jobs import run_pending
+
+    client, Session = _sqlite_client()
+    now = datetime(2026, 10, 19, 12, 0)
+    try:
+        with Session() as db:
+            old = datetime(2025, 9, 1, 0, 0)                       # > 365 jours → par jour
+            mid = datetime(2026, 6, 1, 0, 0)                       # > 90 jours → par heure
+            db.add_all(
+                [models.Measurement(user_id=1, type="hr", value=60 + i % 10, unit="bpm",
+                                    timestamp=old + timedelta(minutes=10 * i)) for i in range(288)]
+                + [models.Measurement(user_id=1, type="hr", value=70 + i % 6, unit="bpm",
+                                      timestamp=mid + timedelta(minutes=10 * i)) for i in range(60)]
+                + [models.Measurement(user_id=1, type="hr", value=65, unit="bpm",
+                                      timestamp=now - timedelta(days=1))]
+            )
+            db.commit()
+            raw_old_mean = sum(60 + i % 10 for i in range(144)) / 144
+
+            stats = compaction.run_compaction(db, now=now, max_chunks=1)
+            assert not stats["done"]
+            db.commit()
+            stats = compaction.run_compaction(db, now=now)  # reprise
+            db.commit()
+
+            rows = db.query(models.Measurement).order_by(models.Measurement.timestamp).all()
+            days = [r for r in rows if r.resolution == "day"]
+            hours = [r for r in rows if r.resolution == "hour"]
+            assert len(days) == 2 and len(hours) == 10 and rows[-1].resolution is None
+            assert days[0].sample_count == 144 and abs(days[0].value - raw_old_mean) < 1e-9
+            assert days[0].min_value == 60 and days[0].max_value == 69
+
+            assert compaction.run_compaction(db, now=now)["chunks"] == 0  # rien à refaire
+
+            # Mesure tardive (sync hors-ligne) dans une journée déjà compactée : fusionnée
+            db.add(models.Measurement(user_id=1, type="hr", value=100, unit="bpm", timestamp=old))
+            db.commit()
+            compaction.run_compaction(db, now=now)
+            db.commit()
+            merged = db.query(models.Measurement).filter_by(resolution="day", timestamp=old).one()
+            assert merged.sample_count == 145 and merged.max_value == 100
+
+        history = client.get("/api/v1/measurements/history/hr", params={"limit": 500}).json()
+        assert len(history) == 13 and sum(h["is_aggregate"] for h in history) == 12
+        buckets = client.get("/api/v1/measurements/history",
+                             params={"types": "hr", "bucket": "day", "from": "2025-01-01"}).json()
+        assert buckets["series"]["hr"][-1]["count"] == 145
+
+        with Session() as db:
+            compaction.schedule_compaction(db)
+            compaction.schedule_compaction(db)  # idempotent
+            db.commit()
+        assert run_pending(Session) == 1
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_compaction_downsamples_old_measurements - PASSÉ")
+
+
+def test_stats_exact_and_sketch():
+    """Tester les statistiques : percentiles exacts vs t-digest journaliers, suppression"""
+    import random
+    import statistics
+    from datetime import datetime, timedelta
+    import main
+    from jobs import run_pending
+    from sketches import TDigest, exact_percentile
+
+    rng = random.Random(7)
+    digest, values = TDigest(), sorted(rng.gauss(65, 8) for _ in range(5000))
+    for v in values:
+        digest.add(v)
+    restored = TDigest.from_bytes(digest.to_bytes())
+    for q in (0.05, 0.5, 0.95):
+        assert abs(restored.quantile(q) - exact_percentile(values, q)) < 0.5
+
+    client, Session = _sqlite_client()
+    try:
+        today = datetime.utcnow().replace(hour=12, minute=0, second=0, microsecond=0)
+        readings = [
+            {"type": "hr", "value": round(rng.gauss(62, 5), 1),
+             "timestamp": (today - timedelta(days=d, minutes=m)).isoformat()}
+            for d in range(10) for m in range(0, 600, 15)
+        ]
+        for i in range(0, len(readings), 200):
+            client.post("/api/v1/measurements/batch", json={"measurements": readings[i:i + 200]})
+        run_pending(Session)
+
+        params = {"types": "hr,hrv", "from": (today - timedelta(days=9)).date().isoformat(),
+                  "percentiles": "5,50,95"}
+        exact = client.get("/api/v1/measurements/stats", params=params).json()
+        sketch = client.get("/api/v1/measurements/stats", params={**params, "method": "sketch"}).json()
+        assert exact["method"] == "exact" and sketch["method"] == "sketch"
+
+        hr_values = sorted(r["value"] for r in readings)
+        e, k = exact["stats"]["hr"], sketch["stats"]["hr"]
+        assert e["count"] == k["count"] == len(readings)
+        assert abs(e["mean"] - statistics.mean(hr_values)) < 1e-3
+        assert abs(k["stddev"] - statistics.stdev(hr_values)) < 1e-3  # moments fusionnés : exacts
+        assert e["percentiles"]["p50"] == round(exact_percentile(hr_values, 0.5), 3)
+        for p in ("p5", "p50", "p95"):
+            assert abs(e["percentiles"][p] - k["percentiles"][p]) < 1.0
+        assert exact["stats"]["hrv"]["count"] == 0
+
+        history = client.get("/api/v1/measurements/history/hr", params={"limit": 1}).json()
+        client.delete(f"/api/v1/measurements/{history[0]['id']}")
+        run_pending(Session)
+        after = client.get("/api/v1/measurements/stats", params={**params, "method": "sketch"}).json()
+        assert after["stats"]["hr"]["count"] == len(readings) - 1
+
+        bad = client.get("/api/v1/measurements/stats", params={"types": "hr", "percentiles": "0,101"})
+        assert bad.status_code == 422
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_stats_exact_and_sketch - PASSÉ")
+
+
+def test_cache_invalidation_bus():
+    """Tester les caches locaux : invalidation au commit, TTL de repli, révocation de clé API"""
+    import time
+    from fastapi import HTTPException
+    import main
+    import models
+    from cache import InvalidationBus, LocalCache, publish
+    from routers.apikeys import get_user_from_api_key
+    from recent import recent_store
+
+    bus = InvalidationBus()
+    local = LocalCache("test", invalidated_by=("user",), ttl=300, fallback_ttl=0.05, bus=bus,
+                       tag_kinds=("api_key",))
+    local.set(1, "a")
+    assert local.effective_ttl == 0.05  # bus non connecté : TTL court
+    time.sleep(0.06)
+    assert local.get(1) is None
+    bus.connected = True
+    local.set(1, "a")
+    local.set("k", "b", tags=(("api_key", 7), ("user", 2)))
+    time.sleep(0.06)
+    assert local.get(1) == "a"
+    bus.receive('["api_key", 7]')  # événement d'un autre worker
+    assert local.get("k") is None and local.get(1) == "a"
+    # Valeur lue pendant une invalidation : pas remise en cache
+    assert local.get_or_load(2, lambda: bus.dispatch("user", 2) or "périmé") == "périmé"
+    assert local.get(2) is None
+    # L'invalidation d'une autre étiquette n'empêche pas la mise en cache
+    assert local.get_or_load(3, lambda: bus.dispatch("user", 99) or "frais") == "frais"
+    assert local.get(3) == "frais"
+
+    client, Session = _sqlite_client()
+    try:
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 60})
+        assert client.get("/api/v1/measurements/summary").json()["summary"]["hr"]["value"] == 60
+        assert 1 in recent_store
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 72})
+        assert client.get("/api/v1/measurements/summary").json()["summary"]["hr"]["value"] == 72
+
+        with Session() as db:  # rollback : pas d'invalidation
+            publish(db, "user_measurements", 1)
+            db.rollback()
+        assert 1 in recent_store
+
+        key = client.post("/api/v1/keys/", json={"name": "test"}).json()
+        with Session() as db:
+            assert get_user_from_api_key(key["key"], db).id == 1
+        client.delete(f"/api/v1/keys/{key['id']}")
+        with Session() as db:
+            with pytest.raises(HTTPException):
+                get_user_from_api_key(key["key"], db)
+
+        share = client.post("/api/v1/users/share", json={"duration_hours": 24}).json()
+        assert len(client.get(f"/api/v1/users/shared/{share['token']}").json()["measurements"]) == 2
+        client.delete(f"/api/v1/users/share/{share['token']}")
+        assert client.get(f"/api/v1/users/shared/{share['token']}").status_code == 404
+
+        with Session() as db:
+            db.query(models.User).filter(models.User.id == 1).update({"is_active": False})
+            publish(db, "user", 1)
+            db.commit()
+        assert client.get("/api/v1/auth/me").status_code == 401
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_cache_invalidation_bus - PASSÉ")
+
+
+def test_streaming_import():
+    """Tester l'import en streaming : Apple Health gzippé par morceaux, dédup même après compaction, CSV, mémoire bornée"""
+    import gzip
+    import io
+    import tracemalloc
+    from datetime import datetime, timedelta
+    import compaction
+    import main
+    import models
+    from importers import open_source, parse_apple_health
+    from jobs import run_pending
+
+    record = ('<Record type="HKQuantityTypeIdentifier{}" sourceName="Watch" unit="{}" '
+              'startDate="2024-03-01 08:{:02d}:00 +0100" endDate="2024-03-01 08:{:02d}:00 +0100" value="{}"/>')
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE HealthData [<!ELEMENT HealthData (Record)*>]>\n<HealthData locale="fr_FR">'
+        + "".join(record.format("HeartRate", "count/min", m, m, 60 + m % 10) for m in range(50))
+        + record.format("BodyTemperature", "degF", 0, 0, 98.6)
+        + record.format("DietaryWater", "mL", 0, 0, 250)
+        + "</HealthData>"
+    ).encode()
+
+    def chunks(data, size=100):
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+
+    client, Session = _sqlite_client()
+    try:
+        first = client.post("/api/v1/imports/", params={"format": "apple_health"},
+                            content=chunks(gzip.compress(xml)))
+        assert first.status_code == 201, first.text
+        out = first.json()
+        assert (out["status"], out["records_seen"], out["imported"], out["skipped"]) == ("completed", 52, 51, 1)
+        temperature = client.get("/api/v1/measurements/history/temperature").json()
+        assert temperature[0]["value"] == 37.0 and temperature[0]["timestamp"] == "2024-03-01T07:00:00"
+
+        again = client.post("/api/v1/imports/", params={"format": "apple_health"}, content=chunks(xml)).json()
+        assert (again["imported"], again["duplicates"]) == (0, 51)
+
+        google_fit = (b"Date,Start time,Average heart rate (bpm),Step count\n"
+                      b"2024-03-01,00:00:00.000+01:00,61.5,120\n2024-03-01,00:15:00.000+01:00,,80\n")
+        assert client.post("/api/v1/imports/", params={"format": "csv"}, content=google_fit).json()["imported"] == 3
+        bad = client.post("/api/v1/imports/", params={"format": "csv"}, content=b"foo,bar\n1,2\n")
+        assert bad.status_code == 422
+        listed = client.get("/api/v1/imports/").json()
+        assert [i["status"] for i in listed] == ["failed", "completed", "completed", "completed"]
+        assert client.get(f"/api/v1/imports/{out['id']}").json()["bytes_read"] == out["bytes_read"]
+
+        run_pending(Session)  # imports.finalize : baselines et agrégats recalculés
+        with Session() as db:
+            baseline = db.get(models.UserBaseline, (1, "hr"))
+            assert baseline is not None and baseline.count == 51
+
+        # Réimport après compaction : les mesures brutes (et leurs client_id) ont disparu
+        hour = (datetime.utcnow() - timedelta(days=120)).replace(minute=0, second=0, microsecond=0)
+        old_csv = "timestamp,hr\n" + "".join(f"{(hour + timedelta(minutes=m)).isoformat()},{60 + m % 5}\n"
+                                             for m in range(30))
+        for _ in range(2):
+            client.post("/api/v1/imports/", params={"format": "csv"}, content=old_csv.encode())
+        with Session() as db:
+            compaction.run_compaction(db)
+            db.commit()
+            again = client.post("/api/v1/imports/", params={"format": "csv"}, content=old_csv.encode()).json()
+            assert (again["imported"], again["duplicates"]) == (0, 30)
+            compaction.run_compaction(db)
+            db.commit()
+            compacted = db.query(models.Measurement).filter_by(user_id=1, timestamp=hour).one()
+            assert compacted.resolution == "hour" and compacted.sample_count == 30
+    finally:
+        main.app.dependency_overrides.clear()
+
+    # Mémoire bornée : l'arbre XML est vidé au fil de la lecture
+    class Export(io.RawIOBase):
+        def __init__(self, n):
+            self.parts = iter([b"<HealthData>"] + [
+                record.format("HeartRate", "count/min", i % 60, i % 60, i).encode() for i in range(n)
+            ] + [b"</HealthData>"])
+            self.pending = b""
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            self.pending = self.pending or next(self.parts, b"")
+            n = min(len(buffer), len(self.pending))
+            buffer[:n], self.pending = self.pending[:n], self.pending[n:]
+            return n
+
+    export = Export(10000)
+    tracemalloc.start()
+    stream, counter = open_source(export)
+    assert sum(1 for r in parse_apple_health(stream) if r) == 10000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert counter.bytes_read > 1_500_000 and peak < 1_000_000
+
+    print("✅ test_streaming_import - PASSÉ")
+
+
+def test_share_token_sweeper():
+    """Tester le balayage des liens expirés, la liste des liens actifs et les codes 404/410"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import text
+    import main
+    import models
+    import shares
+    from jobs import run_pending
+
+    client, Session = _sqlite_client()
+    try:
+        now = datetime.utcnow()
+        with Session() as db:
+            for token, expires_at, active in (("live", now + timedelta(hours=5), True),
+                                              ("soon", now + timedelta(hours=1), True),
+                                              ("revoked", now + timedelta(hours=5), False),
+                                              ("expired", now - timedelta(days=2), True),
+                                              ("ancient", now - timedelta(days=40), True)):
+                db.add(models.ShareToken(user_id=1, token=token, expires_at=expires_at, is_active=active))
+            db.commit()
+
+        listed = client.get("/api/v1/users/shares").json()
+        assert [s["token"] for s in listed] == ["soon", "live"]
+        assert client.get("/api/v1/users/shared/expired").status_code == 410
+        assert client.get("/api/v1/users/shared/revoked").status_code == 404
+        assert client.get("/api/v1/users/shared/live").status_code == 200
+
+        with Session() as db:
+            shares.schedule_share_sweep(db)
+            db.commit()
+            plan = " ".join(str(r) for r in db.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM share_tokens "
+                "WHERE user_id = 1 AND is_active = 1 AND expires_at > '2026-01-01' ORDER BY expires_at"
+            )))
+            assert "ix_share_tokens_user_active_expires" in plan
+        run_pending(Session, limit=1)
+        with Session() as db:
+            remaining = {t.token: t.is_active for t in db.query(models.ShareToken)}
+            assert remaining == {"live": True, "soon": True, "revoked": False, "expired": False}
+            assert db.query(models.OutboxJob).filter(models.OutboxJob.kind == "shares.sweep").count() == 1
+
+        assert client.get("/api/v1/users/shared/expired").status_code == 410  # toujours « expiré »
+        assert client.get("/api/v1/users/shared/ancient").status_code == 404
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_share_token_sweeper - PASSÉ")
+
+
+def test_recent_window():
+    """Tester la fenêtre récente en mémoire : hydratation, ajout au commit, éviction, repli sur la base"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import event
+    import main
+    import models
+    from cache import publish
+    from recent import RingBuffer, recent_store, to_micros
+
+    buffer = RingBuffer(capacity=3, complete_from=0)
+    for i, ts in enumerate([10, 30, 20, 40]):
+        buffer.add(i, ts, float(ts), None, False, "bpm")
+    assert list(buffer.timestamps) == [20, 30, 40] and buffer.complete_from == 11
+    assert buffer.row(2)[3] is None and buffer.unit == "bpm"
+
+    client, Session = _sqlite_client()
+    statements = []
+    event.listen(Session.kw["bind"], "before_cursor_execute", lambda *args: statements.append(args[2]))
+    try:
+        now = datetime.utcnow()
+        client.post("/api/v1/measurements/submit",
+                    json={"type": "hr", "value": 60, "timestamp": (now - timedelta(hours=1)).isoformat()})
+        with Session() as db:  # dernière mesure de température hors fenêtre
+            db.add(models.Measurement(user_id=1, type="temperature", value=36.6, unit="°C",
+                                      timestamp=now - timedelta(days=5)))
+            db.commit()
+        share = client.post("/api/v1/users/share", json={"duration_hours": 24}).json()
+
+        assert client.get("/api/v1/measurements/summary").json()["summary"]["temperature"]["value"] == 36.6
+        assert 1 in recent_store and recent_store.nbytes < 8 * 1024
+
+        # Fenêtre chaude : l'ajout au commit évite toute relecture des mesures
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 72})
+        statements.clear()
+        assert client.get("/api/v1/measurements/latest/hr").json()["value"] == 72
+        assert client.get("/api/v1/measurements/latest/steps").status_code == 404
+        assert client.get("/api/v1/measurements/summary").json()["summary"]["hr"]["value"] == 72
+        shared = client.get(f"/api/v1/users/shared/{share['token']}").json()["measurements"]
+        assert [m["value"] for m in shared] == [72, 60]
+        assert not [s for s in statements if "measurements" in s]
+
+        # Note : le texte n'est pas gardé en mémoire, lecture en base
+        client.post("/api/v1/measurements/submit", json={"type": "hrv", "value": 40, "notes": "au réveil"})
+        assert client.get("/api/v1/measurements/latest/hrv").json()["notes"] == "au réveil"
+
+        # Autre écriture (suppression) : fenêtre évincée puis réhydratée
+        latest_id = client.get("/api/v1/measurements/latest/hr").json()["id"]
+        client.delete(f"/api/v1/measurements/{latest_id}")
+        assert 1 not in recent_store
+        assert client.get("/api/v1/measurements/latest/hr").json()["value"] == 60
+
+        # Plus de points que la capacité : la période n'est plus couverte, lecture en base
+        with Session() as db:
+            rows = [models.Measurement(user_id=1, type="steps", value=i, unit="pas",
+                                       timestamp=now - timedelta(minutes=i)) for i in range(1, 81)]
+            db.add_all(rows)
+            db.flush()
+            recent_store.stage(db, 1, rows)
+            publish(db, "user_measurements", 1)
+            db.commit()
+        assert recent_store._windows[1].buffers["steps"].complete_from > to_micros(now - timedelta(hours=48))
+        shared = client.get(f"/api/v1/users/shared/{share['token']}").json()["measurements"]
+        assert len(shared) == 82
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_recent_window - PASSÉ")
+
+
+def test_singleflight_coalesces_burst():
+    """Tester la coalescence : une rafale sur un lien de partage = un seul jeu de requêtes"""
+    import asyncio
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import event
+    import main
+    from cache import invalidation_bus
+    from routers.users import get_shared_data
+    from singleflight import FlightTimeout, SingleFlight
+
+    # Erreur du meneur relevée chez tous ; délai d'attente par appel
+    flights = SingleFlight(timeout=5)
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait()
+        raise ValueError("base indisponible")
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "k", failing)
+        started.wait()
+        follower = pool.submit(flights.do, "k", lambda: "jamais appelé")
+        with pytest.raises(FlightTimeout):
+            flights.do("k", lambda: "jamais appelé", timeout=0.01)
+        release.set()
+        for f in (leader, follower):
+            with pytest.raises(ValueError):
+                f.result()
+    assert len(flights) == 0
+
+    # Handlers async : un seul calcul pour des appels simultanés
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def burst():
+        return await asyncio.gather(*(flights.do_async("a", load) for _ in range(50)))
+    assert asyncio.run(burst()) == ["ok"] * 50 and len(calls) == 1
+
+    client, Session = _sqlite_client()
+    try:
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 60})
+        token = client.post("/api/v1/users/share", json={"duration_hours": 24}).json()["token"]
+        invalidation_bus.clear_all()  # caches froids
+
+        statements = []
+
+        def slow(conn, cursor, statement, *args):
+            statements.append(statement)
+            if len(statements) == 1:  # écritures sans rapport pendant le chargement
+                invalidation_bus.dispatch("user_measurements", 12345)
+                invalidation_bus.dispatch("user", 999)
+            time.sleep(0.05)  # laisse la rafale s'accumuler derrière le meneur
+        event.listen(Session.kw["bind"], "before_cursor_execute", slow)
+
+        hits = 500
+        barrier = threading.Barrier(hits)
+
+        def hit(_):
+            barrier.wait()
+            with Session() as db:
+                return get_shared_data(token, db)
+        with ThreadPoolExecutor(hits) as pool:
+            bodies = list(pool.map(hit, range(hits)))
+        assert all(b["measurements"] == bodies[0]["measurements"] for b in bodies)
+        assert len(bodies[0]["measurements"]) == 1
+        # Lien + utilisateur, puis hydratation de la fenêtre récente (2 requêtes)
+        assert len(statements) <= 4, [s[:60] for s in statements]
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_singleflight_coalesces_burst - PASSÉ")
+
+
+def test_api_key_usage_metering():
+    """Tester le comptage d'usage par clé API : compteurs en mémoire, écriture par lots, séries"""
+    from sqlalchemy import event
+    import main
+    import models
+    from usage import usage_meter
+
+    client, Session = _sqlite_client()
+    try:
+        key = client.post("/api/v1/keys/", json={"name": "intégration"}).json()
+        other = client.post("/api/v1/keys/", json={"name": "autre"}).json()
+        bearer = client.headers.pop("Authorization")
+
+        writes = []
+        event.listen(Session.kw["bind"], "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: writes.append(statement)
+                     if not statement.lstrip().upper().startswith("SELECT") else None)
+        headers = {"X-API-Key": key["key"]}
+        client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 61}, headers=headers)
+        writes.clear()
+        for _ in range(3):
+            assert client.get("/api/v1/measurements/latest/hr", headers=headers).status_code == 200
+        assert client.get("/api/v1/measurements/latest/hrv", headers=headers).status_code == 404
+        assert client.get("/api/v1/measurements/latest/hr", headers={"X-API-Key": "bm_faux"}).status_code == 401
+        assert client.get("/api/v1/measurements/latest/hr").status_code == 403
+        # Une clé ne gère ni le compte, ni les partages, ni les clés
+        assert client.get("/api/v1/auth/me", headers=headers).status_code in (401, 403)
+        assert client.get("/api/v1/keys/", headers=headers).status_code in (401, 403)
+        assert client.post("/api/v1/keys/", json={"name": "escalade"}, headers=headers).status_code in (401, 403)
+        assert client.get("/api/v1/users/shares", headers=headers).status_code in (401, 403)
+        assert writes == []  # aucune écriture par requête
+        assert {endpoint for _, _, endpoint in usage_meter._counters} == {
+            "POST /api/v1/measurements/submit", "GET /api/v1/measurements/latest/{measurement_type}"
+        }  # (clé, minute, endpoint)
+
+        with Session() as db:
+            assert usage_meter.flush(db) >= 2
+            assert usage_meter.flush(db) == 0
+            assert db.get(models.ApiKey, key["id"]).last_used_at is not None
+        client.get("/api/v1/measurements/latest/hr", headers=headers)
+        with Session() as db:  # même minute (en général) : upsert additif
+            usage_meter.flush(db)
+
+        client.headers["Authorization"] = bearer
+        usage = client.get(f"/api/v1/keys/{key['id']}/usage").json()
+        assert usage["totals"]["requests"] == 6 and usage["totals"]["errors"] == 1
+        assert sum(p["requests"] for p in usage["series"]) == 6
+        top = usage["endpoints"][0]
+        assert top["endpoint"] == "GET /api/v1/measurements/latest/{measurement_type}" and top["requests"] == 5
+        daily = client.get(f"/api/v1/keys/{key['id']}/usage", params={"granularity": "day"}).json()
+        assert daily["totals"] == usage["totals"]
+        assert client.get(f"/api/v1/keys/{other['id']}/usage").json()["totals"]["requests"] == 0
+        assert client.get("/api/v1/keys/999/usage").status_code == 404
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_api_key_usage_metering - PASSÉ")
+
+
+def test_population_references():
+    """Tester les références de population : consentement, tranches d'âge, calcul incrémental, rang"""
+    import random
+    from datetime import datetime, timedelta
+    import main
+    import models
+    from population import backfill_user, percentile_rank, refresh_all, refresh_population_references
+
+    assert percentile_rank((0.0, 10.0, 20.0), 15.0) == 75.0
+    assert percentile_rank((0.0, 10.0, 20.0), -1.0) == 0.0 and percentile_rank((0.0, 10.0, 20.0), 99.0) == 100.0
+
+    rng = random.Random(44)
+    now = datetime.utcnow()
+    today = now.date()
+    client, Session = _sqlite_client()
+    try:
+        assert client.patch("/api/v1/auth/me", json={"birth_year": 1800}).status_code == 422
+        me = client.patch("/api/v1/auth/me", json={"birth_year": today.year - 35}).json()
+        assert me["birth_year"] == today.year - 35 and me["consent_given"] is True
+        assert client.get("/api/v1/population/percentile", params={"type": "hrv"}).status_code == 404
+
+        with Session() as db:
+            cohorts = [(today.year - 35, True, 50, 80), (today.year - 70, True, 30, 30), (today.year - 35, False, 500, 20)]
+            for birth_year, consent, center, size in cohorts:
+                for i in range(size):
+                    user = models.User(email=f"p{birth_year}-{consent}-{i}@example.com", name="P",
+                                       hashed_password="x", consent_given=consent, birth_year=birth_year)
+                    db.add(user)
+                    db.flush()
+                    db.add_all(models.DailyAggregate(user_id=user.id, type="hrv", day=today - timedelta(days=d),
+                                                     count=10, mean=rng.gauss(center, 8), m2=0.0,
+                                                     updated_at=now - timedelta(days=3, seconds=d))
+                               for d in range(2, 12))
+            # Encore susceptible de changer (< POPULATION_LAG_DAYS) : pas encore intégré
+            db.add(models.DailyAggregate(user_id=1, type="hrv", day=today - timedelta(days=5), count=10, mean=60.0, m2=0.0))
+            db.commit()
+
+            first = refresh_population_references(db, max_rows=300)
+            db.commit()
+            assert not first["done"] and first["samples"] == 300
+            rest = refresh_all(db)
+            assert first["samples"] + rest["samples"] == (80 + 30) * 10   # non-consentants exclus
+            assert refresh_population_references(db)["samples"] == 0
+
+            # Plus tard : import d'une journée ancienne (intégrée), journée déjà versée puis modifiée (pas recomptée)
+            elder = db.query(models.User).filter(models.User.birth_year == today.year - 70).first()
+            elder_id = elder.id
+            db.add(models.DailyAggregate(user_id=elder.id, type="hrv", day=today - timedelta(days=400),
+                                         count=10, mean=31.0, m2=0.0, updated_at=now))
+            revised = db.query(models.DailyAggregate).filter(models.DailyAggregate.user_id == elder.id).first()
+            revised.mean, revised.updated_at = 29.0, now
+            db.commit()
+            later = refresh_population_references(db, now=now + timedelta(days=3))
+            db.commit()
+            assert later["samples"] == 2   # l'import + la mesure de l'utilisateur 1
+
+        result = client.get("/api/v1/population/percentile", params={"type": "hrv", "value": 50}).json()
+        assert result["band"] == "30-39" and result["sample_size"] == 80 * 10 + 1
+        assert 35 < result["percentile"] < 65 and result["reference"]["p95"] < 100
+        mine = client.get("/api/v1/population/percentile", params={"type": "hrv"}).json()
+        assert mine["value"] == 60.0 and mine["percentile"] > result["percentile"]
+        client.patch("/api/v1/auth/me", json={"birth_year": None})
+        anyone = client.get("/api/v1/population/percentile", params={"type": "hrv", "value": 50}).json()
+        assert anyone["band"] == "all" and anyone["sample_size"] == 110 * 10 + 2
+        assert client.get("/api/v1/population/percentile", params={"type": "steps", "value": 5}).status_code == 404
+
+        # Agrégats recalculés (import, python -m stats) : les jours déjà versés ne sont pas recomptés
+        from stats import rebuild_daily_aggregates
+
+        def rebuild(days_later):   # horloge des refresh ci-dessus : filigrane déjà dans le futur
+            rebuild_daily_aggregates(db, elder_id)
+            db.query(models.DailyAggregate).filter_by(user_id=elder_id, type="hr").update(
+                {"updated_at": now + timedelta(days=days_later)})
+            db.commit()
+
+        with Session() as db:
+            db.add_all(models.Measurement(user_id=elder_id, type="hr", value=60.0 + d,
+                                          timestamp=now - timedelta(days=10 + d)) for d in range(5))
+            db.commit()
+            rebuild(2)
+            assert refresh_population_references(db, now=now + timedelta(days=5))["samples"] == 5
+            db.commit()
+            hr = db.query(models.PopulationReference).filter_by(type="hr", band="all").one()
+            assert hr.count == 5.0
+            rebuild(4)
+            assert refresh_population_references(db, now=now + timedelta(days=7))["samples"] == 0
+            db.commit()
+            db.refresh(hr)
+            assert hr.count == 5.0
+
+        # Consentement donné après coup : job de reprise de l'historique
+        client.patch("/api/v1/auth/me", json={"consent_given": False})
+        client.patch("/api/v1/auth/me", json={"consent_given": True})
+        with Session() as db:
+            assert db.query(models.OutboxJob).filter(models.OutboxJob.kind == "population.backfill_user").count() == 1
+            late = db.query(models.User).filter(models.User.consent_given == False).first()
+            late.consent_given = True
+            db.commit()
+            assert backfill_user(db, late.id) == 10
+            db.commit()
+            assert backfill_user(db, late.id) == 0
+    finally:
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_population_references - PASSÉ")
+
+
+def test_load_shedding():
+    """Tester le délestage : classes de priorité, limite AIMD, 503 + Retry-After, échéance de la requête"""
+    import time
+    import loadshed
+    import main
+    from loadshed import AdaptiveLimiter, classify, limiter
+
+    assert classify("POST", "/api/v1/measurements/submit")[:2] == ("ingest", "critical")
+    assert classify("GET", "/api/v1/measurements/history")[:2] == ("history", "low")
+    assert classify("GET", "/api/v1/measurements/latest/hr")[:2] == ("default", "normal")
+    assert classify("GET", "/health/ready")[:2] == ("health", "exempt")
+
+    aimd = AdaptiveLimiter(initial=10, min_limit=2, max_limit=20)
+    started = time.monotonic()
+    assert all(aimd.try_acquire("critical") for _ in range(5))
+    assert not aimd.try_acquire("low") and aimd.try_acquire("normal")   # low : 5 sur 10
+    aimd.release(started, overloaded=True)
+    assert aimd.limit == 9
+    aimd.release(started, overloaded=True)    # en vol avant la baisse : pas de nouvelle baisse
+    assert aimd.limit == 9
+    for _ in range(4):
+        assert aimd.try_acquire("critical")
+    aimd.release(time.monotonic(), overloaded=False)
+    assert 9 < aimd.limit < 9.2
+
+    client, Session = _sqlite_client()
+    saved = (limiter.limit, limiter.inflight)
+    try:
+        # Saturé : historiques refusés, ingestion et sondes passent
+        limiter.limit, limiter.inflight = 4.0, 2
+        response = client.get("/api/v1/measurements/history/hr")
+        assert response.status_code == 503 and response.headers["Retry-After"] == "10"
+        assert client.post("/api/v1/measurements/submit", json={"type": "hr", "value": 60}).status_code == 200
+        assert client.get("/health").status_code == 200
+        assert client.get("/health/ready").json()["load"]["inflight"] == 2
+        limiter.inflight = 0
+        assert client.get("/api/v1/measurements/history/hr").status_code == 200
+
+        # Échéance propagée jusqu'à la session (threadpool compris) : budget épuisé → 503
+        limiter.limit = 10.0
+        with patch.dict(loadshed.GROUPS, {"default": ("normal", 0.0)}):
+            response = client.get("/api/v1/imports/")
+        assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        assert limiter.limit == 9.0   # 503 en aval : baisse multiplicative
+        assert limiter.inflight == 0 and client.get("/api/v1/imports/").status_code == 200
+        with Session() as db:   # hors requête : pas d'échéance
+            assert db.query(main.database.Base.metadata.tables["users"]).count() == 1
+
+        # Import : ni échéance de requête ni retour de latence, une échéance par lot
+        assert classify("POST", "/api/v1/imports/") == ("bulk", "low", None)
+        limiter.limit = 10.0
+        csv = b"timestamp,hr\n2026-10-01T08:00:00,61\n"
+        with patch("middleware.loadshed.LOADSHED_LATENCY_RATIO", 0.0):   # toute requête « lente »
+            assert client.post("/api/v1/imports/", params={"format": "csv"}, content=csv).status_code == 201
+            assert limiter.limit == 10.0
+        with patch("importers.IMPORT_BATCH_SECONDS", 0.0):
+            client.post("/api/v1/imports/", params={"format": "csv"}, content=csv)
+        assert client.get("/api/v1/imports/").json()[0]["error"].startswith("DeadlineExceeded")
+    finally:
+        limiter.limit, limiter.inflight = saved
+        main.app.dependency_overrides.clear()
+
+    print("✅ test_load_shedding - PASSÉ")
+
+
 if __name__ == "__main__":
     print("\n🧪 Lancement des tests BioMetrics API\n")
     test_temperature_estimation()
@@ -98,4 +1354,26 @@ if __name__ == "__main__":
     test_hrv_computation()
     test_password_hashing()
     test_unit_mapping()
+    test_benchmark_percentiles()
+    test_benchmark_reset()
+    test_health_probes()
+    test_sync_upload_idempotent_and_pull()
+    test_measurement_session()
+    test_multi_type_history()
+    test_compression_middleware_streaming()
+    test_columnar_encoding_shrinks_history()
+    test_replica_routing()
+    test_baselines_welford_and_anomaly()
+    test_temperature_calibration_rls()
+    test_outbox_jobs_retry_and_runner()
+    test_compaction_downsamples_old_measurements()
+    test_stats_exact_and_sketch()
+    test_cache_invalidation_bus()
+    test_streaming_import()
+    test_share_token_sweeper()
+    test_recent_window()
+    test_singleflight_coalesces_burst()
+    test_api_key_usage_metering()
+    test_population_references()
+    test_load_shedding()
     print("\n✅ Tous les tests sont passés!")
@@ -0,0 +1,207 @@
+"""
+Comptage d'usage des clés API : appels, erreurs et latence par clé, endpoint et minute
+
+Aucune écriture par requête : le middleware (middleware/usage.py) incrémente
+des compteurs en mémoire, regroupés par minute. Chaque worker les écrit par
+lots toutes les USAGE_FLUSH_SECONDS (ou plus tôt au-delà de USAGE_MAX_PENDING
+compteurs) : upsert additif dans api_key_usage, et api_keys.last_used_at au
+passage. Les séries horaires / journalières de /keys/{id}/usage regroupent
+ces lignes.
+
+Un arrêt brutal du worker perd au plus les USAGE_FLUSH_SECONDS dernières
+secondes de comptage ; un arrêt normal les écrit.
+"""
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import desc, func, select, update
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from routers.measurements import bucket_expression
+
+logger = logging.getLogger("biometrics.usage")
+
+USAGE_METERING_ENABLED = os.getenv("USAGE_METERING_ENABLED", "1") == "1"
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+USAGE_MAX_PENDING = int(os.getenv("USAGE_MAX_PENDING", "50000"))
+_INSERT_CHUNK = 500
+
+
+def write_usage(db: Session, counters: dict, last_used: dict) -> int:
+    """
+    Ajoute {(clé, minute, endpoint): [appels, erreurs, latence]} à api_key_usage
+    (upsert additif : plusieurs workers écrivent les mêmes minutes). Ne commit pas.
+    Les compteurs d'une clé supprimée entre-temps sont abandonnés.
+    """
+    K, U = models.ApiKey, models.ApiKeyUsage
+    existing = set(db.scalars(select(K.id).where(K.id.in_({key for key, _, _ in counters}))))
+    rows = [
+        {"api_key_id": key, "bucket": minute, "endpoint": endpoint,
+         "requests": requests, "errors": errors, "latency_ms": latency_ms}
+        for (key, minute, endpoint), (requests, errors, latency_ms) in counters.items() if key in existing
+    ]
+
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    for i in range(0, len(rows), _INSERT_CHUNK):
+        stmt = insert(U).values(rows[i:i + _INSERT_CHUNK])
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["api_key_id", "bucket", "endpoint"],
+            set_={
+                "requests": U.requests + stmt.excluded.requests,
+                "errors": U.errors + stmt.excluded.errors,
+                "latency_ms": U.latency_ms + stmt.excluded.latency_ms,
+            },
+        ))
+
+    used = [{"id": key, "last_used_at": at} for key, at in last_used.items() if key in existing]
+    if used:
+        db.execute(update(K), used)   # UPDATE par clé primaire, en executemany
+    return len(rows)
+
+
+class UsageMeter:
+    """
+    Compteurs en mémoire du worker, écrits périodiquement par une tâche asyncio
+    (l'écriture elle-même passe dans le threadpool).
+    """
+
+    def __init__(self, session_factory=SessionLocal, enabled: bool = USAGE_METERING_ENABLED,
+                 flush_seconds: float = USAGE_FLUSH_SECONDS, max_pending: int = USAGE_MAX_PENDING):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._counters = {}   # (clé, minute, endpoint) → [appels, erreurs, latence ms]
+        self._last_used = {}  # clé → dernier appel
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def record(self, key_id: int, endpoint: str, status_code: int, latency_ms: float,
+               at: datetime = None) -> None:
+        at = at or datetime.utcnow()
+        bucket = (key_id, at.replace(second=0, microsecond=0), endpoint)
+        with self._lock:
+            counter = self._counters.get(bucket)
+            if counter is None:
+                counter = self._counters[bucket] = [0, 0, 0.0]
+            counter[0] += 1
+            if status_code >= 400:
+                counter[1] += 1
+            counter[2] += latency_ms
+            self._last_used[key_id] = at
+            full = len(self._counters) >= self.max_pending
+        if full:
+            self.wake()
+
+    def flush(self, db: Session = None) -> int:
+        """Écrit et vide les compteurs (remis en mémoire si l'écriture échoue)"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            last_used, self._last_used = self._last_used, {}
+        if not counters:
+            return 0
+        session = db or self.session_factory()
+        try:
+            written = write_usage(session, counters, last_used)
+            session.commit()
+            return written
+        except Exception:
+            session.rollback()
+            self._restore(counters, last_used)
+            raise
+        finally:
+            if db is None:
+                session.close()
+
+    def _restore(self, counters: dict, last_used: dict) -> None:
+        with self._lock:
+            for bucket, (requests, errors, latency_ms) in counters.items():
+                counter = self._counters.setdefault(bucket, [0, 0, 0.0])
+                counter[0] += requests
+                counter[1] += errors
+                counter[2] += latency_ms
+            for key_id, at in last_used.items():
+                self._last_used[key_id] = max(at, self._last_used.get(key_id, at))
+
+    # ── Écriture périodique ─────────────────────────────────────
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """Appelable depuis n'importe quel thread"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def stop(self) -> None:
+        """Arrête la tâche puis écrit les derniers compteurs"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+        try:
+            await run_in_threadpool(self.flush)
+        except Exception as e:
+            logger.warning("Compteurs d'usage non écrits à l'arrêt : %r", e)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await run_in_threadpool(self.flush)
+            except Exception as e:
+                logger.warning("Écriture des compteurs d'usage impossible (nouvel essai) : %r", e)
+
+
+usage_meter = UsageMeter()
+
+
+def usage_series(db: Session, key_id: int, granularity: str, start: datetime, end: datetime) -> dict:
+    """Appels, erreurs et latence moyenne par heure/jour et par endpoint sur [start, end["""
+    U = models.ApiKeyUsage
+    filters = (U.api_key_id == key_id, U.bucket >= start, U.bucket < end)
+    totals = (func.sum(U.requests), func.sum(U.errors), func.sum(U.latency_ms))
+
+    def point(requests, errors, latency_ms) -> dict:
+        return {"requests": requests, "errors": errors,
+                "avg_latency_ms": round(latency_ms / requests, 1) if requests else None}
+
+    period = bucket_expression(db.get_bind().dialect.name, granularity, U.bucket).label("period")
+    series, overall = [], [0, 0, 0.0]
+    for start_at, *sums in db.execute(select(period, *totals).where(*filters).group_by(period).order_by(period)):
+        if isinstance(start_at, str):  # SQLite : strftime retourne du texte
+            start_at = datetime.fromisoformat(start_at)
+        series.append({"timestamp": start_at, **point(*sums)})
+        overall = [a + b for a, b in zip(overall, sums)]
+
+    endpoints = [
+        {"endpoint": endpoint, **point(*sums)}
+        for endpoint, *sums in db.execute(
+            select(U.endpoint, *totals).where(*filters).group_by(U.endpoint).order_by(desc(totals[0]))
+        )
+    ]
+    return {"series": series, "endpoints": endpoints, "totals": point(*overall)}
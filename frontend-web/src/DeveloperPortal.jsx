@@ -138,6 +138,11 @@ const css = `
   .badge { font-size:10px; font-weight:700; padding:3px 8px; border-radius:100px; font-family:var(--mono); }
   .badge.active { background:rgba(0,255,136,0.1); color:var(--green); border:1px solid rgba(0,255,136,0.2); }
   .badge.revoked { background:rgba(255,68,102,0.1); color:var(--red); border:1px solid rgba(255,68,102,0.2); }
+  .usage-panel { margin-top:12px; padding-top:12px; border-top:1px solid var(--border); }
+  .usage-bars { display:flex; align-items:flex-end; gap:2px; height:48px; margin:10px 0; }
+  .usage-bar { flex:1; min-width:3px; background:var(--accent); opacity:0.7; border-radius:2px 2px 0 0; }
+  .usage-bar.err { background:var(--red); }
+  .usage-row { display:flex; justify-content:space-between; gap:12px; font-size:11px; font-family:var(--mono); color:var(--muted2); padding:2px 0; }
   .empty { text-align:center; padding:40px; color:var(--muted); font-size:14px; }
   .empty span { display:block; font-size:32px; margin-bottom:10px; }
 
@@ -1021,6 +1026,35 @@ function DocsPage() {
   );
 }
 
+// ─── USAGE D'UNE CLÉ ──────────────────────────────────────────────────────────
+function UsagePanel({ usage }) {
+  const { totals, series, endpoints } = usage;
+  const max = Math.max(1, ...series.map(p => p.requests));
+  return (
+    <div className="usage-panel">
+      <div className="usage-row">
+        <span>{totals.requests} appels · {totals.errors} erreurs (30 j)</span>
+        <span>{totals.avg_latency_ms != null ? `${totals.avg_latency_ms} ms en moyenne` : "—"}</span>
+      </div>
+      {series.length > 0 && (
+        <div className="usage-bars">
+          {series.map(p => (
+            <div key={p.timestamp} className={`usage-bar ${p.errors > p.requests / 2 ? "err" : ""}`}
+              style={{ height: `${(p.requests / max) * 100}%` }}
+              title={`${new Date(p.timestamp).toLocaleDateString("fr-FR")} : ${p.requests} appels, ${p.errors} erreurs`} />
+          ))}
+        </div>
+      )}
+      {endpoints.slice(0, 5).map(e => (
+        <div className="usage-row" key={e.endpoint}>
+          <span>{e.endpoint}</span>
+          <span>{e.requests} · {e.errors} err · {e.avg_latency_ms} ms</span>
+        </div>
+      ))}
+    </div>
+  );
+}
+
 // ─── PAGE API KEYS ────────────────────────────────────────────────────────────
 function ApiKeysPage({ user }) {
   const [keys, setKeys] = useState([]);
@@ -1028,6 +1062,7 @@ function ApiKeysPage({ user }) {
   const [newKey, setNewKey] = useState(null);
   const [loading, setLoading] = useState(false);
   const [lang, setLang] = useState("javascript");
+  const [usage, setUsage] = useState({});
   const { copy, ToastEl } = useCopy();
 
   const loadKeys = useCallback(async () => {
@@ -1051,6 +1086,15 @@ function ApiKeysPage({ user }) {
     try { await apiFetch(`/keys/${id}`, { method: "DELETE" }); loadKeys(); } catch (e) { alert(e.message); }
   };
 
+  // Usage des 30 derniers jours (compteurs écrits par lots côté API : ~30 s de décalage)
+  const toggleUsage = async (id) => {
+    if (usage[id]) { setUsage(u => ({ ...u, [id]: null })); return; }
+    try {
+      const data = await apiFetch(`/keys/${id}/usage?granularity=day`);
+      setUsage(u => ({ ...u, [id]: data }));
+    } catch (e) { alert(e.message); }
+  };
+
   const displayKey = newKey ? newKey.key : (keys.find(k => k.is_active)?.key || "bm_votre_cle_ici");
 
   return (
@@ -1097,8 +1141,12 @@ function ApiKeysPage({ user }) {
                 Créée le {new Date(k.created_at).toLocaleDateString("fr-FR")}
                 {k.last_used_at && ` · Utilisée le ${new Date(k.last_used_at).toLocaleDateString("fr-FR")}`}
               </div>
+              {usage[k.id] && <UsagePanel usage={usage[k.id]} />}
+            </div>
+            <div style={{ display: "flex", gap: 8 }}>
+              <button className="btn sm" onClick={() => toggleUsage(k.id)}>{usage[k.id] ? "Masquer" : "Usage"}</button>
+              {k.is_active && <button className="btn danger sm" onClick={() => revokeKey(k.id)}>Révoquer</button>}
             </div>
-            {k.is_active && <button className="btn danger sm" onClick={() => revokeKey(k.id)}>Révoquer</button>}
           </div>
         ))
       }
@@ -40,12 +40,13 @@ export function AuthProvider({ children }) {
     return userData;
   }, []);
 
-  const register = useCallback(async (email, password, name) => {
+  const register = useCallback(async (email, password, name, birthYear = null) => {
     const res = await authAPI.register({
       email,
       password,
       name,
       consent_given: true,
+      birth_year: birthYear,
     });
     const { access_token, user: userData } = res.data;
     saveSession(access_token, userData);
@@ -61,6 +61,37 @@ export function useMeasurementHistory(type, from, to) {
   return { data, loading, error };
 }
 
+/**
+ * Hook pour l'historique de plusieurs types en un seul appel API
+ * (le Dashboard charge tous ses graphiques avec une seule requête)
+ */
+export function useMultiHistory(types, from, to, bucket) {
+  const [series, setSeries] = useState({});
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState(null);
+  const typesKey = types.join(',');
+
+  useEffect(() => {
+    if (!typesKey) return;
+
+    const fetch = async () => {
+      try {
+        setLoading(true);
+        const res = await measurementsAPI.getMultiHistory(typesKey.split(','), from, to, bucket);
+        setSeries(res.data.series);
+      } catch (err) {
+        setError(err.response?.data?.detail || "Erreur");
+      } finally {
+        setLoading(false);
+      }
+    };
+
+    fetch();
+  }, [typesKey, from, to, bucket]);
+
+  return { series, loading, error };
+}
+
 /**
  * Hook pour soumettre une mesure
  */
@@ -36,6 +36,7 @@ export default function AuthPage() {
   const [email, setEmail] = useState('');
   const [password, setPassword] = useState('');
   const [name, setName] = useState('');
+  const [birthYear, setBirthYear] = useState('');
   const [consent, setConsent] = useState(false);
   const [error, setError] = useState('');
   const [loading, setLoading] = useState(false);
@@ -76,7 +77,7 @@ export default function AuthPage() {
       if (isLogin) {
         await login(email, password);
       } else {
-        await register(email.trim(), password, name.trim());
+        await register(email.trim(), password, name.trim(), birthYear ? Number(birthYear) : null);
       }
       navigate('/dashboard');
     } catch (err) {
@@ -128,6 +129,23 @@ export default function AuthPage() {
             </div>
           )}
 
+          {!isLogin && (
+            <div className="form-group">
+              <label htmlFor="birthYear">Année de naissance (facultatif)</label>
+              <input
+                id="birthYear"
+                type="number"
+                value={birthYear}
+                onChange={(e) => setBirthYear(e.target.value)}
+                placeholder="Ex: 1990 — comparaison anonyme à votre tranche d'âge"
+                min="1900"
+                max={new Date().getFullYear()}
+                autoComplete="bday-year"
+                disabled={loading}
+              />
+            </div>
+          )}
+
           <div className="form-group">
             <label htmlFor="email">Email</label>
             <input
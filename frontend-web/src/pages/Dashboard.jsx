@@ -9,8 +9,9 @@ import {
   AreaChart, Area, XAxis, YAxis, CartesianGrid,
   Tooltip, ResponsiveContainer, ReferenceLine
 } from 'recharts';
-import { useMeasurements, useMeasurementHistory } from '../hooks/useMeasurements';
+import { useMeasurements, useMultiHistory } from '../hooks/useMeasurements';
 import { useAuth } from '../contexts/AuthContext';
+import { populationAPI } from '../utils/api';
 
 // ── Constantes médicales de référence ─────────────────────────
 const REFERENCES = {
@@ -98,10 +99,7 @@ function formatTimeAgo(date) {
 }
 
 // ── Graphique historique ───────────────────────────────────────
-function HistoryChart({ type, label, color, unit }) {
-  const today = new Date().toISOString().split('T')[0];
-  const weekAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
-  const { data, loading } = useMeasurementHistory(type, weekAgo, today);
+function HistoryChart({ type, label, color, unit, data = [], loading }) {
   const ref = REFERENCES[type];
 
   const chartData = data.slice().reverse().map((m) => ({
@@ -210,12 +208,56 @@ function HealthSummary({ metrics }) {
   );
 }
 
+// ── Comparaison aux personnes de son âge ───────────────────────
+const POPULATION_TYPES = [
+  { type: 'hrv', label: 'HRV', icon: '💓' },
+  { type: 'hr',  label: 'FC au repos', icon: '❤️' },
+];
+
+function PopulationComparison() {
+  const [results, setResults] = useState([]);
+
+  useEffect(() => {
+    // 404 = pas de mesure récente ou référence encore trop petite : type masqué
+    Promise.all(POPULATION_TYPES.map(t =>
+      populationAPI.percentile(t.type).then(r => ({ ...t, ...r.data })).catch(() => null)
+    )).then(all => setResults(all.filter(Boolean)));
+  }, []);
+
+  if (results.length === 0) return null;
+
+  return (
+    <section className="section">
+      <h2 className="section-title">👥 Vous et les personnes de votre âge</h2>
+      <ul className="population-list">
+        {results.map(r => (
+          <li key={r.type}>
+            <span>{r.icon}</span>
+            <span>
+              {r.label} (moyenne 7 j : {r.value}) supérieure à <strong>{Math.round(r.percentile)} %</strong>
+              {r.band === 'all' ? ' des utilisateurs' : ` des ${r.band} ans`}
+              <span className="population-list__hint"> — médiane {r.reference.p50}, {r.sample_size} jours-utilisateurs</span>
+            </span>
+          </li>
+        ))}
+      </ul>
+    </section>
+  );
+}
+
 // ── Dashboard principal ────────────────────────────────────────
+const CHART_TYPES = ['temperature', 'hr', 'hrv', 'respiration'];
+
 export default function Dashboard() {
   const { user, logout } = useAuth();
   const { summary, loading, refresh } = useMeasurements();
   const [disclaimer, setDisclaimer] = useState(true);
 
+  // Tous les graphiques 7 jours en un seul appel API
+  const today = new Date().toISOString().split('T')[0];
+  const weekAgo = new Date(Date.now() - 7 * 24 * 60 * 60 * 1000).toISOString().split('T')[0];
+  const history = useMultiHistory(CHART_TYPES, weekAgo, today);
+
   // Rafraîchissement automatique toutes les 30s
   useEffect(() => {
     const interval = setInterval(refresh, 30000);
@@ -311,14 +353,21 @@ export default function Dashboard() {
           </div>
         </section>
 
+        {/* Références de population */}
+        <PopulationComparison />
+
         {/* Graphiques */}
         <section className="section">
           <h2 className="section-title">📈 Historique — 7 jours</h2>
           <div className="charts-grid">
-            <HistoryChart type="temperature" label="Température" color="#f97316" unit="°C" />
-            <HistoryChart type="hr"          label="Fréquence cardiaque" color="#ef4444" unit="bpm" />
-            <HistoryChart type="hrv"         label="HRV (RMSSD)" color="#a855f7" unit="ms" />
-            <HistoryChart type="respiration" label="Respiration" color="#3b82f6" unit="r/min" />
+            <HistoryChart type="temperature" label="Température" color="#f97316" unit="°C"
+              data={history.series.temperature} loading={history.loading} />
+            <HistoryChart type="hr"          label="Fréquence cardiaque" color="#ef4444" unit="bpm"
+              data={history.series.hr} loading={history.loading} />
+            <HistoryChart type="hrv"         label="HRV (RMSSD)" color="#a855f7" unit="ms"
+              data={history.series.hrv} loading={history.loading} />
+            <HistoryChart type="respiration" label="Respiration" color="#3b82f6" unit="r/min"
+              data={history.series.respiration} loading={history.loading} />
           </div>
         </section>
 
@@ -61,6 +61,7 @@ export const authAPI = {
   register: (data) => api.post('/auth/register', data),
   login:    (data) => api.post('/auth/login', data),
   getMe:    ()     => api.get('/auth/me'),
+  updateMe: (data) => api.patch('/auth/me', data),
   deleteAccount: () => api.delete('/auth/me'),
 };
 
@@ -69,6 +70,9 @@ export const measurementsAPI = {
   submit:     (data)           => api.post('/measurements/submit', data),
   getLatest:  (type)           => api.get(`/measurements/latest/${type}`),
   getHistory: (type, from, to) => api.get(`/measurements/history/${type}`, { params: { from, to } }),
+  // Plusieurs types en un seul appel : { series: { hr: [...], hrv: [...] } }
+  getMultiHistory: (types, from, to, bucket) =>
+    api.get('/measurements/history', { params: { types: types.join(','), from, to, bucket } }),
   getSummary: ()               => api.get('/measurements/summary'),
   delete:     (id)             => api.delete(`/measurements/${id}`),
 };
@@ -82,8 +86,15 @@ export const estimatesAPI = {
 // ---- Sharing ----
 export const sharingAPI = {
   createLink: (hours) => api.post('/users/share', { duration_hours: hours }),
+  listActive: ()      => api.get('/users/shares'),
   getShared:  (token) => api.get(`/users/shared/${token}`),
   revoke:     (token) => api.delete(`/users/share/${token}`),
 };
 
+// ---- Population (références anonymes) ----
+export const populationAPI = {
+  // value omise : moyenne des 7 derniers jours
+  percentile: (type, value) => api.get('/population/percentile', { params: { type, value } }),
+};
+
 export default api;
@@ -14,7 +14,8 @@ import {
   Animated, Alert, Platform
 } from 'react-native';
 import { CameraView, useCameraPermissions } from 'expo-camera';
-import { measurementsAPI, estimatesAPI } from '../utils/api';
+import { estimatesAPI } from '../utils/api';
+import { enqueueMeasurement, flushQueue } from '../utils/syncQueue';
 
 const MEASURE_DURATION = 30; // secondes
 const FRAME_RATE = 30; // fps
@@ -260,39 +261,40 @@ export default function HeartRateScreen() {
       return;
     }
 
-    try {
-      // Calculer HRV via l'API backend si on a assez de données
-      let interpretation = '';
-      try {
-        const hrSamples = peaks.slice(1).map((p, i) =>
-          Math.round(60000 / (((p - peaks[i]) / sampleRate) * 1000))
-        ).filter(h => h >= 40 && h <= 200);
+    const rawData = { signal_length: signal.length, peaks_count: peaks.length, sample_rate: Math.round(sampleRate), method: 'ppg_camera' };
+    const hrSamples = peaks.slice(1).map((p, i) =>
+      Math.round(60000 / (((p - peaks[i]) / sampleRate) * 1000))
+    ).filter(h => h >= 40 && h <= 200);
 
-        if (hrSamples.length >= 2) {
-          const hrvRes = await estimatesAPI.estimateHRV(hrSamples);
-          interpretation = hrvRes.data.interpretation;
-        }
-      } catch (_) {}
-
-      // Sauvegarder
-      await measurementsAPI.submit({
-        type: 'hr',
-        value: hr,
-        timestamp: new Date().toISOString(),
-        raw_data: { signal_length: signal.length, peaks_count: peaks.length, sample_rate: Math.round(sampleRate), method: 'ppg_camera' },
-      });
-      if (hrv_rmssd) {
-        await measurementsAPI.submit({
+    try {
+      if (hrSamples.length >= 2) {
+        // HRV calculée et hr + hrv enregistrées en un seul appel
+        const res = await estimatesAPI.session({
           type: 'hrv',
-          value: hrv_rmssd,
+          hrv: { hr_samples: hrSamples },
           timestamp: new Date().toISOString(),
+          raw_data: rawData,
         });
+        setResult({ hr, hrv_rmssd, confidence, interpretation: res.data.estimate.interpretation });
+        setPhase('result');
+        return;
       }
+    } catch (_) {
+      // Réseau indisponible : on bascule sur la file hors-ligne ci-dessous
+    }
+
+    try {
+      // Sauvegarder : d'abord en local (jamais perdu), puis synchronisation
+      await enqueueMeasurement({ type: 'hr', value: hr, raw_data: rawData });
+      if (hrv_rmssd) {
+        await enqueueMeasurement({ type: 'hrv', value: hrv_rmssd });
+      }
+      await flushQueue();
 
-      setResult({ hr, hrv_rmssd, confidence, interpretation });
+      setResult({ hr, hrv_rmssd, confidence, interpretation: '' });
       setPhase('result');
     } catch (error) {
-      Alert.alert('Erreur réseau', 'Mesure calculée mais non sauvegardée.');
+      Alert.alert('Hors ligne', 'Mesure enregistrée sur le téléphone, elle sera synchronisée au retour du réseau.');
       setResult({ hr, hrv_rmssd, confidence, interpretation: '' });
       setPhase('result');
     }
@@ -19,7 +19,7 @@ import {
   Animated, Alert
 } from 'react-native';
 import { Audio } from 'expo-av';
-import { measurementsAPI } from '../utils/api';
+import { estimatesAPI } from '../utils/api';
 
 const MEASURE_DURATION = 45; // secondes
 const RMS_INTERVAL_MS = 100; // échantillonnage toutes les 100ms = 10 Hz
@@ -254,14 +254,19 @@ export default function RespirationScreen() {
     }
 
     try {
-      await measurementsAPI.submit({
+      // Validation + enregistrement (confiance ajustée au bruit) en un seul appel
+      await estimatesAPI.session({
         type: 'respiration',
-        value: rr,
+        respiration: {
+          respiration_rate: rr,
+          peaks_count: peaks.length,
+          duration: MEASURE_DURATION,
+          noise_level: noiseLevel,
+          confidence,
+        },
         timestamp: new Date().toISOString(),
         raw_data: {
-          peaks_count: peaks.length,
           signal_length: signal.length,
-          noise_level: noiseLevel,
           method: 'microphone_rms',
         },
       });
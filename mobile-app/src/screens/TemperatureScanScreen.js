@@ -16,7 +16,7 @@ import {
   Animated, Alert, ScrollView
 } from 'react-native';
 import * as Device from 'expo-device';
-import { estimatesAPI, measurementsAPI } from '../utils/api';
+import { estimatesAPI } from '../utils/api';
 
 // Durée cible : 120s idéal, minimum 30s
 const SCAN_DURATION = 120;
@@ -157,13 +157,22 @@ export default function TemperatureScanScreen() {
     const ambientTemp = readings[0];
 
     try {
-      const res = await estimatesAPI.estimateTemperature({
-        battery_temp: batteryTemp,
-        contact_time: elapsed,
-        ambient_temp: ambientTemp,
+      // Estimation + enregistrement en un seul aller-retour
+      const res = await estimatesAPI.session({
+        type: 'temperature',
+        temperature: {
+          battery_temp: batteryTemp,
+          contact_time: elapsed,
+          ambient_temp: ambientTemp,
+        },
+        timestamp: new Date().toISOString(),
+        raw_data: {
+          readings_count: readings.length,
+          method: 'battery_thermistor',
+        },
       });
 
-      const { estimated_temp, confidence, interpretation } = res.data;
+      const { estimated_temp, confidence, interpretation } = res.data.estimate;
 
       setResult({
         estimated_temp,
@@ -174,19 +183,6 @@ export default function TemperatureScanScreen() {
         contact_time: elapsed,
       });
 
-      await measurementsAPI.submit({
-        type: 'temperature',
-        value: estimated_temp,
-        timestamp: new Date().toISOString(),
-        raw_data: {
-          battery_temp: batteryTemp,
-          ambient_temp: ambientTemp,
-          contact_time: elapsed,
-          readings_count: readings.length,
-          method: 'battery_thermistor',
-        },
-      });
-
       setPhase('result');
     } catch (error) {
       Alert.alert('Erreur', 'Estimation impossible. Vérifiez votre connexion.');
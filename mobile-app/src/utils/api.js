@@ -34,7 +34,16 @@ export const measurementsAPI = {
 
 export const estimatesAPI = {
   estimateTemperature: (data) => api.post('/estimate/temperature', data),
+  // Mesure de référence au thermomètre (data + reference_temp, device_id optionnel)
+  calibrateTemperature: (data) => api.post('/estimate/temperature/calibrate', data),
   estimateHRV: (hrSamples) => api.post('/estimate/hrv', { hr_samples: hrSamples }),
+  // Estimation + enregistrement en un seul appel (type: temperature | hrv | respiration)
+  session: (data) => api.post('/estimate/session', data),
+};
+
+export const syncAPI = {
+  upload: (data) => api.post('/sync/upload', data),
+  changes: (cursor, limit = 1000) => api.get('/sync/changes', { params: { cursor, limit } }),
 };
 
 export default api;
@@ -0,0 +1,72 @@
+/**
+ * File d'attente hors-ligne - Synchronisation des mesures
+ *
+ * Chaque mesure reçoit un client_id (UUID) dès sa création et reste dans
+ * AsyncStorage jusqu'à confirmation du serveur. Le serveur déduplique par
+ * client_id : renvoyer un lot après une coupure réseau ne crée aucun doublon.
+ */
+import AsyncStorage from '@react-native-async-storage/async-storage';
+import { syncAPI } from './api';
+
+const QUEUE_KEY = 'biometrics_sync_queue';
+const CURSOR_KEY = 'biometrics_sync_cursor';
+const BATCH_SIZE = 500;
+
+// UUID v4 (suffisant pour l'idempotence, pas d'usage cryptographique)
+export function uuidv4() {
+  return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, (c) => {
+    const r = (Math.random() * 16) | 0;
+    return (c === 'x' ? r : (r & 0x3) | 0x8).toString(16);
+  });
+}
+
+async function readQueue() {
+  const raw = await AsyncStorage.getItem(QUEUE_KEY);
+  return raw ? JSON.parse(raw) : [];
+}
+
+/**
+ * Ajoute une mesure à la file (horodatée maintenant si absent)
+ */
+export async function enqueueMeasurement(measurement) {
+  const queue = await readQueue();
+  queue.push({
+    client_id: uuidv4(),
+    timestamp: new Date().toISOString(),
+    ...measurement,
+  });
+  await AsyncStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+}
+
+/**
+ * Envoie la file par lots. Retourne le nombre de mesures restant en attente
+ * (0 = tout est synchronisé). Lève l'erreur réseau si le premier lot échoue.
+ */
+export async function flushQueue() {
+  let queue = await readQueue();
+  while (queue.length > 0) {
+    const batch = queue.slice(0, BATCH_SIZE);
+    await syncAPI.upload({ measurements: batch });
+    // Retirer seulement le lot confirmé : d'autres mesures ont pu être ajoutées entre-temps
+    const sent = new Set(batch.map((m) => m.client_id));
+    queue = (await readQueue()).filter((m) => !sent.has(m.client_id));
+    await AsyncStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+  }
+  return queue.length;
+}
+
+/**
+ * Récupère les modifications serveur (autres appareils, suppressions) depuis
+ * le dernier curseur. `onChanges` reçoit chaque page { measurements, deleted }.
+ */
+export async function pullChanges(onChanges) {
+  let cursor = await AsyncStorage.getItem(CURSOR_KEY);
+  let hasMore = true;
+  while (hasMore) {
+    const res = await syncAPI.changes(cursor);
+    await onChanges(res.data);
+    cursor = res.data.cursor;
+    hasMore = res.data.has_more;
+    await AsyncStorage.setItem(CURSOR_KEY, cursor);
+  }
+}